@@ -10,11 +10,18 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Archivos generados en ejecución (adjuntos en cola, métricas): fuera del código fuente.
+# En producción se define CONIDI_DATOS_DIR con una carpeta persistente.
+DATOS_DIR = Path(os.environ.get('CONIDI_DATOS_DIR', Path(tempfile.gettempdir()) / 'conidi'))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -46,21 +53,31 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'control.middleware.MetricasPeticionMiddleware',  # Consultas SQL y tiempos por petición (Server-Timing)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'login.middleware.AccesoConidiMiddleware',  # request.conidi_access: rol del usuario (ver visible_to)
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'simple_history.middleware.HistoryRequestMiddleware',
 ]
 
+# Carga el usuario de la sesión junto con su rol y perfiles (login/backends.py).
+# ModelBackend sigue en la lista porque cada sesión guarda la ruta del backend con que se
+# inició: sin él, las sesiones abiertas antes de UsuarioBackend se cerrarían todas.
+AUTHENTICATION_BACKENDS = [
+    'login.backends.UsuarioBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 ROOT_URLCONF = 'conidi.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'control.middleware.DjangoTemplatesConMetricas',  # DjangoTemplates + tiempo de render por petición
         'DIRS': ['templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -147,6 +164,81 @@ EMAIL_HOST_USER = 'cesfamconidi@gmail.com' # <-- CAMBIAR: Tu dirección de corre
 EMAIL_HOST_PASSWORD = 'lxzr fqlx cflg vfjv' # <-- CAMBIAR: La contraseña de aplicación que generaste.
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Envío masivo (control/correo.py): una sola conexión SMTP, mensajes en lotes
+CORREO_LOTE_TAMANO = 50                 # Mensajes por lote
+CORREO_LOTE_PAUSA_SEGUNDOS = 1.0        # Pausa entre lotes (límite de envío del proveedor)
+CORREO_REINTENTOS = 3                   # Reintentos por mensaje antes de darlo por fallido
+CORREO_REINTENTO_ESPERA_SEGUNDOS = 2.0  # Espera base entre reintentos (crece exponencialmente)
+
+# Métricas por petición (control/middleware.py). Cada petición deja una línea JSON en
+# METRICAS_LOG_ARCHIVO; el comando 'reporte_metricas' las agrupa por nombre de URL.
+# Se apagan al correr las pruebas ('manage.py test') o con CONIDI_METRICAS=0.
+METRICAS_HABILITADAS = os.environ.get('CONIDI_METRICAS', '1') != '0' and sys.argv[1:2] != ['test']
+METRICAS_LOG_ARCHIVO = Path(os.environ.get('CONIDI_METRICAS_LOG', DATOS_DIR / 'metricas.log'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'solo_mensaje': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'metricas': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': METRICAS_LOG_ARCHIVO,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'encoding': 'utf-8',
+            'delay': True,  # El archivo se crea recién con la primera petición
+            'formatter': 'solo_mensaje',
+        },
+    },
+    'loggers': {
+        'conidi.metricas': {
+            'handlers': ['metricas'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Historial de cambios: páginas (control/historial.py) y archivo (control/archivo_historial.py)
+HISTORIAL_POR_PAGINA = 25               # Versiones por página en las vistas de historial
+HISTORIAL_RETENCION_DIAS = 730          # 'archivar_historial' archiva versiones más antiguas que esto
+HISTORIAL_ARCHIVO_DB = 'default'        # Base de datos donde se guarda HistorialArchivado
+
+# Importación masiva de niños y tutores (control/importacion.py)
+IMPORTACION_BLOQUE = 5000               # Filas del archivo validadas y guardadas por transacción
+IMPORTACION_ERRORES_EN_PANTALLA = 200   # Errores por fila mostrados tras importar desde la web
+
+# Exportación de datos para análisis (control/exportacion.py)
+EXPORTACION_CHUNK_SIZE = 5000           # Filas leídas por vez desde la BD (y por trozo del CSV descargado)
+EXPORTACION_FILAS_POR_GRUPO = 100000    # Filas por row group del Parquet (máximo en memoria al escribirlo)
+EXPORTACION_PARQUET_MAX_FILAS = 500000  # Máximo de filas del Parquet descargado desde la web (se arma en la petición)
+
+# Listado de niños (control/views.py: listar_ninos)
+NINOS_POR_PAGINA = 50                   # Niños por página por defecto
+NINOS_POR_PAGINA_MAX = 200              # Máximo aceptado en el parámetro ?por_pagina=
+NINOS_CONTEO_MAXIMO = 1000              # Tope del total contado; sobre él se muestra "más de N"
+
+# Bandeja de salida (control/outbox.py): la despacha el proceso 'run_scheduler'
+OUTBOX_MAX_WORKERS = 4                  # Conexiones SMTP simultáneas como máximo
+OUTBOX_LOTE = 200                       # Correos tomados por cada ejecución del despachador
+OUTBOX_MAX_INTENTOS = 5                 # Intentos antes de marcar un correo como FALLIDO
+OUTBOX_REINTENTO_BASE_SEGUNDOS = 60     # Espera base entre intentos (crece exponencialmente)
+OUTBOX_RESERVA_SEGUNDOS = 600           # Tras este tiempo, un envío interrumpido se vuelve a tomar
+OUTBOX_ADJUNTOS_DIR = DATOS_DIR / 'outbox_adjuntos'  # Adjuntos grandes (Excel de reportes) hasta que se envían
+
+# Tareas de recálculo de calendarios (control/tareas.py): las ejecuta el proceso 'run_scheduler'
+TAREAS_RESERVA_MINUTOS = 30             # Una tarea en curso sin avance por este tiempo se da por interrumpida y se retoma
+TAREAS_MAX_INTENTOS = 3                 # Interrupciones toleradas antes de marcar la tarea con ERROR
+
+# Reportes en segundo plano (control/reportes.py)
+REPORTES_MAX_WORKERS = 2                # Reportes generándose a la vez, como máximo, por proceso
+REPORTES_TIEMPO_MAXIMO_MINUTOS = 30     # Un reporte "en curso" más antiguo se da por interrumpido
+REPORTES_CHUNK_SIZE = 2000              # Filas leídas por vez desde la BD al generar el Excel
+REPORTES_FILAS_EN_CORREO = 100          # Filas mostradas en el cuerpo del correo (el resto va en el Excel)
+
 # BORRAR
 # Nombre cuenta -- Cesfam.CONIDI
 # Correo gmail  -- cesfamconidi@gmail.com
@@ -1,7 +1,7 @@
 # control/admin.py
 
 from django.contrib import admin
-from .models import Region, Ciudad, Comuna, Nino, Control, PeriodoControl, Vacuna, VacunaAplicada, CategoriaAlergia, RegistroAlergias, EntregaAlimentos
+from .models import Region, Ciudad, Comuna, Nino, Control, PeriodoControl, Vacuna, VacunaAplicada, CategoriaAlergia, RegistroAlergias, EntregaAlimentos, TareaRecalculo, OutboxEmail
 from simple_history.admin import SimpleHistoryAdmin 
 
 # Para una mejor visualización, registraremos cada modelo.
@@ -53,4 +53,14 @@ admin.site.register(CategoriaAlergia)
 admin.site.register(RegistroAlergias)
 
 admin.site.register(VacunaAplicada)
-admin.site.register(EntregaAlimentos)
\ No newline at end of file
+admin.site.register(EntregaAlimentos)
+@admin.register(TareaRecalculo)
+class TareaRecalculoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'estado', 'progreso', 'intentos', 'filas_actualizadas', 'filas_creadas', 'fecha_creacion', 'fecha_fin')
+    list_filter = ('tipo', 'estado')
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'origen', 'asunto', 'estado', 'intentos', 'proximo_intento', 'fecha_creacion', 'fecha_envio')
+    list_filter = ('estado', 'origen')
+    search_fields = ('asunto', 'ultimo_error')
@@ -0,0 +1,141 @@
+# control/archivo_historial.py
+"""
+Retención de las tablas de historial de simple_history.
+
+'archivar_historial' saca de la tabla de historial las versiones anteriores a una fecha
+de corte y las guarda comprimidas en HistorialArchivado (una fila por objeto y ejecución).
+De cada objeto se conservan siempre la primera versión (la creación) y la última, así las
+vistas de historial siguen mostrando de dónde partió el registro y cómo está hoy; las
+versiones intermedias se recuperan a pedido (control/historial.py las mezcla por página).
+
+El archivo puede vivir en otra base de datos (HISTORIAL_ARCHIVO_DB), que debe tener
+aplicadas las migraciones de 'control'.
+"""
+
+import gzip
+import json
+from itertools import groupby
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from simple_history.models import HistoricalChanges
+
+from .models import HistorialArchivado
+
+TAMANO_BLOQUE = 500
+
+
+def _config(nombre, por_defecto):
+    return getattr(settings, nombre, por_defecto)
+
+
+def _base_archivo():
+    return _config('HISTORIAL_ARCHIVO_DB', 'default')
+
+
+def modelos_historicos():
+    """Modelos de historial (HistoricalControl, HistoricalNino, ...) de la app 'control'."""
+    return [modelo for modelo in apps.get_app_config('control').get_models() if issubclass(modelo, HistoricalChanges)]
+
+
+def _valor_json(valor):
+    # Fechas y horas con precisión completa; Decimal, UUID, etc. como texto.
+    return valor.isoformat() if hasattr(valor, 'isoformat') else str(valor)
+
+
+def serializar_versiones(versiones):
+    campos = versiones[0]._meta.concrete_fields
+    filas = [{campo.attname: campo.value_from_object(version) for campo in campos} for version in versiones]
+    return gzip.compress(json.dumps(filas, default=_valor_json).encode('utf-8'))
+
+
+def deserializar_versiones(modelo, datos):
+    """Reconstruye las versiones (sin guardar) desde el contenido de HistorialArchivado.datos."""
+    campos = {campo.attname: campo for campo in modelo._meta.concrete_fields}
+    filas = json.loads(gzip.decompress(bytes(datos)))
+    versiones = []
+    for fila in filas:
+        version = modelo(**{nombre: campos[nombre].to_python(valor) for nombre, valor in fila.items() if nombre in campos})
+        version.archivada = True
+        versiones.append(version)
+    return versiones
+
+
+def archivar_historial(modelo, corte, simular=False, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Archiva las versiones de 'modelo' (un modelo de historial) anteriores a 'corte' que no
+    sean ni la primera ni la última de su objeto. Trabaja por bloques de objetos, cada uno
+    en su propia transacción. Devuelve (objetos_afectados, versiones_archivadas).
+    """
+    pk = modelo.instance_type._meta.pk.attname
+    base = _base_archivo()
+    historial = modelo._default_manager
+    objeto_ids = list(
+        historial.filter(history_date__lt=corte).order_by(pk).values_list(pk, flat=True).distinct()
+    )
+
+    total_objetos = total_versiones = 0
+    for inicio in range(0, len(objeto_ids), tamano_bloque):
+        bloque = objeto_ids[inicio:inicio + tamano_bloque]
+        filas = historial.filter(**{f'{pk}__in': bloque}, history_date__lt=corte).order_by(pk, 'history_date', 'history_id')
+        # Objetos con versiones posteriores al corte: su última versión no está en 'filas'.
+        con_posteriores = set(
+            historial.filter(**{f'{pk}__in': bloque}, history_date__gte=corte).values_list(pk, flat=True).distinct()
+        )
+
+        archivos = []
+        ids_archivados = []
+        for objeto_id, versiones in groupby(filas, key=lambda version: getattr(version, pk)):
+            versiones = list(versiones)[1:]  # La primera versión se conserva
+            if objeto_id not in con_posteriores:
+                versiones = versiones[:-1]   # y también la última
+            if not versiones:
+                continue
+            archivos.append(HistorialArchivado(
+                modelo=modelo._meta.label_lower,
+                objeto_id=str(objeto_id),
+                fecha_desde=versiones[0].history_date,
+                fecha_hasta=versiones[-1].history_date,
+                versiones=len(versiones),
+                datos=serializar_versiones(versiones),
+            ))
+            ids_archivados.extend(version.history_id for version in versiones)
+
+        total_objetos += len(archivos)
+        total_versiones += len(ids_archivados)
+        if simular or not archivos:
+            continue
+
+        # Si el archivo está en otra base, se confirma allí antes de borrar del historial.
+        with transaction.atomic(using=base), transaction.atomic():
+            HistorialArchivado.objects.using(base).bulk_create(archivos, batch_size=tamano_bloque)
+            for i in range(0, len(ids_archivados), tamano_bloque):
+                historial.filter(history_id__in=ids_archivados[i:i + tamano_bloque]).delete()
+
+    return total_objetos, total_versiones
+
+
+def archivos_de(modelo, objeto_id=None):
+    """Filas de HistorialArchivado de un objeto (o de todos los objetos del modelo si no se indica)."""
+    archivos = HistorialArchivado.objects.using(_base_archivo()).filter(modelo=modelo._meta.label_lower)
+    if objeto_id is not None:
+        archivos = archivos.filter(objeto_id=str(objeto_id))
+    return archivos
+
+
+def hay_versiones_archivadas(modelo, objeto_id=None):
+    return archivos_de(modelo, objeto_id).exists()
+
+
+def asignar_usuarios(versiones):
+    """Trae en una consulta los usuarios de versiones archivadas (deserializar_versiones no los carga)."""
+    usuarios = get_user_model().objects.in_bulk(
+        {version.history_user_id for version in versiones if version.history_user_id is not None}
+    )
+    for version in versiones:
+        if version.history_user_id in usuarios:
+            version.history_user = usuarios[version.history_user_id]
+        else:
+            version.history_user_id = None  # Usuario eliminado: se muestra como 'Sistema'
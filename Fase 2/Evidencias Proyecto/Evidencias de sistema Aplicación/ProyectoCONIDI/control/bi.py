@@ -0,0 +1,172 @@
+# control/bi.py
+"""
+Agregaciones para el Dashboard de Gestión (dashboard_bi).
+
+Todo se calcula con GROUP BY en la base de datos: cada función hace una sola consulta
+agregada y devuelve estructuras listas para serializar a JSON y dibujar con Chart.js.
+"""
+
+from datetime import date
+
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce, ExtractMonth, ExtractYear, Lower, Trim
+
+from .models import Control, ResumenDiarioControles, VacunaAplicada
+
+MESES = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
+
+# Grupos etarios según la edad (en meses) del período del control.
+GRUPOS_ETARIOS = {
+    'lactante': ('0 - 24 meses', 0, 24),
+    'preescolar': ('2 - 5 años', 24, 60),
+    'escolar': ('5 - 9 años', 60, 120),
+}
+
+# Meta ministerial de cobertura de vacunación (%).
+META_COBERTURA = 90
+
+SIN_SECTOR = 'Sin sector'
+
+
+def _porcentaje(parte, total):
+    return round(parte * 100 / total, 1) if total else None
+
+
+def _filtro_sector(prefijo, sector):
+    # Un niño sin sector puede tenerlo en NULL o en '' (el formulario guarda ''): ambos son SIN_SECTOR.
+    if not sector:
+        return Q()
+    if sector == SIN_SECTOR:
+        return Q(**{f'{prefijo}__isnull': True}) | Q(**{prefijo: ''})
+    return Q(**{prefijo: sector})
+
+
+def adherencia_mensual(anios, sector=None, hoy=None):
+    """
+    % de controles realizados sobre los que ya debían hacerse, por mes de la fecha programada.
+    Lee la tabla de resumen ResumenDiarioControles (unas pocas filas por día) en vez de Control.
+    Devuelve {anio: [12 porcentajes o None]} (None = mes sin controles vencidos).
+    """
+    hoy = hoy or date.today()
+    filtros = Q(fecha__year__in=anios, fecha__lte=hoy) & ~Q(estado='DESHABILITADO')
+    filtros &= _filtro_sector('sector', sector)
+    filas = (
+        ResumenDiarioControles.objects.filter(filtros)
+        .annotate(anio=ExtractYear('fecha'), mes=ExtractMonth('fecha'))
+        .values('anio', 'mes')
+        .annotate(total=Sum('cantidad'), realizados=Sum('cantidad', filter=Q(estado='REALIZADO'), default=0))
+        .order_by()
+    )
+    series = {anio: [None] * 12 for anio in anios}
+    for fila in filas:
+        series[fila['anio']][fila['mes'] - 1] = _porcentaje(fila['realizados'], fila['total'])
+    return series
+
+
+def distribucion_nutricional(anios, grupo_etario=None, sector=None):
+    """
+    Distribución (%) de la calificación nutricional de los controles realizados, por año.
+    Devuelve (categorias, {anio: [porcentaje por categoría]}, {anio: total de controles}).
+    """
+    filtros = Q(
+        fecha_realizacion_control__year__in=anios,
+        calificacion_nutricional__isnull=False,
+    ) & ~Q(calificacion_nutricional='') & _filtro_sector('nino__sector', sector)
+    if grupo_etario in GRUPOS_ETARIOS:
+        _, desde, hasta = GRUPOS_ETARIOS[grupo_etario]
+        filtros &= Q(periodo__mes_control__gte=desde, periodo__mes_control__lt=hasta)
+
+    # La calificación es texto libre: se agrupa sin distinguir mayúsculas ni espacios.
+    filas = (
+        Control.objects.filter(filtros)
+        .annotate(anio=ExtractYear('fecha_realizacion_control'), categoria=Lower(Trim('calificacion_nutricional')))
+        .values('anio', 'categoria')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    conteos = {anio: {} for anio in anios}
+    for fila in filas:
+        conteos[fila['anio']][fila['categoria']] = fila['total']
+
+    categorias = sorted({categoria for por_anio in conteos.values() for categoria in por_anio})
+    totales = {anio: sum(por_anio.values()) for anio, por_anio in conteos.items()}
+    series = {
+        anio: [_porcentaje(conteos[anio].get(categoria, 0), totales[anio]) or 0 for categoria in categorias]
+        for anio in anios
+    }
+    return [categoria.capitalize() for categoria in categorias], series, totales
+
+
+def cobertura_vacunacion_por_sector(anio, vacuna_id=None, hoy=None):
+    """
+    % de vacunas aplicadas sobre las ya programadas (vencidas) en el año, por sector del niño.
+    Devuelve una lista de dicts {sector, programadas, aplicadas, cobertura}, de menor a mayor cobertura.
+    """
+    hoy = hoy or date.today()
+    filtros = Q(deshabilitado=False, fecha_programada__year=anio, fecha_programada__lte=hoy)
+    if vacuna_id:
+        filtros &= Q(vacuna_id=vacuna_id)
+    filas = (
+        VacunaAplicada.objects.filter(filtros)
+        .annotate(sector_nino=Coalesce('nino__sector', Value('')))  # NULL y '' en un mismo grupo
+        .values('sector_nino')
+        .annotate(programadas=Count('id'), aplicadas=Count('id', filter=Q(fecha_aplicacion__isnull=False)))
+        .order_by()
+    )
+    resultado = [
+        {
+            'sector': fila['sector_nino'] or SIN_SECTOR,
+            'programadas': fila['programadas'],
+            'aplicadas': fila['aplicadas'],
+            'cobertura': _porcentaje(fila['aplicadas'], fila['programadas']) or 0,
+        }
+        for fila in filas
+    ]
+    resultado.sort(key=lambda fila: fila['cobertura'])
+    return resultado
+
+
+def resumen_adherencia(series, anio, anio_comparacion):
+    """Texto breve comparando la adherencia promedio de ambos años y el mes más bajo del año actual."""
+    def promedio(valores):
+        valores = [v for v in valores if v is not None]
+        return round(sum(valores) / len(valores), 1) if valores else None
+
+    actual, anterior = promedio(series[anio]), promedio(series.get(anio_comparacion, []))
+    if actual is None:
+        return f'No hay controles vencidos en {anio} con los filtros seleccionados.'
+    texto = f'Adherencia promedio {anio}: {actual}%'
+    if anterior is not None:
+        texto += f' ({actual - anterior:+.1f} puntos respecto a {anio_comparacion}, que tuvo {anterior}%)'
+    valores = series[anio]
+    mes_minimo = min((v, i) for i, v in enumerate(valores) if v is not None)[1]
+    return texto + f'. El mes más bajo fue {MESES[mes_minimo]} ({valores[mes_minimo]}%).'
+
+
+def resumen_nutricional(categorias, series, totales):
+    """Texto breve con la categoría más frecuente del último año con datos y su variación."""
+    anios = [anio for anio in sorted(series) if totales[anio]]
+    if not anios:
+        return 'No hay controles con calificación nutricional registrada para los filtros seleccionados.'
+    ultimo = anios[-1]
+    valores = series[ultimo]
+    i = max(range(len(categorias)), key=lambda j: valores[j])
+    texto = f'En {ultimo} la calificación más frecuente fue "{categorias[i]}" ({valores[i]}% de {totales[ultimo]} controles)'
+    if len(anios) > 1:
+        previo = anios[-2]
+        texto += f', {valores[i] - series[previo][i]:+.1f} puntos respecto a {previo}'
+    return texto + '.'
+
+
+def resumen_vacunacion(sectores):
+    """Texto breve señalando los sectores bajo la meta de cobertura."""
+    if not sectores:
+        return 'No hay vacunas programadas vencidas para los filtros seleccionados.'
+    bajo_meta = [fila['sector'] for fila in sectores if fila['cobertura'] < META_COBERTURA]
+    if not bajo_meta:
+        return f'Todos los sectores cumplen la meta de {META_COBERTURA}% de cobertura.'
+    peor = sectores[0]
+    return (
+        f"{len(bajo_meta)} sector(es) bajo la meta de {META_COBERTURA}%: {', '.join(bajo_meta)}. "
+        f"Priorizar {peor['sector']} ({peor['cobertura']}%, {peor['programadas'] - peor['aplicadas']} vacunas pendientes)."
+    )
@@ -0,0 +1,150 @@
+# control/busqueda.py
+
+import re
+from abc import ABC, abstractmethod
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from unidecode import unidecode
+
+# Tabla virtual FTS5 (solo SQLite). La crean las migraciones 0008 y 0014 (rut_nino indexado).
+TABLA_FTS = 'control_nino_fts'
+
+# Expresión indexada con pg_trgm (solo PostgreSQL). Debe coincidir EXACTAMENTE con la
+# del índice GIN 'control_nino_trgm_idx' de la migración 0008 para que el planificador lo use.
+EXPRESION_TRGM = (
+    "(\"control_nino\".\"nombre_norm\" || ' ' || \"control_nino\".\"ap_paterno_norm\" || ' ' || "
+    "COALESCE(\"control_nino\".\"ap_materno_norm\", ''))"
+)
+
+
+def tokenizar(texto):
+    """Normaliza igual que Nino.normalizar_campos (sin acentos, minúsculas) y separa en palabras."""
+    return re.findall(r'\w+', unidecode(texto or '').lower())
+
+
+class BusquedaNinos(ABC):
+    """
+    Interfaz común de los motores de búsqueda de niños por nombre.
+
+    'filtrar' restringe un QuerySet de Nino (ya acotado por rol, p. ej. a los hijos de un
+    tutor) a los niños que coinciden con TODAS las palabras de la consulta (cada palabra
+    puede ser el comienzo de un nombre o apellido) y anota 'relevancia': menor es más
+    relevante. La coincidencia se resuelve en la misma consulta, sin límite de resultados,
+    así que se puede contar y paginar con cursores sobre ('relevancia', 'rut_nino').
+    'indexar' y 'eliminar' mantienen el índice al día en los motores que lo guardan
+    aparte de la tabla de niños.
+    """
+
+    @abstractmethod
+    def filtrar(self, ninos, texto):
+        """Devuelve 'ninos' filtrado por 'texto' y anotado con 'relevancia'."""
+
+    def indexar(self, ninos, nuevos=False):
+        pass
+
+    def eliminar(self, ruts):
+        pass
+
+
+class BusquedaIcontains(BusquedaNinos):
+    """Motor de respaldo para otras bases de datos: LIKE '%palabra%' sobre los campos normalizados."""
+
+    def filtrar(self, ninos, texto):
+        tokens = tokenizar(texto)
+        if not tokens:
+            return ninos.none()
+        for token in tokens:
+            ninos = ninos.filter(
+                Q(nombre_norm__icontains=token) |
+                Q(ap_paterno_norm__icontains=token) |
+                Q(ap_materno_norm__icontains=token)
+            )
+        # Sin puntaje: todas las coincidencias valen lo mismo y el RUT decide el orden.
+        return ninos.annotate(relevancia=Value(0.0, output_field=FloatField()))
+
+
+class BusquedaFTS5(BusquedaNinos):
+    """
+    SQLite: índice invertido FTS5 con prefijos de 2 y 3 letras, ordenado por bm25.
+    Se mantiene sincronizado desde Nino.save() y la señal post_delete; las cargas
+    masivas (bulk_create) deben llamar a indexar() por su cuenta.
+
+    La tabla FTS se une a control_nino por rut_nino: SQLite recorre primero las
+    coincidencias del MATCH y busca cada niño por su clave primaria. rut_nino también
+    está indexado en la tabla FTS (para borrar por RUT sin recorrerla entera), así que
+    las búsquedas por nombre se limitan a las columnas de nombre.
+    """
+
+    COLUMNAS_NOMBRE = '{nombre ap_paterno ap_materno}'
+
+    def filtrar(self, ninos, texto):
+        tokens = tokenizar(texto)
+        if not tokens:
+            return ninos.none()
+        # Cada palabra entre comillas (así no se interpreta como operador) y con * para prefijo.
+        frases = ' AND '.join('"' + token + '"*' for token in tokens)
+        consulta = f'{self.COLUMNAS_NOMBRE} : ({frases})'
+        qn = connection.ops.quote_name
+        tabla_nino = qn(ninos.model._meta.db_table)
+        return ninos.extra(
+            tables=[TABLA_FTS],
+            where=[f'{qn(TABLA_FTS)}.rut_nino = {tabla_nino}.rut_nino', f'{qn(TABLA_FTS)} MATCH %s'],
+            params=[consulta],
+        ).annotate(
+            relevancia=RawSQL(f'bm25({qn(TABLA_FTS)}, 0.0, 2.0, 1.0, 1.0)', [], output_field=FloatField())
+        )
+
+    def indexar(self, ninos, nuevos=False):
+        # 'nuevos': los niños recién creados no tienen entrada que borrar (cargas masivas).
+        ninos = list(ninos)
+        if not ninos:
+            return
+        if not nuevos:
+            self.eliminar([nino.rut_nino for nino in ninos])
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {TABLA_FTS} (rut_nino, nombre, ap_paterno, ap_materno) VALUES (%s, %s, %s, %s)",
+                [(nino.rut_nino, nino.nombre_norm, nino.ap_paterno_norm, nino.ap_materno_norm or '') for nino in ninos],
+            )
+
+    def eliminar(self, ruts):
+        # El MATCH sobre la columna rut_nino encuentra la fila por el índice FTS; la
+        # comparación exacta descarta un RUT que solo compartiera las mismas palabras.
+        filas = [('rut_nino : "' + rut.replace('"', '""') + '"', rut) for rut in ruts]
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s AND rut_nino = %s", filas)
+
+
+class BusquedaTrigramas(BusquedaNinos):
+    """
+    PostgreSQL: similitud por trigramas (pg_trgm) con índice GIN sobre el nombre completo
+    normalizado. Cada palabra debe parecerse a alguna palabra del nombre (operador '<%',
+    que tolera prefijos y errores de tipeo); la relevancia es la suma de word_similarity
+    (con signo negativo, para ordenar de menor a mayor como el resto de los motores).
+    El índice está sobre la propia tabla, así que no hace falta sincronizarlo.
+    """
+
+    def filtrar(self, ninos, texto):
+        tokens = tokenizar(texto)
+        if not tokens:
+            return ninos.none()
+        condiciones = ' AND '.join([f"%s <%% {EXPRESION_TRGM}"] * len(tokens))
+        relevancia = ' + '.join([f"word_similarity(%s, {EXPRESION_TRGM})"] * len(tokens))
+        return ninos.filter(
+            RawSQL(condiciones, tokens, output_field=BooleanField())
+        ).annotate(
+            relevancia=RawSQL(f'-({relevancia})', tokens, output_field=FloatField())
+        )
+
+
+_MOTORES = {
+    'sqlite': BusquedaFTS5,
+    'postgresql': BusquedaTrigramas,
+}
+
+
+def motor_busqueda():
+    """Devuelve el motor de búsqueda que corresponde a la base de datos en uso."""
+    return _MOTORES.get(connection.vendor, BusquedaIcontains)()
@@ -0,0 +1,337 @@
+# control/calendario.py
+
+from collections import Counter
+
+from django.db import connection, transaction
+from django.utils import timezone
+from dateutil.relativedelta import relativedelta
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+
+from .models import Nino, Control, PeriodoControl, Vacuna, VacunaAplicada
+from .resumenes import clave_control, sumar_conteos, sumar_controles_de_ninos
+
+# Tamaño de lote para los INSERT masivos. SQLite limita la cantidad de
+# parámetros por sentencia, así que no conviene subirlo demasiado.
+TAMANO_LOTE = 500
+
+# Cantidad de niños que se procesan a la vez en los recálculos incrementales.
+# Mantiene la memoria acotada aunque el registro tenga cientos de miles de niños.
+TAMANO_BLOQUE_NINOS = 2000
+
+# Filas por executemany en 'generar_calendarios'. Cada fila es una ejecución de la misma
+# sentencia, así que aquí no aplica el límite de parámetros de SQLite.
+TAMANO_LOTE_FILAS = 10000
+
+
+def construir_controles(ninos, periodos, excluir=None):
+    """
+    Construye (sin guardar) los objetos Control de cada niño para cada período.
+    'excluir' es un conjunto de tuplas (nino_id, periodo_id) que no se deben crear,
+    por ejemplo los controles que ya fueron realizados.
+    """
+    excluir = excluir or set()
+    controles = []
+    for nino in ninos:
+        for periodo in periodos:
+            if (nino.pk, periodo.pk) in excluir:
+                continue
+            controles.append(
+                Control(
+                    nino=nino,
+                    periodo=periodo,
+                    nombre_control=periodo.nombre_mes_control,
+                    fecha_control_programada=nino.fecha_nacimiento + relativedelta(months=periodo.mes_control),
+                    estado_control="Pendiente"
+                )
+            )
+    return controles
+
+
+def construir_vacunas(ninos, vacunas, excluir=None):
+    """
+    Construye (sin guardar) los registros VacunaAplicada pendientes de cada niño.
+    'excluir' es un conjunto de tuplas (nino_id, vacuna_id) que no se deben crear.
+    """
+    excluir = excluir or set()
+    vacunas_aplicadas = []
+    for nino in ninos:
+        for vacuna in vacunas:
+            if (nino.pk, vacuna.pk) in excluir:
+                continue
+            vacunas_aplicadas.append(
+                VacunaAplicada(
+                    nino=nino,
+                    vacuna=vacuna,
+                    fecha_programada=nino.fecha_nacimiento + relativedelta(months=vacuna.meses_programada)
+                )
+            )
+    return vacunas_aplicadas
+
+
+def guardar_controles(controles, batch_size=TAMANO_LOTE):
+    """Inserta los controles y su historial con INSERT masivos."""
+    if not controles:
+        return []
+    return bulk_create_with_history(controles, Control, batch_size=batch_size)
+
+
+def guardar_vacunas(vacunas_aplicadas, batch_size=TAMANO_LOTE):
+    """Inserta las vacunas pendientes y su historial con INSERT masivos."""
+    if not vacunas_aplicadas:
+        return []
+    return bulk_create_with_history(vacunas_aplicadas, VacunaAplicada, batch_size=batch_size)
+
+
+def insertar_filas(modelo, campos, filas, batch_size=TAMANO_LOTE_FILAS):
+    """
+    INSERT masivo sin pasar por el ORM: cada tupla de 'filas' trae los valores de 'campos'
+    (ya adaptados a la BD); los demás campos obligatorios toman su valor por defecto y los
+    opcionales quedan en NULL. No devuelve los IDs creados.
+    """
+    qn = connection.ops.quote_name
+    otros = [
+        campo for campo in modelo._meta.concrete_fields
+        if not campo.primary_key and not campo.null and campo.attname not in campos
+    ]
+    columnas = [modelo._meta.get_field(nombre).column for nombre in campos] + [campo.column for campo in otros]
+    por_defecto = tuple(campo.get_db_prep_save(campo.get_default(), connection) for campo in otros)
+    sql = (
+        f"INSERT INTO {qn(modelo._meta.db_table)} ({', '.join(qn(columna) for columna in columnas)}) "
+        f"VALUES ({', '.join(['%s'] * len(columnas))})"
+    )
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(filas), batch_size):
+            cursor.executemany(sql, [fila + por_defecto for fila in filas[inicio:inicio + batch_size]])
+
+
+def registrar_creacion_en_historial(modelo, campo_nino, nino_ids):
+    """
+    Crea la versión inicial ('+') del historial de las filas de esos niños que todavía no
+    la tienen, con un INSERT ... SELECT (el equivalente a bulk_create_with_history).
+    """
+    qn = connection.ops.quote_name
+    historico = modelo.history.model
+    campos = [campo for campo in historico._meta.concrete_fields if not campo.name.startswith('history_')]
+    pk = qn(modelo._meta.pk.column)
+    sql_base = (
+        f"INSERT INTO {qn(historico._meta.db_table)} "
+        f"({', '.join(qn(campo.column) for campo in campos)}, history_date, history_type, history_change_reason, history_user_id) "
+        f"SELECT {', '.join('m.' + qn(modelo._meta.get_field(campo.name).column) for campo in campos)}, %s, '+', NULL, NULL "
+        f"FROM {qn(modelo._meta.db_table)} m "
+        f"WHERE m.{qn(modelo._meta.get_field(campo_nino).column)} IN ({{marcadores}}) "
+        f"AND NOT EXISTS (SELECT 1 FROM {qn(historico._meta.db_table)} h WHERE h.{pk} = m.{pk})"
+    )
+    ahora = connection.ops.adapt_datetimefield_value(timezone.now())
+    nino_ids = list(nino_ids)
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(nino_ids), TAMANO_LOTE):
+            bloque = nino_ids[inicio:inicio + TAMANO_LOTE]
+            cursor.execute(sql_base.format(marcadores=', '.join(['%s'] * len(bloque))), [ahora, *bloque])
+
+
+def generar_calendarios(ninos, batch_size=TAMANO_LOTE_FILAS):
+    """
+    Genera el calendario completo (controles y vacunas) para uno o muchos niños
+    ya guardados en la BD. Todo se hace en una única transacción y con un número
+    de consultas que depende de la cantidad de lotes, no de la cantidad de niños.
+
+    Las filas se insertan con executemany y su historial con INSERT ... SELECT: en cargas
+    masivas (p. ej. 'importar_ninos') construir objetos del ORM por cada control era lo
+    más lento. Las fechas se calculan una vez por (fecha de nacimiento, meses). Como no
+    pasan por las señales de Control, los controles se suman aquí al resumen diario.
+
+    Devuelve una tupla (controles_creados, vacunas_creadas).
+    """
+    ninos = list(ninos)
+    if not ninos:
+        return 0, 0
+
+    # Las reglas se leen una sola vez para todos los niños.
+    periodos = list(PeriodoControl.objects.all())
+    vacunas = list(Vacuna.objects.filter(meses_programada__isnull=False))
+
+    fechas = {}
+
+    def fecha_programada(fecha_nacimiento, meses):
+        clave = (fecha_nacimiento, meses)
+        if clave not in fechas:
+            fechas[clave] = connection.ops.adapt_datefield_value(fecha_nacimiento + relativedelta(months=meses))
+        return fechas[clave]
+
+    controles = [
+        (nino.pk, periodo.pk, periodo.nombre_mes_control,
+         fecha_programada(nino.fecha_nacimiento, periodo.mes_control), "Pendiente")
+        for nino in ninos for periodo in periodos
+    ]
+    vacunas_aplicadas = [
+        (nino.pk, vacuna.pk, fecha_programada(nino.fecha_nacimiento, vacuna.meses_programada))
+        for nino in ninos for vacuna in vacunas
+    ]
+    nino_ids = [nino.pk for nino in ninos]
+
+    with transaction.atomic():
+        insertar_filas(
+            Control, ['nino_id', 'periodo_id', 'nombre_control', 'fecha_control_programada', 'estado_control'],
+            controles, batch_size,
+        )
+        registrar_creacion_en_historial(Control, 'nino', nino_ids)
+        insertar_filas(VacunaAplicada, ['nino_id', 'vacuna_id', 'fecha_programada'], vacunas_aplicadas, batch_size)
+        registrar_creacion_en_historial(VacunaAplicada, 'nino', nino_ids)
+        if controles:
+            sumar_controles_de_ninos(nino_ids)
+
+    return len(controles), len(vacunas_aplicadas)
+
+
+def _bloques_de_ninos(chunk_size):
+    """Recorre los niños en bloques sin cargar toda la tabla en memoria."""
+    bloque = []
+    for nino in Nino.objects.only('rut_nino', 'fecha_nacimiento', 'sector').order_by('pk').iterator(chunk_size=chunk_size):
+        bloque.append(nino)
+        if len(bloque) >= chunk_size:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def recalcular_controles_periodos(periodos, chunk_size=TAMANO_BLOQUE_NINOS, batch_size=TAMANO_LOTE, progreso=None):
+    """
+    Recálculo incremental: solo toca los controles de los períodos indicados.
+
+    - Los controles pendientes (no realizados) cuya fecha o nombre cambió se
+      actualizan en el lugar con bulk_update, conservando su ID, su historial
+      y sus banderas (deshabilitado, notificacion_enviada).
+    - Si a un niño le falta el control de alguno de estos períodos, se crea.
+    - Los controles ya realizados no se modifican.
+    - El resumen diario se ajusta en el mismo bloque: -1 en la fecha anterior de cada
+      control movido, +1 en la nueva y +1 por cada control creado.
+
+    Si se entrega 'progreso', se llama después de cada bloque con
+    (ninos_procesados, controles_actualizados, controles_creados).
+
+    Devuelve una tupla (controles_actualizados, controles_creados).
+    """
+    periodos = {periodo.pk: periodo for periodo in periodos}
+    if not periodos:
+        return 0, 0
+
+    actualizados = 0
+    creados = 0
+    procesados = 0
+    for ninos in _bloques_de_ninos(chunk_size):
+        fechas_nacimiento = {nino.pk: nino.fecha_nacimiento for nino in ninos}
+        sectores = {nino.pk: nino.sector for nino in ninos}
+        cambios_resumen = Counter()
+
+        existentes = set()
+        controles_a_actualizar = []
+        # Se cargan las filas completas: el historial copia todos los campos
+        # y un only() provocaría una consulta extra por cada control actualizado.
+        controles = Control.objects.filter(
+            nino_id__in=fechas_nacimiento.keys(),
+            periodo_id__in=periodos.keys(),
+        )
+
+        for control in controles:
+            existentes.add((control.nino_id, control.periodo_id))
+            if control.fecha_realizacion_control:
+                continue
+            periodo = periodos[control.periodo_id]
+            nueva_fecha = fechas_nacimiento[control.nino_id] + relativedelta(months=periodo.mes_control)
+            if (control.fecha_control_programada != nueva_fecha or
+                    control.nombre_control != periodo.nombre_mes_control):
+                cambios_resumen[clave_control(control, sectores[control.nino_id])] -= 1
+                control.fecha_control_programada = nueva_fecha
+                control.nombre_control = periodo.nombre_mes_control
+                cambios_resumen[clave_control(control, sectores[control.nino_id])] += 1
+                controles_a_actualizar.append(control)
+
+        with transaction.atomic():
+            if controles_a_actualizar:
+                bulk_update_with_history(
+                    controles_a_actualizar, Control,
+                    ['fecha_control_programada', 'nombre_control'],
+                    batch_size=batch_size,
+                    default_change_reason='Recálculo de calendario',
+                )
+            nuevos = guardar_controles(
+                construir_controles(ninos, periodos.values(), excluir=existentes), batch_size
+            )
+            for control in nuevos:
+                cambios_resumen[clave_control(control, sectores[control.nino_id])] += 1
+            sumar_conteos(cambios_resumen)
+
+        actualizados += len(controles_a_actualizar)
+        creados += len(nuevos)
+        procesados += len(ninos)
+        if progreso:
+            progreso(procesados, actualizados, creados)
+
+    return actualizados, creados
+
+
+def recalcular_vacunas(vacunas, chunk_size=TAMANO_BLOQUE_NINOS, batch_size=TAMANO_LOTE, progreso=None):
+    """
+    Recálculo incremental del calendario de vacunación: solo toca las vacunas indicadas.
+
+    - Las dosis pendientes (sin aplicar y no deshabilitadas) cuya fecha programada ya no
+      coincide con Vacuna.meses_programada se actualizan en el lugar con bulk_update,
+      conservando su ID y su historial.
+    - Si a un niño le falta la dosis de alguna de estas vacunas (p. ej. una vacuna
+      recién agregada), se crea.
+    - Las dosis aplicadas o deshabilitadas no se modifican. Las vacunas sin
+      'meses_programada' no tienen calendario y se ignoran.
+
+    Si se entrega 'progreso', se llama después de cada bloque con
+    (ninos_procesados, vacunas_actualizadas, vacunas_creadas).
+
+    Devuelve una tupla (vacunas_actualizadas, vacunas_creadas).
+    """
+    vacunas = {vacuna.pk: vacuna for vacuna in vacunas if vacuna.meses_programada is not None}
+    if not vacunas:
+        return 0, 0
+
+    actualizadas = 0
+    creadas = 0
+    procesados = 0
+    for ninos in _bloques_de_ninos(chunk_size):
+        fechas_nacimiento = {nino.pk: nino.fecha_nacimiento for nino in ninos}
+
+        existentes = set()
+        vacunas_a_actualizar = []
+        aplicadas = VacunaAplicada.objects.filter(
+            nino_id__in=fechas_nacimiento.keys(),
+            vacuna_id__in=vacunas.keys(),
+        )
+
+        for aplicada in aplicadas:
+            existentes.add((aplicada.nino_id, aplicada.vacuna_id))
+            if aplicada.fecha_aplicacion or aplicada.deshabilitado:
+                continue
+            nueva_fecha = fechas_nacimiento[aplicada.nino_id] + relativedelta(
+                months=vacunas[aplicada.vacuna_id].meses_programada
+            )
+            if aplicada.fecha_programada != nueva_fecha:
+                aplicada.fecha_programada = nueva_fecha
+                vacunas_a_actualizar.append(aplicada)
+
+        with transaction.atomic():
+            if vacunas_a_actualizar:
+                bulk_update_with_history(
+                    vacunas_a_actualizar, VacunaAplicada,
+                    ['fecha_programada'],
+                    batch_size=batch_size,
+                    default_change_reason='Recálculo de calendario',
+                )
+            nuevas = guardar_vacunas(
+                construir_vacunas(ninos, vacunas.values(), excluir=existentes), batch_size
+            )
+
+        actualizadas += len(vacunas_a_actualizar)
+        creadas += len(nuevas)
+        procesados += len(ninos)
+        if progreso:
+            progreso(procesados, actualizadas, creadas)
+
+    return actualizadas, creadas
@@ -0,0 +1,104 @@
+# control/configuracion.py
+"""
+Guardado en bloque de las pantallas de configuración (períodos, vacunas, categorías de alergia).
+
+Cada pantalla envía en un solo formulario todas las filas de la tabla. El formulario se
+valida completo en memoria: si algún valor es inválido no se guarda nada. Las filas que
+cambiaron se escriben con un solo bulk_update y su historial con un solo INSERT masivo,
+dentro de una transacción, así el costo no depende de cuántas filas tenga la tabla.
+"""
+
+from django.db import models, transaction
+from django.db.models.functions import Cast, Concat, Left
+from simple_history.utils import bulk_update_with_history
+
+from .calendario import TAMANO_LOTE
+
+
+def texto_obligatorio(valor):
+    valor = valor.strip()
+    if not valor:
+        raise ValueError('no puede quedar vacío')
+    return valor
+
+
+def entero(valor):
+    try:
+        return int(valor)
+    except ValueError:
+        raise ValueError(f'"{valor}" no es un número entero')
+
+
+def entero_opcional(valor):
+    return entero(valor) if valor.strip() else None
+
+
+def leer_formulario(objetos, datos, campos, describir=str):
+    """
+    Aplica sobre 'objetos' (sin guardar) los valores de 'datos' (request.POST).
+
+    'campos' es una lista de (atributo, clave, convertir): la clave del formulario se arma
+    con el ID de la fila (p. ej. 'mes_control_{id}') y 'convertir' transforma el texto al
+    valor del campo o lanza ValueError con el motivo. Las filas que no vienen en el
+    formulario no se tocan.
+
+    Devuelve (objetos_modificados, campos_modificados, errores).
+    """
+    modificados = []
+    campos_modificados = set()
+    errores = []
+    for objeto in objetos:
+        cambios = {}
+        for atributo, clave, convertir in campos:
+            texto = datos.get(clave.format(id=objeto.pk))
+            if texto is None:
+                continue
+            try:
+                valor = convertir(texto)
+            except ValueError as e:
+                errores.append(f'{describir(objeto)}: {e}.')
+                continue
+            if getattr(objeto, atributo) != valor:
+                cambios[atributo] = valor
+        if cambios:
+            for atributo, valor in cambios.items():
+                setattr(objeto, atributo, valor)
+            modificados.append(objeto)
+            campos_modificados.update(cambios)
+    return modificados, sorted(campos_modificados), errores
+
+
+def valores_repetidos(objetos, atributo):
+    """Valores de 'atributo' que quedarían repetidos entre 'objetos' (para campos únicos)."""
+    vistos = set()
+    repetidos = []
+    for objeto in objetos:
+        valor = getattr(objeto, atributo)
+        if valor in vistos and valor not in repetidos:
+            repetidos.append(valor)
+        vistos.add(valor)
+    return repetidos
+
+
+def guardar_en_bloque(modelo, objetos, campos, usuario=None):
+    """Escribe las filas modificadas y su historial en una transacción. Devuelve cuántas guardó."""
+    if not objetos:
+        return 0
+    with transaction.atomic():
+        # Un intercambio de valores únicos (A->B y B->A) choca a mitad del UPDATE: la base
+        # revisa la unicidad fila por fila. Primero se llevan a un valor temporal ('#<pk>',
+        # recortado al largo del campo para que PostgreSQL no lo rechace).
+        unicos = [modelo._meta.get_field(campo) for campo in campos if modelo._meta.get_field(campo).unique]
+        if unicos:
+            temporal = Concat(models.Value('#'), Cast('pk', models.CharField()))
+            modelo.objects.filter(pk__in=[objeto.pk for objeto in objetos]).update(**{
+                campo.name: Left(temporal, campo.max_length) if campo.max_length else temporal
+                for campo in unicos
+            })
+        bulk_update_with_history(
+            objetos, modelo, campos,
+            batch_size=TAMANO_LOTE,
+            default_user=usuario,
+            default_change_reason='Edición de configuración',
+        )
+    return len(objetos)
@@ -0,0 +1,94 @@
+# control/correo.py
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+logger = logging.getLogger(__name__)
+
+
+def _config(nombre, por_defecto):
+    return getattr(settings, nombre, por_defecto)
+
+
+def _abrir(connection):
+    """Abre la conexión; si falla, el siguiente envío lo reintentará."""
+    try:
+        connection.open()
+    except Exception as e:
+        logger.warning(f"No se pudo abrir la conexión de correo: {e}")
+
+
+def enviar_en_lotes(mensajes, tamano_lote=None, pausa_entre_lotes=None, reintentos=None, espera_reintento=None, connection=None):
+    """
+    Envía una lista de EmailMessage reutilizando UNA sola conexión al servidor de correo.
+
+    - Los mensajes se agrupan en lotes de 'tamano_lote'; entre un lote y otro se espera
+      'pausa_entre_lotes' segundos para no superar los límites de envío del proveedor.
+    - Cada lote sale con una sola llamada a send_messages sobre la conexión abierta.
+    - Si el lote falla, la conexión se reabre y sus mensajes se reenvían de a uno, con
+      espera exponencial, hasta 'reintentos' veces por mensaje. El backend no informa
+      cuáles alcanzaron a salir antes del error, así que esos pueden llegar repetidos.
+    - Funciona con cualquier backend de Django (SMTP, locmem, archivo, consola).
+
+    Devuelve una tupla (enviados, fallidos), donde 'fallidos' es una lista de
+    tuplas (mensaje, error).
+    """
+    tamano_lote = tamano_lote or _config('CORREO_LOTE_TAMANO', 50)
+    pausa_entre_lotes = _config('CORREO_LOTE_PAUSA_SEGUNDOS', 1.0) if pausa_entre_lotes is None else pausa_entre_lotes
+    reintentos = _config('CORREO_REINTENTOS', 3) if reintentos is None else reintentos
+    espera_reintento = _config('CORREO_REINTENTO_ESPERA_SEGUNDOS', 2.0) if espera_reintento is None else espera_reintento
+
+    mensajes = list(mensajes)
+    enviados = []
+    fallidos = []
+    if not mensajes:
+        return enviados, fallidos
+
+    connection = connection or get_connection()
+    _abrir(connection)
+    try:
+        for inicio in range(0, len(mensajes), tamano_lote):
+            if inicio and pausa_entre_lotes:
+                time.sleep(pausa_entre_lotes)
+
+            lote = mensajes[inicio:inicio + tamano_lote]
+            try:
+                connection.send_messages(lote)
+                enviados.extend(lote)
+                continue
+            except Exception as e:
+                logger.warning(f"Error al enviar un lote de {len(lote)} correos: {e}. Se reintentan de a uno.")
+                connection.close()
+                _abrir(connection)
+
+            pendientes = list(lote)
+            intento = 0
+            while pendientes:
+                mensaje = pendientes[0]
+                try:
+                    # De a un mensaje para saber exactamente cuáles salieron en el reintento.
+                    connection.send_messages([mensaje])
+                    enviados.append(mensaje)
+                    pendientes.pop(0)
+                    intento = 0
+                except Exception as e:
+                    intento += 1
+                    if intento > reintentos:
+                        logger.error(f"Correo a {', '.join(mensaje.to)} descartado tras {reintentos} reintentos: {e}")
+                        fallidos.append((mensaje, e))
+                        pendientes.pop(0)
+                        intento = 0
+                        continue
+                    espera = espera_reintento * (2 ** (intento - 1))
+                    logger.warning(f"Error al enviar correo a {', '.join(mensaje.to)} (intento {intento}/{reintentos}): {e}. Reintentando en {espera:.0f} s.")
+                    time.sleep(espera)
+                    # La conexión pudo quedar inutilizable: la reabrimos antes de reintentar.
+                    connection.close()
+                    _abrir(connection)
+    finally:
+        connection.close()
+
+    return enviados, fallidos
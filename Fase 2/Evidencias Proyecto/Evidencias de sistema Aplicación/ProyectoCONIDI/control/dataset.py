@@ -0,0 +1,370 @@
+# control/dataset.py
+"""
+Generador de datos sintéticos para pruebas de carga (comando 'generar_dataset').
+
+Crea niños, tutores, sus relaciones, calendarios e historiales clínicos ya simulados,
+con los mismos perfiles de cumplimiento de script_simular_historial.py (cumplidor,
+olvidadizo y caso de riesgo). Todo se calcula por bloques de niños con numpy, como
+matrices niños × períodos y niños × vacunas, y se inserta con executemany (incluido el
+historial, con INSERT ... SELECT), así el tiempo no depende de consultas por niño.
+
+Con la misma semilla, cantidad, tamaño de bloque y fecha de referencia se obtiene el
+mismo dataset. Los RUT salen de una permutación de un rango fijo, así que no se repiten;
+los que ya existen en la BD se saltan.
+"""
+
+import math
+from collections import Counter
+from datetime import date
+
+import numpy as np
+from django.db import connection, transaction
+from django.utils import timezone
+from faker import Faker
+from unidecode import unidecode
+
+from login.models import NinoTutor, Profesional, Tutor
+from .busqueda import motor_busqueda
+from .calendario import TAMANO_LOTE, insertar_filas, registrar_creacion_en_historial
+from .importacion import PESOS_RUT
+from .models import (
+    CategoriaAlergia, Ciudad, Comuna, Control, Nino, PeriodoControl, Region, RegistroAlergias, Vacuna, VacunaAplicada,
+)
+from .resumenes import reconstruir_resumen_controles
+
+# Niños generados y guardados por transacción.
+TAMANO_BLOQUE_DATASET = 10000
+
+# Rangos de RUT (sin dígito verificador) de donde salen niños y tutores.
+RANGO_RUT_NINOS = (20_000_000, 10_000_000)  # (inicio, cantidad)
+RANGO_RUT_TUTORES = (5_000_000, 15_000_000)
+
+TUTORES_POR_NINO = 0.6  # Como script_poblar_entidades.py: 60 tutores cada 100 niños (hermanos comparten tutor)
+SECTORES = ['Sector Azul', 'Sector Verde', 'Sector Rojo', 'Sector Amarillo']
+EDAD_MAXIMA_DIAS = 365 * 12
+EDAD_PROGRAMA_COMPLETADO_MESES = 108
+
+# Perfiles de cumplimiento de script_simular_historial.py. Para controles y vacunas ya
+# vencidos: probabilidad de omitirlos y rango de días de atraso con que se realizan.
+# El olvidadizo, en vez de una probabilidad, omite 2 o 3 de sus controles vencidos.
+PERFILES = [
+    # (nombre, proporción, omitir control, atraso control, omitir vacuna, atraso vacuna)
+    ('cumplidor', 0.70, 0.0, (0, 5), 0.0, (0, 5)),
+    ('olvidadizo', 0.20, None, (5, 20), 0.2, (0, 10)),
+    ('riesgo', 0.10, 0.5, (10, 40), 0.4, (0, 10)),
+]
+CUMPLIDOR, OLVIDADIZO, RIESGO = range(len(PERFILES))
+
+PROPORCION_CON_ALERGIA = 0.20
+AGENTES_ALERGIA = {
+    'Alimentaria': ['Maní', 'Lactosa', 'Huevo', 'Trigo'],
+    'Fármacos': ['Penicilina', 'Ibuprofeno'],
+    'Respiratoria': ['Polvo', 'Polen', 'Ácaros'],
+}
+MECANISMOS_ALERGIA = ['TIPO_I', 'TIPO_IV', 'NO_ESPECIFICADO']
+
+# Cantidad de valores distintos que se piden a Faker para cada campo de texto.
+TAMANO_POOL = 500
+
+
+def digitos_verificadores(cuerpos):
+    """Dígito verificador ('0'-'9' o 'K') de cada cuerpo de RUT (array de enteros)."""
+    digitos = (cuerpos[:, None] // 10 ** np.arange(7, -1, -1)) % 10
+    resto = 11 - (digitos @ PESOS_RUT) % 11
+    return np.where(resto == 11, '0', np.where(resto == 10, 'K', resto.astype(str)))
+
+
+def sumar_meses(fechas, meses):
+    """
+    fechas (datetime64[D], forma (n, 1)) + meses (forma (m,)) -> matriz (n, m), con la regla
+    de relativedelta: si el día no existe en el mes de destino, queda el último día del mes.
+    """
+    mes_origen = fechas.astype('datetime64[M]')
+    dia = fechas - mes_origen.astype('datetime64[D]')
+    mes_destino = mes_origen + np.asarray(meses).astype('timedelta64[M]')
+    inicio = mes_destino.astype('datetime64[D]')
+    largo = (mes_destino + 1).astype('datetime64[D]') - inicio
+    return inicio + np.minimum(dia, largo - np.timedelta64(1, 'D'))
+
+
+def _adaptar_fechas(fechas):
+    """Array datetime64[D] (NaT = NULL) -> valores listos para la BD, adaptando cada fecha distinta una vez."""
+    unicas, inverso = np.unique(fechas, return_inverse=True)
+    adaptadas = np.array(
+        [None if np.isnat(f) else connection.ops.adapt_datefield_value(f.astype(object)) for f in unicas],
+        dtype=object,
+    )
+    return adaptadas[inverso.reshape(fechas.shape)]
+
+
+def _filas(*columnas):
+    """Columnas (arrays de la misma forma) -> lista de tuplas para executemany."""
+    return list(zip(*(np.ravel(columna).tolist() for columna in columnas)))
+
+
+def _nulos(valores, mascara):
+    """Los valores donde 'mascara' es verdadera; None en el resto."""
+    return np.where(mascara, valores, None)
+
+
+class SecuenciaRuts:
+    """
+    RUTs sin repetir: el i-ésimo es inicio + (a·i + c) mod cantidad, una permutación
+    del rango que depende de la semilla. No necesita recordar los ya entregados.
+    """
+
+    def __init__(self, rng, inicio, cantidad):
+        self.inicio = inicio
+        self.cantidad = cantidad
+        self.a = int(rng.integers(cantidad // 3, cantidad))
+        while math.gcd(self.a, cantidad) != 1:
+            self.a += 1
+        self.c = int(rng.integers(cantidad))
+        self.siguiente = 0
+
+    def tomar(self, n):
+        if self.siguiente + n > self.cantidad:
+            raise ValueError('Se agotó el rango de RUT disponibles para el dataset.')
+        indices = np.arange(self.siguiente, self.siguiente + n, dtype=np.int64)
+        self.siguiente += n
+        cuerpos = self.inicio + (self.a * indices + self.c) % self.cantidad
+        return np.char.add(np.char.add(cuerpos.astype(str), '-'), digitos_verificadores(cuerpos))
+
+
+def _ruts_nuevos(secuencia, modelo, n):
+    """Toma de la secuencia 'n' RUT que no existan como PK de 'modelo'."""
+    elegidos = []
+    while len(elegidos) < n:
+        candidatos = secuencia.tomar(n - len(elegidos)).tolist()
+        existentes = set()
+        for inicio in range(0, len(candidatos), TAMANO_LOTE):
+            existentes.update(
+                modelo.objects.filter(pk__in=candidatos[inicio:inicio + TAMANO_LOTE]).values_list('pk', flat=True)
+            )
+        elegidos.extend(rut for rut in candidatos if rut not in existentes)
+    return np.array(elegidos, dtype=object)
+
+
+def _comunas():
+    """IDs de las comunas existentes (crea la de script_poblar_entidades.py si no hay ninguna)."""
+    ids = list(Comuna.objects.values_list('id', flat=True))
+    if not ids:
+        region, _ = Region.objects.get_or_create(nom_region='Biobío')
+        ciudad, _ = Ciudad.objects.get_or_create(nom_ciudad='Concepción', region=region)
+        ids = [Comuna.objects.get_or_create(nom_comuna='Hualpén', ciudad=ciudad)[0].pk]
+    return np.array(ids)
+
+
+class GeneradorDataset:
+    """Genera y guarda el dataset bloque a bloque; 'totales' acumula lo creado por tabla."""
+
+    def __init__(self, semilla, hoy=None):
+        self.rng = np.random.default_rng(semilla)
+        self.hoy = np.datetime64(hoy or date.today(), 'D')
+        self.totales = Counter()
+
+        fake = Faker('es_CL')
+        fake.seed_instance(semilla)
+        self.nombres = {
+            'Masculino': np.array([fake.first_name_male()[:50] for _ in range(TAMANO_POOL)], dtype=object),
+            'Femenino': np.array([fake.first_name_female()[:50] for _ in range(TAMANO_POOL)], dtype=object),
+        }
+        self.apellidos = np.array([fake.last_name()[:30] for _ in range(TAMANO_POOL)], dtype=object)
+        self.direcciones = np.array([fake.address().replace('\n', ', ')[:200] for _ in range(TAMANO_POOL)], dtype=object)
+        self.telefonos = np.array([fake.phone_number()[:15] for _ in range(TAMANO_POOL)], dtype=object)
+        self.observaciones = np.array([fake.sentence(nb_words=8) for _ in range(TAMANO_POOL)], dtype=object)
+        # Los campos _norm de Nino (normalizar_campos) se calculan una vez por valor del pool.
+        self.normalizado = {
+            valor: unidecode(valor).lower()
+            for valores in (*self.nombres.values(), self.apellidos) for valor in valores
+        }
+
+        self.ruts_ninos = SecuenciaRuts(self.rng, *RANGO_RUT_NINOS)
+        self.ruts_tutores = SecuenciaRuts(self.rng, *RANGO_RUT_TUTORES)
+        self.comunas = _comunas()
+        self.periodos = list(PeriodoControl.objects.order_by('mes_control', 'pk'))
+        self.vacunas = list(Vacuna.objects.filter(meses_programada__isnull=False).order_by('pk'))
+        self.categorias = list(CategoriaAlergia.objects.order_by('pk'))
+        profesional = Profesional.objects.order_by('pk').first()
+        self.profesional_id = profesional.pk if profesional else None
+        self.parentescos = np.array([valor for valor, _ in NinoTutor.PARENTESCO_CHOICES], dtype=object)
+
+    def _elegir(self, valores, n):
+        return valores[self.rng.integers(len(valores), size=n)]
+
+    def _atraso(self, perfiles, rangos, forma):
+        """Días de atraso (forma 'forma') según el rango (mín, máx) del perfil de cada niño."""
+        minimo = np.array([rango[0] for rango in rangos])[perfiles][:, None]
+        maximo = np.array([rango[1] for rango in rangos])[perfiles][:, None]
+        return (minimo + np.floor(self.rng.random(forma) * (maximo - minimo + 1))).astype('timedelta64[D]')
+
+    def _realizados(self, perfiles, programadas, prob_omitir, omitir_olvidadizo):
+        """Matriz de controles/vacunas vencidos que sí se realizaron, según el perfil de cada niño."""
+        vencidos = programadas < self.hoy
+        omitidos = self.rng.random(programadas.shape) < np.array(prob_omitir)[perfiles][:, None]
+        if omitir_olvidadizo:
+            # El olvidadizo omite 2 o 3 de sus vencidos: los de menor clave aleatoria.
+            claves = np.where(vencidos, self.rng.random(programadas.shape), np.inf)
+            rangos = claves.argsort(axis=1).argsort(axis=1)
+            cuantos = self.rng.integers(2, 4, size=len(perfiles))[:, None]
+            omitidos |= (perfiles == OLVIDADIZO)[:, None] & (rangos < cuantos)
+        return vencidos & ~omitidos
+
+    def generar_bloque(self, n):
+        rng = self.rng
+        ruts = _ruts_nuevos(self.ruts_ninos, Nino, n)
+        sexos = np.where(rng.random(n) < 0.5, 'Masculino', 'Femenino').astype(object)
+        nombres = np.where(sexos == 'Masculino', self._elegir(self.nombres['Masculino'], n), self._elegir(self.nombres['Femenino'], n))
+        ap_paterno = self._elegir(self.apellidos, n)
+        ap_materno = self._elegir(self.apellidos, n)
+        nacimientos = self.hoy - rng.integers(10, EDAD_MAXIMA_DIAS + 1, size=n).astype('timedelta64[D]')
+        sectores = self._elegir(np.array(SECTORES, dtype=object), n)
+        edad_meses = (self.hoy.astype('datetime64[M]') - nacimientos.astype('datetime64[M]')).astype(int)
+        perfiles = rng.choice(len(PERFILES), size=n, p=[perfil[1] for perfil in PERFILES])
+        normalizar = np.vectorize(self.normalizado.get, otypes=[object])
+        normalizados = normalizar(nombres), normalizar(ap_paterno), normalizar(ap_materno)
+        # Los campos auto_now_add no se completan solos en un INSERT directo.
+        ahora = np.full(n, connection.ops.adapt_datetimefield_value(timezone.now()), dtype=object)
+
+        ninos = _filas(
+            ruts, nombres, ap_paterno, ap_materno, _adaptar_fechas(nacimientos), sexos,
+            self._elegir(self.direcciones, n), self._elegir(self.comunas, n), sectores,
+            np.where(edad_meses > EDAD_PROGRAMA_COMPLETADO_MESES, 'COMPLETADO', 'ACTIVO').astype(object),
+            ahora, *normalizados,
+        )
+
+        # Tutores: cada uno con al menos un niño; el resto de los niños se reparte al azar.
+        t = max(1, round(n * TUTORES_POR_NINO))
+        ruts_tutores = _ruts_nuevos(self.ruts_tutores, Tutor, t)
+        tutor_nombres = self._elegir(np.concatenate([self.nombres['Masculino'], self.nombres['Femenino']]), t)
+        tutor_apellidos = self._elegir(self.apellidos, t)
+        tutores = _filas(
+            ruts_tutores,
+            tutor_nombres + ' ' + tutor_apellidos + ' ' + self._elegir(self.apellidos, t),
+            np.array([
+                f"{unidecode(nombre).lower()}.{unidecode(apellido).lower().replace(' ', '')}.{rut.split('-')[0]}@mailfalso.cl"
+                for nombre, apellido, rut in zip(tutor_nombres, tutor_apellidos, ruts_tutores)
+            ], dtype=object),
+            self._elegir(self.telefonos, t), self._elegir(self.direcciones, t),
+        )
+        asignados = np.concatenate([np.arange(min(t, n)), rng.integers(t, size=max(n - t, 0))])
+        rng.shuffle(asignados)
+        relaciones = _filas(ruts, ruts_tutores[asignados], self._elegir(self.parentescos, n), ahora)
+
+        with transaction.atomic():
+            insertar_filas(Nino, [
+                'rut_nino', 'nombre', 'ap_paterno', 'ap_materno', 'fecha_nacimiento', 'sexo', 'direccion',
+                'comuna_id', 'sector', 'estado_seguimiento', 'fecha_registro', 'nombre_norm', 'ap_paterno_norm', 'ap_materno_norm',
+            ], ninos)
+            registrar_creacion_en_historial(Nino, 'rut_nino', ruts.tolist())
+            insertar_filas(Tutor, ['rut', 'nombre_completo', 'email', 'telefono', 'direccion'], tutores)
+            insertar_filas(NinoTutor, ['nino_id', 'tutor_id', 'parentesco', 'fecha_ini'], relaciones)
+            self._controles(ruts, nacimientos, sectores, perfiles)
+            self._vacunas(ruts, nacimientos, perfiles)
+            self._alergias(ruts, nacimientos)
+            motor_busqueda().indexar((
+                Nino(rut_nino=rut, nombre_norm=nombre, ap_paterno_norm=paterno, ap_materno_norm=materno)
+                for rut, nombre, paterno, materno in zip(ruts, *normalizados)
+            ), nuevos=True)
+
+        self.totales.update(ninos=n, tutores=t, relaciones=n)
+
+    def _controles(self, ruts, nacimientos, sectores, perfiles):
+        if not self.periodos:
+            return
+        meses = np.array([periodo.mes_control for periodo in self.periodos])
+        forma = (len(ruts), len(meses))
+        programadas = sumar_meses(nacimientos[:, None], meses)
+        realizados = self._realizados(perfiles, programadas, [perfil[2] or 0.0 for perfil in PERFILES], True)
+        fechas_realizacion = np.minimum(programadas + self._atraso(perfiles, [perfil[3] for perfil in PERFILES], forma), self.hoy)
+
+        # Crecimiento de get_realistic_growth (script_simular_historial.py), con su misma variación.
+        despues_del_ano = np.maximum(meses - 12, 0)
+        peso = np.where(meses <= 12, 3.5 + meses * 0.7, 11.9 + despues_del_ano * 0.21) + self.rng.uniform(-0.5, 0.5, forma)
+        talla = np.round(np.where(meses <= 12, 50 + meses * 2.5, 80 + despues_del_ano * 0.5) + self.rng.uniform(-1.0, 1.0, forma), 1)
+        pc = np.broadcast_to(np.round(35 + np.minimum(meses, 36) * 0.4, 1), forma)
+        # Caso de riesgo: en invierno, en el Sector Azul, pesa un 10% menos y queda en riesgo de desnutrición.
+        invierno = np.isin(programadas.astype('datetime64[M]').astype(int) % 12 + 1, [6, 7, 8])
+        desnutridos = ((perfiles == RIESGO) & (sectores == 'Sector Azul'))[:, None] & invierno
+        peso = np.round(np.where(desnutridos, np.round(peso, 1) * 0.90, peso), 1)
+        imc = np.round(peso / (talla / 100) ** 2, 2)
+
+        nombres = np.array([periodo.nombre_mes_control for periodo in self.periodos], dtype=object)
+        filas = _filas(
+            np.broadcast_to(ruts[:, None], forma),
+            np.broadcast_to(np.array([periodo.pk for periodo in self.periodos]), forma),
+            np.broadcast_to(nombres, forma),
+            _adaptar_fechas(programadas),
+            _adaptar_fechas(np.where(realizados, fechas_realizacion, np.datetime64('NaT'))),
+            np.where(realizados, 'Realizado', 'Pendiente').astype(object),
+            _nulos(peso, realizados), _nulos(talla, realizados), _nulos(imc, realizados), _nulos(pc, realizados),
+            _nulos(np.where(desnutridos, 'Riesgo Desnutrición', 'Normal'), realizados),
+            _nulos(np.full(forma, 'normal'), realizados & (perfiles == CUMPLIDOR)[:, None]),
+            _nulos(np.full(forma, self.profesional_id, dtype=object), realizados),
+        )
+        insertar_filas(Control, [
+            'nino_id', 'periodo_id', 'nombre_control', 'fecha_control_programada', 'fecha_realizacion_control',
+            'estado_control', 'pesokg', 'talla_cm', 'imc', 'pc_cm', 'calificacion_nutricional',
+            'calificacion_estatural', 'profesional_id',
+        ], filas)
+        registrar_creacion_en_historial(Control, 'nino', ruts.tolist())
+        self.totales.update(controles=len(filas), controles_realizados=int(realizados.sum()))
+
+    def _vacunas(self, ruts, nacimientos, perfiles):
+        if not self.vacunas:
+            return
+        forma = (len(ruts), len(self.vacunas))
+        programadas = sumar_meses(nacimientos[:, None], np.array([vacuna.meses_programada for vacuna in self.vacunas]))
+        aplicadas = self._realizados(perfiles, programadas, [perfil[4] for perfil in PERFILES], False)
+        fechas_aplicacion = np.minimum(programadas + self._atraso(perfiles, [perfil[5] for perfil in PERFILES], forma), self.hoy)
+        cumplidor = aplicadas & (perfiles == CUMPLIDOR)[:, None]
+
+        filas = _filas(
+            np.broadcast_to(ruts[:, None], forma),
+            np.broadcast_to(np.array([vacuna.pk for vacuna in self.vacunas]), forma),
+            _adaptar_fechas(programadas),
+            _adaptar_fechas(np.where(aplicadas, fechas_aplicacion, np.datetime64('NaT'))),
+            _nulos(np.full(forma, 'Dosis según PNI'), cumplidor),
+            _nulos(np.full(forma, 'CESFAM Hualpén'), cumplidor),
+            _nulos(np.full(forma, self.profesional_id, dtype=object), aplicadas),
+        )
+        insertar_filas(VacunaAplicada, [
+            'nino_id', 'vacuna_id', 'fecha_programada', 'fecha_aplicacion', 'dosis', 'lugar', 'profesional_id',
+        ], filas)
+        registrar_creacion_en_historial(VacunaAplicada, 'nino', ruts.tolist())
+        self.totales.update(vacunas=len(filas), vacunas_aplicadas=int(aplicadas.sum()))
+
+    def _alergias(self, ruts, nacimientos):
+        if not self.categorias:
+            return
+        con_alergia = self.rng.random(len(ruts)) < PROPORCION_CON_ALERGIA
+        n = int(con_alergia.sum())
+        categorias = self._elegir(np.array(self.categorias, dtype=object), n)
+        agentes = [str(self.rng.choice(AGENTES_ALERGIA.get(categoria.nombre, ['Desconocido']))) for categoria in categorias]
+        aparicion = np.minimum(nacimientos[con_alergia] + self.rng.integers(30, 701, size=n).astype('timedelta64[D]'), self.hoy)
+        filas = _filas(
+            ruts[con_alergia], np.array([categoria.pk for categoria in categorias]), np.array(agentes, dtype=object),
+            self._elegir(np.array(MECANISMOS_ALERGIA, dtype=object), n), _adaptar_fechas(aparicion),
+            self._elegir(self.observaciones, n),
+        )
+        insertar_filas(RegistroAlergias, [
+            'nino_id', 'categoria_id', 'agente_especifico', 'mecanismo_inmunitario', 'fecha_aparicion', 'observaciones',
+        ], filas)
+        registrar_creacion_en_historial(RegistroAlergias, 'nino', ruts[con_alergia].tolist())
+        self.totales.update(alergias=n)
+
+
+def generar_dataset(ninos, semilla, tamano_bloque=TAMANO_BLOQUE_DATASET, hoy=None, progreso=None):
+    """
+    Genera 'ninos' niños (con tutores, calendarios e historiales) en bloques de 'tamano_bloque',
+    cada uno en su transacción, y al final reconstruye el resumen de controles.
+    'progreso' se llama tras cada bloque con los totales acumulados. Devuelve los totales.
+    """
+    generador = GeneradorDataset(semilla, hoy)
+    for inicio in range(0, ninos, tamano_bloque):
+        generador.generar_bloque(min(tamano_bloque, ninos - inicio))
+        if progreso:
+            progreso(generador.totales)
+    if ninos:
+        generador.totales['filas_resumen'] = reconstruir_resumen_controles()
+    return generador.totales
@@ -0,0 +1,58 @@
+# control/detalle_nino.py
+"""
+Carga de la ficha del niño (vista 'controles', con sus pestañas).
+
+Las listas de la ficha se traen con Prefetch, una consulta por relación y con todo lo
+que usa la plantilla (período, vacuna, categoría y el estado de alerta calculado en la BD).
+El último control realizado sale de esa misma lista, sin otra consulta. Así la cantidad
+de consultas es fija, tenga el niño 3 controles o 300.
+"""
+
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .models import Control, RegistroAlergias, VacunaAplicada
+
+
+def prefetch_detalle_nino(hoy=None):
+    """Prefetch de controles, vacunas y alergias, en el orden en que se muestran."""
+    return [
+        Prefetch(
+            'controles',
+            queryset=Control.objects.select_related('periodo').with_estado_alerta(hoy).order_by('fecha_control_programada'),
+            to_attr='controles_detalle',
+        ),
+        Prefetch(
+            'vacunas_aplicadas',
+            queryset=VacunaAplicada.objects.select_related('vacuna').with_estado_alerta(hoy).order_by('fecha_programada'),
+            to_attr='vacunas_detalle',
+        ),
+        Prefetch(
+            'alergias_registradas',
+            queryset=RegistroAlergias.objects.select_related('categoria').order_by('-fecha_aparicion'),
+            to_attr='alergias_detalle',
+        ),
+    ]
+
+
+def ultimo_control_realizado(controles):
+    """El control habilitado con la fecha de realización más reciente (o None)."""
+    realizados = [
+        control for control in controles
+        if control.fecha_realizacion_control is not None and not control.deshabilitado
+    ]
+    return max(realizados, key=lambda control: control.fecha_realizacion_control, default=None)
+
+
+def cargar_detalle_nino(nino, hoy=None):
+    """
+    Completa 'nino' (ya obtenido) con las listas de la ficha y devuelve el contexto
+    de la plantilla control/nino/controles.html. Hace 3 consultas.
+    """
+    prefetch_related_objects([nino], *prefetch_detalle_nino(hoy))
+    return {
+        'nino': nino,
+        'controles': nino.controles_detalle,
+        'vacunas_aplicadas': nino.vacunas_detalle,
+        'alergias_registradas': nino.alergias_detalle,
+        'ultimo_control': ultimo_control_realizado(nino.controles_detalle),
+    }
@@ -0,0 +1,221 @@
+# control/exportacion.py
+"""
+Exportación de datos clínicos para análisis (comando 'exportar_datos' y descarga del administrador).
+
+Cada exportación es una sola consulta con los JOIN necesarios (values_list, sin instanciar
+modelos) leída con iterator(): la memoria usada no depende de la cantidad de filas.
+  - CSV: se genera en trozos de texto, listos para un StreamingHttpResponse o un archivo.
+  - Parquet (opcional, requiere 'pyarrow'): se escribe por grupos de filas (row groups)
+    con el esquema tomado de los campos del modelo. Como el formato lleva su pie al final,
+    la descarga web lo arma completo en un temporal antes de enviarlo: por eso la vista
+    rechaza las exportaciones de más de EXPORTACION_PARQUET_MAX_FILAS filas, que quedan
+    para el comando (o para el CSV, que sí se envía a medida que se genera).
+
+Con 'desde' la exportación es incremental: solo salen las filas con alguna versión en su
+historial (django-simple-history) con history_date >= desde, es decir, creadas o
+modificadas desde esa fecha. Las filas eliminadas no se informan.
+"""
+
+import csv
+import io
+from datetime import datetime, time
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Control, Nino, RegistroAlergias, VacunaAplicada
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet es opcional
+    pa = pq = None
+
+FORMATOS = ['csv', 'parquet']
+
+# Columnas del niño repetidas en las tablas clínicas, para analizarlas sin otro JOIN.
+COLUMNAS_NINO_RELACIONADO = ['nino__rut_nino', 'nino__sexo', 'nino__fecha_nacimiento', 'nino__comuna__nom_comuna', 'nino__sector']
+
+
+def _config(nombre, por_defecto):
+    return getattr(settings, nombre, por_defecto)
+
+
+class ExportacionNoDisponible(Exception):
+    """El formato pedido necesita una dependencia que no está instalada."""
+
+
+def parquet_disponible():
+    return pq is not None
+
+
+def interpretar_desde(texto):
+    """'AAAA-MM-DD' o 'AAAA-MM-DD HH:MM[:SS]' (hora local) -> datetime con zona. Lanza ValueError."""
+    texto = (texto or '').strip()
+    try:
+        fecha_hora = parse_datetime(texto)
+        if fecha_hora is None:
+            fecha = parse_date(texto)
+            fecha_hora = datetime.combine(fecha, time.min) if fecha else None
+    except ValueError:
+        fecha_hora = None
+    if fecha_hora is None:
+        raise ValueError(f'"{texto}" no es una fecha válida (use AAAA-MM-DD o AAAA-MM-DD HH:MM).')
+    if settings.USE_TZ and timezone.is_naive(fecha_hora):
+        fecha_hora = timezone.make_aware(fecha_hora)
+    return fecha_hora
+
+
+class Exportacion:
+    """Una tabla exportable: el modelo base y las rutas (con '__' para los JOIN) de sus columnas."""
+
+    def __init__(self, modelo, columnas):
+        self.modelo = modelo
+        self.columnas = columnas
+
+    @property
+    def encabezados(self):
+        return [ruta.replace('__', '_') for ruta in self.columnas]
+
+    def queryset(self, desde=None):
+        consulta = self.modelo.objects.all()
+        if desde is not None:
+            pk = self.modelo._meta.pk.attname
+            cambiados = self.modelo.history.filter(history_date__gte=desde).values(pk)
+            consulta = consulta.filter(pk__in=cambiados)
+        # El orden por PK recorre el índice de la tabla base y hace el archivo reproducible.
+        return consulta.order_by('pk').values_list(*self.columnas)
+
+    def supera(self, limite, desde=None):
+        """True si hay más de 'limite' filas; cuenta a lo más limite + 1."""
+        return self.queryset(desde)[:limite + 1].count() > limite
+
+    def filas(self, desde=None):
+        return self.queryset(desde).iterator(chunk_size=_config('EXPORTACION_CHUNK_SIZE', 5000))
+
+    def campo(self, ruta):
+        """El campo del modelo al que llega 'ruta', siguiendo las relaciones."""
+        modelo = self.modelo
+        partes = ruta.split('__')
+        for parte in partes[:-1]:
+            modelo = modelo._meta.get_field(parte).related_model
+        campo = modelo._meta.get_field(partes[-1])
+        # Una FK exportada por su nombre ('periodo') vale lo mismo que su columna ('periodo_id').
+        return campo.target_field if campo.is_relation else campo
+
+
+EXPORTACIONES = {
+    'ninos': Exportacion(Nino, [
+        'rut_nino', 'nombre', 'ap_paterno', 'ap_materno', 'fecha_nacimiento', 'sexo',
+        'comuna', 'comuna__nom_comuna', 'sector', 'estado_seguimiento', 'fecha_registro', 'fecha_fallecimiento',
+    ]),
+    'controles': Exportacion(Control, ['id', *COLUMNAS_NINO_RELACIONADO, *[
+        'nombre_control', 'periodo__mes_control', 'fecha_control_programada', 'fecha_realizacion_control',
+        'estado_control', 'deshabilitado', 'pesokg', 'talla_cm', 'imc', 'pc_cm',
+        'calificacion_nutricional', 'calificacion_estatural', 'indi_antropometricos', 'calificacion_pce', 'dig_pa',
+        'diag_des_integral', 'obs_desarrollo_integral', 'indicaciones', 'observaciones',
+        'derivacion', 'consulta_dental_realizada', 'derivacion_dentista', 'profesional', 'fecha_proximo_control',
+    ]]),
+    'vacunas': Exportacion(VacunaAplicada, ['id', *COLUMNAS_NINO_RELACIONADO, *[
+        'vacuna', 'vacuna__nom_vacuna', 'vacuna__meses_programada', 'fecha_programada', 'fecha_aplicacion',
+        'deshabilitado', 'negacion', 'dosis', 'via', 'lugar', 'fecha_inoculacion', 'profesional',
+    ]]),
+    'alergias': Exportacion(RegistroAlergias, ['id', *COLUMNAS_NINO_RELACIONADO, *[
+        'categoria', 'categoria__nombre', 'agente_especifico', 'mecanismo_inmunitario',
+        'fecha_aparicion', 'fecha_remision', 'observaciones',
+    ]]),
+}
+
+
+# --- CSV ---
+
+
+def trozos_csv(exportacion, desde=None, filas_por_trozo=None):
+    """
+    Genera el CSV (con encabezado) en trozos de texto de 'filas_por_trozo' filas.
+    Entregar un trozo por fila haría el streaming mucho más lento.
+    """
+    filas_por_trozo = filas_por_trozo or _config('EXPORTACION_CHUNK_SIZE', 5000)
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(exportacion.encabezados)
+    pendientes = 0
+    for fila in exportacion.filas(desde):
+        escritor.writerow(fila)
+        pendientes += 1
+        if pendientes >= filas_por_trozo:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pendientes = 0
+    yield buffer.getvalue()
+
+
+def escribir_csv(exportacion, destino, desde=None):
+    """Escribe el CSV en 'destino' (archivo de texto abierto) y devuelve cuántas filas escribió."""
+    total = 0
+    escritor = csv.writer(destino)
+    escritor.writerow(exportacion.encabezados)
+    for fila in exportacion.filas(desde):
+        escritor.writerow(fila)
+        total += 1
+    return total
+
+
+# --- Parquet ---
+
+
+def _tipo_arrow(campo):
+    if isinstance(campo, models.DateTimeField):
+        return pa.timestamp('us', tz='UTC' if settings.USE_TZ else None)
+    if isinstance(campo, models.DateField):
+        return pa.date32()
+    if isinstance(campo, models.BooleanField):
+        return pa.bool_()
+    if isinstance(campo, (models.IntegerField, models.AutoField)):
+        return pa.int64()
+    if isinstance(campo, models.FloatField):
+        return pa.float64()
+    return pa.string()
+
+
+def esquema_parquet(exportacion):
+    if not parquet_disponible():
+        raise ExportacionNoDisponible("La exportación a Parquet requiere instalar 'pyarrow'.")
+    return pa.schema([
+        pa.field(encabezado, _tipo_arrow(exportacion.campo(ruta)))
+        for encabezado, ruta in zip(exportacion.encabezados, exportacion.columnas)
+    ])
+
+
+def escribir_parquet(exportacion, destino, desde=None, filas_por_grupo=None):
+    """
+    Escribe el Parquet en 'destino' (ruta o archivo binario) un grupo de filas a la vez,
+    así en memoria hay como máximo 'filas_por_grupo' filas. Devuelve cuántas filas escribió.
+    """
+    esquema = esquema_parquet(exportacion)
+    filas_por_grupo = filas_por_grupo or _config('EXPORTACION_FILAS_POR_GRUPO', 100000)
+    total = 0
+    with pq.ParquetWriter(destino, esquema, compression='snappy') as escritor:
+        grupo = []
+        for fila in exportacion.filas(desde):
+            grupo.append(fila)
+            if len(grupo) >= filas_por_grupo:
+                escritor.write_table(_tabla_arrow(grupo, esquema))
+                total += len(grupo)
+                grupo = []
+        if grupo or not total:
+            # Un archivo sin filas igual lleva el esquema.
+            escritor.write_table(_tabla_arrow(grupo, esquema))
+            total += len(grupo)
+    return total
+
+
+def _tabla_arrow(filas, esquema):
+    columnas = list(zip(*filas)) if filas else [[] for _ in esquema]
+    return pa.Table.from_arrays(
+        [pa.array(valores, type=campo.type) for valores, campo in zip(columnas, esquema)],
+        schema=esquema,
+    )
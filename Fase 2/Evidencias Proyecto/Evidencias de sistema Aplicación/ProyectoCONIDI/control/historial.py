@@ -0,0 +1,209 @@
+# control/historial.py
+"""
+Páginas de historial (django-simple-history) con los cambios de cada versión ya calculados.
+
+Se lee una página de versiones, de la más reciente a la más antigua, en una sola consulta
+(con su usuario y la fila siguiente, que suele ser la versión anterior de la última).
+Los cambios se calculan en memoria comparando cada versión con la anterior del mismo
+objeto; solo si alguna versión anterior queda fuera de la página se hace una consulta más,
+para todas a la vez. Así el costo no depende de cuántas veces se editó el registro.
+
+Si se piden también las versiones archivadas (control/archivo_historial.py), cada página
+se arma mezclando las filas de la tabla que le tocan con las de los archivos cuyo rango de
+fechas alcanza a la página, con los mismos cursores. Los archivos se descomprimen de a uno
+y solo hasta completar la página, así la memoria no crece con el tamaño del historial.
+"""
+
+from django.conf import settings
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils.dateparse import parse_datetime
+
+from .archivo_historial import asignar_usuarios, deserializar_versiones
+from .paginacion import PaginaKeyset, codificar_cursor, decodificar_cursor, paginar_keyset
+
+# Orden de las versiones; coincide con el de simple_history (Meta.ordering del historial).
+ORDEN_HISTORIAL = ['-history_date', '-history_id']
+
+
+def _versiones_anteriores(historial, faltantes):
+    """
+    Para cada (id del objeto, versión) entrega la versión inmediatamente anterior del mismo
+    objeto, con una sola consulta: la fila más reciente de cada objeto antes de esa fecha.
+    """
+    pk = historial.model.instance_type._meta.pk.attname
+    condicion = Q()
+    for objeto_id, version in faltantes.items():
+        condicion |= Q(**{pk: objeto_id}) & (
+            Q(history_date__lt=version.history_date) |
+            Q(history_date=version.history_date, history_id__lt=version.history_id)
+        )
+    anteriores = (
+        historial.model._default_manager.filter(condicion)
+        .annotate(orden_version=Window(
+            RowNumber(), partition_by=[F(pk)], order_by=[F('history_date').desc(), F('history_id').desc()],
+        ))
+        .filter(orden_version=1)
+    )
+    return {getattr(anterior, pk): anterior for anterior in anteriores}
+
+
+def _clave_version(version):
+    return (version.history_date, version.history_id)
+
+
+def _clave_cursor(cursor):
+    valores = decodificar_cursor(cursor, 2)
+    fecha = parse_datetime(valores[0]) if valores and isinstance(valores[0], str) else None
+    return (fecha, valores[1]) if fecha else None
+
+
+def _cursor_de(version):
+    return codificar_cursor([version.history_date, version.history_id])
+
+
+def _anteriores_por_version(versiones, pk):
+    """
+    En una lista continua de versiones (más reciente primero), la anterior de cada versión es
+    la siguiente de la lista con el mismo objeto. Devuelve {history_id: versión anterior}.
+    """
+    anteriores = {}
+    previa_por_objeto = {}
+    for version in reversed(versiones):
+        objeto_id = getattr(version, pk)
+        if objeto_id in previa_por_objeto:
+            anteriores[version.history_id] = previa_por_objeto[objeto_id]
+        previa_por_objeto[objeto_id] = version
+    return anteriores
+
+
+def pagina_historial(historial, despues=None, antes=None, tamano=None, archivos=None):
+    """
+    Devuelve una PaginaKeyset de 'historial' (p. ej. control.history.all() o
+    PeriodoControl.history.all()) en la que cada versión trae 'cambios_calculados'
+    (delta.changes de diff_against contra su versión anterior, si la tiene).
+    'archivos' (filas de HistorialArchivado, ver archivos_de) suma las versiones archivadas.
+    """
+    tamano = tamano or settings.HISTORIAL_POR_PAGINA
+    if archivos is not None:
+        return _pagina_con_archivadas(historial, archivos, despues, antes, tamano)
+    pk = historial.model.instance_type._meta.pk.attname
+    pagina = paginar_keyset(
+        historial.select_related('history_user'), ORDEN_HISTORIAL, tamano, despues=despues, antes=antes,
+    )
+
+    # La página es un tramo continuo del orden: la versión anterior de cada fila está más
+    # abajo en la página o es la primera fila de la página que sigue (fila_siguiente).
+    versiones = list(pagina)
+    if pagina.fila_siguiente is not None:
+        versiones.append(pagina.fila_siguiente)
+    anteriores = _anteriores_por_version(versiones, pk)
+
+    # Versiones más antiguas de la página sin su anterior a la vista (no aplica a creaciones).
+    faltantes = {}
+    for version in pagina:
+        objeto_id = getattr(version, pk)
+        if version.history_id not in anteriores and version.history_type != '+':
+            faltantes.setdefault(objeto_id, version)
+    if faltantes and pagina.hay_siguiente:
+        for objeto_id, anterior in _versiones_anteriores(historial, faltantes).items():
+            anteriores[faltantes[objeto_id].history_id] = anterior
+
+    _asignar_cambios(pagina, anteriores)
+    return pagina
+
+
+def _pagina_con_archivadas(historial, archivos, despues, antes, tamano):
+    modelo = historial.model
+    pk = modelo.instance_type._meta.pk.attname
+    clave_despues = _clave_cursor(despues)
+    clave_antes = _clave_cursor(antes) if clave_despues is None else None
+    hacia_atras = clave_antes is not None  # 'antes': versiones más recientes que el cursor
+
+    # Se buscan tamano + 1 versiones desde el cursor (la extra dice si hay otra página).
+    # Los archivos se recorren sin 'datos' y en el orden en que pueden aportar versiones:
+    # cuando el siguiente ya no alcanza a la última candidata, no hace falta abrir más.
+    vivas = historial.select_related('history_user')
+    archivos = archivos.defer('datos')
+    por_recorrer = archivos
+    if hacia_atras:
+        fecha, history_id = clave_antes
+        vivas = vivas.filter(Q(history_date__gt=fecha) | Q(history_date=fecha, history_id__gt=history_id))
+        vivas = vivas.order_by('history_date', 'history_id')
+        por_recorrer = por_recorrer.filter(fecha_hasta__gte=fecha).order_by('fecha_desde', 'id')
+    else:
+        vivas = vivas.order_by(*ORDEN_HISTORIAL)
+        if clave_despues is not None:
+            fecha, history_id = clave_despues
+            vivas = vivas.filter(Q(history_date__lt=fecha) | Q(history_date=fecha, history_id__lt=history_id))
+            por_recorrer = por_recorrer.filter(fecha_desde__lte=fecha)
+        por_recorrer = por_recorrer.order_by('-fecha_hasta', '-id')
+
+    def en_rango(version):
+        if hacia_atras:
+            return _clave_version(version) > clave_antes
+        return clave_despues is None or _clave_version(version) < clave_despues
+
+    def sin_aporte(archivo, borde):
+        if hacia_atras:
+            return archivo.fecha_desde > borde.history_date
+        return archivo.fecha_hasta < borde.history_date
+
+    candidatas = list(vivas[:tamano + 1])
+    for archivo in por_recorrer.iterator():
+        if len(candidatas) > tamano and sin_aporte(archivo, candidatas[tamano]):
+            break
+        nuevas = [version for version in deserializar_versiones(modelo, archivo.datos) if en_rango(version)]
+        candidatas = sorted(candidatas + nuevas, key=_clave_version, reverse=not hacia_atras)[:tamano + 1]
+
+    if hacia_atras:
+        objetos = candidatas[:tamano][::-1]
+        hay_anterior, hay_siguiente, fila_siguiente = len(candidatas) > tamano, True, None
+    else:
+        objetos = candidatas[:tamano]
+        hay_anterior, hay_siguiente = clave_despues is not None, len(candidatas) > tamano
+        fila_siguiente = candidatas[tamano] if hay_siguiente else None
+    asignar_usuarios([version for version in objetos if getattr(version, 'archivada', False)])
+    pagina = PaginaKeyset(
+        objetos,
+        cursor_siguiente=_cursor_de(objetos[-1]) if objetos and hay_siguiente else None,
+        cursor_anterior=_cursor_de(objetos[0]) if objetos and hay_anterior else None,
+        fila_siguiente=fila_siguiente,
+    )
+
+    versiones = list(pagina)
+    if fila_siguiente is not None:
+        versiones.append(fila_siguiente)
+    anteriores = _anteriores_por_version(versiones, pk)
+    faltantes = {}
+    for version in pagina:
+        if version.history_id not in anteriores and version.history_type != '+':
+            faltantes.setdefault(getattr(version, pk), version)
+    if faltantes:
+        for objeto_id, anterior in _anteriores_con_archivadas(historial, archivos, faltantes, pk).items():
+            anteriores[faltantes[objeto_id].history_id] = anterior
+    _asignar_cambios(pagina, anteriores)
+    return pagina
+
+
+def _anteriores_con_archivadas(historial, archivos, faltantes, pk):
+    """Como _versiones_anteriores, pero la anterior también puede estar en un archivo del objeto."""
+    anteriores = _versiones_anteriores(historial, faltantes)
+    hasta = max(version.history_date for version in faltantes.values())
+    archivos = archivos.filter(objeto_id__in=[str(objeto_id) for objeto_id in faltantes], fecha_desde__lte=hasta)
+    for archivo in archivos.order_by().iterator():
+        for version in deserializar_versiones(historial.model, archivo.datos):
+            objeto_id = getattr(version, pk)
+            if objeto_id not in faltantes or _clave_version(version) >= _clave_version(faltantes[objeto_id]):
+                continue
+            actual = anteriores.get(objeto_id)
+            if actual is None or _clave_version(version) > _clave_version(actual):
+                anteriores[objeto_id] = version
+    return anteriores
+
+
+def _asignar_cambios(pagina, anteriores):
+    for version in pagina:
+        anterior = anteriores.get(version.history_id)
+        if anterior is not None:
+            version.cambios_calculados = version.diff_against(anterior).changes
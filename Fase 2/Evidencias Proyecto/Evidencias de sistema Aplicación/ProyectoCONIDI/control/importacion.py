@@ -0,0 +1,408 @@
+# control/importacion.py
+"""
+Importación masiva de niños y tutores desde CSV o Excel (comando 'importar_ninos' y
+pantalla de importación del administrador).
+
+El archivo se lee por bloques (IMPORTACION_BLOQUE filas), así la memoria no depende de su
+tamaño. Cada bloque se valida completo en memoria con pandas (RUT, fechas, sexo, comuna,
+largo de los textos, parentesco, emails de tutores) y luego se escribe en una transacción:
+niños y tutores nuevos con INSERT masivos, los existentes con bulk_update, las relaciones
+Niño-Tutor sin duplicar, y los calendarios de los niños nuevos (con su resumen diario) de
+una sola vez con el servicio de calendario. Las filas con errores se informan y no se importan.
+
+Columnas (la primera fila es el encabezado; el orden no importa):
+  rut_nino, nombre, ap_paterno, ap_materno, fecha_nacimiento, sexo, direccion, comuna, sector,
+  rut_tutor, nombre_tutor, email_tutor, telefono_tutor, direccion_tutor, parentesco
+Las columnas de tutor son opcionales; si una fila trae rut_tutor, también debe traer su
+nombre y email. La comuna puede venir por nombre o por ID.
+"""
+
+import csv
+import io
+from datetime import date, datetime
+from zipfile import BadZipFile
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
+from unidecode import unidecode
+
+from login.models import NinoTutor, Tutor
+from .busqueda import motor_busqueda
+from .calendario import TAMANO_LOTE, generar_calendarios
+from .models import Comuna, Nino
+
+COLUMNAS_NINO = ['rut_nino', 'nombre', 'ap_paterno', 'ap_materno', 'fecha_nacimiento', 'sexo', 'direccion', 'comuna', 'sector']
+COLUMNAS_TUTOR = ['rut_tutor', 'nombre_tutor', 'email_tutor', 'telefono_tutor', 'direccion_tutor', 'parentesco']
+COLUMNAS = COLUMNAS_NINO + COLUMNAS_TUTOR
+COLUMNAS_OBLIGATORIAS = ['rut_nino', 'nombre', 'ap_paterno', 'fecha_nacimiento', 'sexo', 'direccion', 'comuna']
+
+# Columna del archivo -> campo del modelo, para revisar largos máximos.
+CAMPOS_NINO = {
+    'nombre': 'nombre', 'ap_paterno': 'ap_paterno', 'ap_materno': 'ap_materno',
+    'direccion': 'direccion', 'sector': 'sector',
+}
+CAMPOS_TUTOR = {
+    'nombre_tutor': 'nombre_completo', 'email_tutor': 'email',
+    'telefono_tutor': 'telefono', 'direccion_tutor': 'direccion',
+}
+
+SEXOS = {'m': 'Masculino', 'masculino': 'Masculino', 'f': 'Femenino', 'femenino': 'Femenino'}
+PARENTESCOS = {unidecode(valor).lower(): valor for valor, _ in NinoTutor.PARENTESCO_CHOICES}
+FORMATOS_FECHA = ['%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y']
+
+# Pesos del dígito verificador para un cuerpo de 8 dígitos, de izquierda a derecha.
+PESOS_RUT = np.array([3, 2, 7, 6, 5, 4, 3, 2])
+
+
+def _config(nombre, por_defecto):
+    return getattr(settings, nombre, por_defecto)
+
+
+class ArchivoInvalido(Exception):
+    """El archivo no se puede leer o le faltan columnas obligatorias."""
+
+
+class ResultadoImportacion:
+    """Conteos de una importación y los errores de cada fila rechazada."""
+
+    def __init__(self):
+        self.filas = 0
+        self.ninos_creados = 0
+        self.ninos_actualizados = 0
+        self.tutores_creados = 0
+        self.tutores_actualizados = 0
+        self.relaciones_creadas = 0
+        self.controles_creados = 0
+        self.vacunas_creadas = 0
+        self.errores = []  # (número de fila, RUT del niño, mensaje)
+
+    @property
+    def filas_importadas(self):
+        return self.filas - len(self.errores)
+
+
+# --- Validación vectorizada ---
+
+def validar_ruts(ruts):
+    """
+    Versión vectorizada de login.views.validar_rut para una Serie de textos.
+    Devuelve (ruts normalizados 'cuerpo-DV', Serie booleana de válidos).
+    """
+    limpios = ruts.str.upper().str.replace(r'[.\-\s]', '', regex=True)
+    formato = limpios.str.fullmatch(r'\d{7,8}[0-9K]')
+    cuerpos = limpios.str[:-1].where(formato, '0').str.zfill(8)
+    if cuerpos.empty:
+        return limpios, formato
+
+    digitos = np.frombuffer(''.join(cuerpos).encode('ascii'), dtype=np.uint8).reshape(-1, 8) - ord('0')
+    resto = 11 - (digitos @ PESOS_RUT) % 11
+    dv_calculado = np.where(resto == 11, '0', np.where(resto == 10, 'K', resto.astype(str)))
+    validos = formato & (limpios.str[-1] == pd.Series(dv_calculado, index=ruts.index))
+    return (limpios.str[:-1] + '-' + limpios.str[-1]).where(formato, limpios), validos
+
+
+def _fechas(textos):
+    """Convierte una Serie de textos a fechas probando los formatos aceptados (NaT si ninguno sirve)."""
+    fechas = pd.Series(pd.NaT, index=textos.index, dtype='datetime64[ns]')
+    for formato in FORMATOS_FECHA:
+        faltantes = fechas.isna()
+        if not faltantes.any():
+            break
+        fechas[faltantes] = pd.to_datetime(textos[faltantes], format=formato, errors='coerce')
+    return fechas
+
+
+def _normalizado(textos):
+    return textos.map(lambda texto: unidecode(texto).lower())
+
+
+def _comunas():
+    """{nombre normalizado o ID en texto: ID de la comuna}."""
+    comunas = {}
+    for comuna_id, nombre in Comuna.objects.values_list('id', 'nom_comuna'):
+        comunas[unidecode(nombre).lower().strip()] = comuna_id
+        comunas[str(comuna_id)] = comuna_id
+    return comunas
+
+
+def validar_bloque(bloque, comunas, ruts_vistos):
+    """
+    Valida un bloque (DataFrame de textos con la columna 'fila') y agrega las columnas
+    convertidas: rut_nino y rut_tutor normalizados, fecha, sexo, comuna_id y parentesco.
+    Devuelve una Serie con la lista de errores de cada fila (vacía si la fila es válida).
+    """
+    errores = pd.Series([[] for _ in range(len(bloque))], index=bloque.index)
+
+    def marcar(mascara, mensaje):
+        for indice in bloque.index[mascara.to_numpy()]:
+            errores[indice].append(mensaje)
+
+    for columna in COLUMNAS_OBLIGATORIAS:
+        marcar(bloque[columna] == '', f"falta '{columna}'")
+
+    bloque['rut_nino'], validos = validar_ruts(bloque['rut_nino'])
+    marcar((bloque['rut_nino'] != '') & ~validos, 'RUT del niño inválido')
+    repetidos = bloque['rut_nino'].duplicated() | bloque['rut_nino'].isin(ruts_vistos)
+    marcar(validos & repetidos, 'RUT del niño repetido en el archivo')
+    ruts_vistos.update(bloque['rut_nino'][validos])
+
+    fechas = _fechas(bloque['fecha_nacimiento'])
+    marcar((bloque['fecha_nacimiento'] != '') & fechas.isna(), 'fecha de nacimiento inválida (use AAAA-MM-DD o DD-MM-AAAA)')
+    marcar(fechas > pd.Timestamp(date.today()), 'fecha de nacimiento futura')
+    bloque['fecha'] = fechas.dt.date
+
+    sexos = _normalizado(bloque['sexo']).map(SEXOS)
+    marcar((bloque['sexo'] != '') & sexos.isna(), "sexo inválido (use 'Masculino' o 'Femenino')")
+    bloque['sexo'] = sexos
+
+    bloque['comuna_id'] = _normalizado(bloque['comuna']).map(comunas)
+    marcar((bloque['comuna'] != '') & bloque['comuna_id'].isna(), 'comuna no encontrada')
+
+    for columna, campo in CAMPOS_NINO.items():
+        largo = Nino._meta.get_field(campo).max_length
+        marcar(bloque[columna].str.len() > largo, f"'{columna}' supera los {largo} caracteres")
+
+    # Tutor (opcional)
+    con_tutor = bloque['rut_tutor'] != ''
+    bloque['rut_tutor'], validos = validar_ruts(bloque['rut_tutor'])
+    marcar(con_tutor & ~validos, 'RUT del tutor inválido')
+    marcar(con_tutor & (bloque['nombre_tutor'] == ''), "falta 'nombre_tutor'")
+    marcar(con_tutor & ~bloque['email_tutor'].str.fullmatch(r'[^@\s]+@[^@\s]+\.[^@\s]+'), "'email_tutor' inválido")
+    for columna, campo in CAMPOS_TUTOR.items():
+        largo = Tutor._meta.get_field(campo).max_length
+        marcar(con_tutor & (bloque[columna].str.len() > largo), f"'{columna}' supera los {largo} caracteres")
+
+    parentescos = _normalizado(bloque['parentesco'])
+    bloque['parentesco'] = parentescos.map(PARENTESCOS).where(parentescos != '', NinoTutor._meta.get_field('parentesco').default)
+    marcar(con_tutor & bloque['parentesco'].isna(), 'parentesco inválido')
+    bloque['rut_tutor'] = bloque['rut_tutor'].where(con_tutor, '')
+
+    return errores
+
+
+# --- Lectura del archivo por bloques ---
+
+def _texto_celda(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return valor.date().isoformat()
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def _encabezado(columnas):
+    columnas = [unidecode(str(columna or '')).strip().lower().replace(' ', '_') for columna in columnas]
+    faltantes = [columna for columna in COLUMNAS_OBLIGATORIAS if columna not in columnas]
+    if faltantes:
+        raise ArchivoInvalido(f"Faltan columnas obligatorias: {', '.join(faltantes)}.")
+    repetidas = sorted({columna for columna in columnas if columna in COLUMNAS and columnas.count(columna) > 1})
+    if repetidas:
+        raise ArchivoInvalido(f"Columnas repetidas: {', '.join(repetidas)}.")
+    return columnas
+
+
+def _preparar(bloque, primera_fila):
+    """Deja solo las columnas conocidas (agregando las opcionales que falten) y numera las filas."""
+    bloque = bloque.loc[:, bloque.columns.isin(COLUMNAS)]
+    bloque = bloque.reindex(columns=COLUMNAS, fill_value='').fillna('').astype(str)
+    bloque = bloque.apply(lambda columna: columna.str.strip())
+    bloque['fila'] = range(primera_fila, primera_fila + len(bloque))
+    return bloque
+
+
+def _bloques_csv(archivo, tamano):
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    try:
+        separador = csv.Sniffer().sniff(texto.readline(), delimiters=',;\t').delimiter
+    except csv.Error:
+        separador = ','
+    texto.seek(0)
+    try:
+        with pd.read_csv(
+            texto, sep=separador, dtype=str, keep_default_na=False, chunksize=tamano, skipinitialspace=True,
+        ) as lector:
+            primera_fila = 2
+            for bloque in lector:
+                bloque.columns = _encabezado(bloque.columns)
+                yield _preparar(bloque, primera_fila)
+                primera_fila += len(bloque)
+    finally:
+        texto.detach()  # El archivo lo cierra quien lo abrió
+
+
+def _bloques_excel(archivo, tamano):
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        columnas = _encabezado(next(filas, []))
+        ancho = len(columnas)
+        primera_fila = 2
+        pendientes = []
+        for numero, fila in enumerate(filas, start=2):
+            if not any(valor is not None for valor in fila):
+                continue
+            if not pendientes:
+                primera_fila = numero
+            pendientes.append([_texto_celda(valor) for valor in fila[:ancho]] + [''] * (ancho - len(fila)))
+            if len(pendientes) >= tamano:
+                yield _preparar(pd.DataFrame(pendientes, columns=columnas), primera_fila)
+                pendientes = []
+        if pendientes:
+            yield _preparar(pd.DataFrame(pendientes, columns=columnas), primera_fila)
+    finally:
+        libro.close()
+
+
+def leer_bloques(archivo, nombre, tamano=None):
+    """Recorre el archivo (abierto en modo binario) en DataFrames de a lo más 'tamano' filas."""
+    tamano = tamano or _config('IMPORTACION_BLOQUE', 5000)
+    if nombre.lower().endswith(('.xlsx', '.xlsm')):
+        return _bloques_excel(archivo, tamano)
+    if nombre.lower().endswith(('.csv', '.txt')):
+        return _bloques_csv(archivo, tamano)
+    raise ArchivoInvalido('Formato no soportado: use un archivo .csv o .xlsx.')
+
+
+# --- Escritura ---
+
+def _tutores_con_email_ajeno(filas):
+    """
+    Índices de filas cuyo email de tutor pertenece a otro RUT. El email es único: lo
+    conserva el tutor que ya lo tiene en la BD o, si es nuevo, el primero del archivo.
+    """
+    emails = filas.loc[filas['rut_tutor'] != '', ['rut_tutor', 'email_tutor']]
+    duenos = dict(Tutor.objects.filter(email__in=emails['email_tutor'].unique().tolist()).values_list('email', 'rut'))
+    for rut, email in emails.drop_duplicates('email_tutor').itertuples(index=False):
+        duenos.setdefault(email, rut)
+    ajenos = filas['email_tutor'].map(duenos) != filas['rut_tutor']
+    return filas.index[(filas['rut_tutor'] != '') & ajenos]
+
+
+def _guardar_ninos(filas, existentes, resultado, errores):
+    nuevos, modificados = [], []
+    for fila in filas.itertuples():
+        datos = {
+            'nombre': fila.nombre, 'ap_paterno': fila.ap_paterno, 'ap_materno': fila.ap_materno or None,
+            'sexo': fila.sexo, 'direccion': fila.direccion, 'comuna_id': int(fila.comuna_id),
+            'sector': fila.sector or None,
+        }
+        nino = existentes.get(fila.rut_nino)
+        if nino is None:
+            nino = Nino(rut_nino=fila.rut_nino, fecha_nacimiento=fila.fecha, **datos)
+            nino.normalizar_campos()
+            nuevos.append(nino)
+        elif nino.fecha_nacimiento != fila.fecha:
+            errores[fila.Index].append('la fecha de nacimiento no coincide con la registrada (corríjala desde la ficha)')
+        elif any(getattr(nino, campo) != valor for campo, valor in datos.items()):
+            for campo, valor in datos.items():
+                setattr(nino, campo, valor)
+            nino.normalizar_campos()
+            modificados.append(nino)
+
+    if nuevos:
+        bulk_create_with_history(nuevos, Nino, batch_size=TAMANO_LOTE, default_change_reason='Importación masiva')
+    if modificados:
+        bulk_update_with_history(
+            modificados, Nino,
+            ['nombre', 'ap_paterno', 'ap_materno', 'sexo', 'direccion', 'comuna', 'sector',
+             'nombre_norm', 'ap_paterno_norm', 'ap_materno_norm'],
+            batch_size=TAMANO_LOTE, default_change_reason='Importación masiva',
+        )
+    resultado.ninos_creados += len(nuevos)
+    resultado.ninos_actualizados += len(modificados)
+    return nuevos, modificados
+
+
+def _guardar_tutores(filas, resultado):
+    tutores = filas[filas['rut_tutor'] != ''].drop_duplicates('rut_tutor', keep='last')
+    existentes = Tutor.objects.in_bulk(tutores['rut_tutor'].tolist())
+    nuevos, modificados = [], []
+    for fila in tutores.itertuples():
+        datos = {
+            'nombre_completo': fila.nombre_tutor, 'email': fila.email_tutor,
+            'telefono': fila.telefono_tutor or None, 'direccion': fila.direccion_tutor or None,
+        }
+        tutor = existentes.get(fila.rut_tutor)
+        if tutor is None:
+            nuevos.append(Tutor(rut=fila.rut_tutor, **datos))
+        elif any(getattr(tutor, campo) != valor for campo, valor in datos.items() if valor is not None):
+            for campo, valor in datos.items():
+                if valor is not None:  # Un dato vacío en el archivo no borra el registrado
+                    setattr(tutor, campo, valor)
+            modificados.append(tutor)
+
+    Tutor.objects.bulk_create(nuevos, batch_size=TAMANO_LOTE)
+    Tutor.objects.bulk_update(modificados, ['nombre_completo', 'email', 'telefono', 'direccion'], batch_size=TAMANO_LOTE)
+    resultado.tutores_creados += len(nuevos)
+    resultado.tutores_actualizados += len(modificados)
+
+
+def _guardar_relaciones(filas, resultado):
+    relaciones = filas[filas['rut_tutor'] != ''].drop_duplicates(['rut_nino', 'rut_tutor'])
+    if relaciones.empty:
+        return
+    ya_existentes = set(
+        NinoTutor.objects.filter(nino_id__in=relaciones['rut_nino'].tolist())
+        .values_list('nino_id', 'tutor_id')
+    )
+    nuevas = [
+        NinoTutor(nino_id=fila.rut_nino, tutor_id=fila.rut_tutor, parentesco=fila.parentesco)
+        for fila in relaciones.itertuples()
+        if (fila.rut_nino, fila.rut_tutor) not in ya_existentes
+    ]
+    NinoTutor.objects.bulk_create(nuevas, batch_size=TAMANO_LOTE)
+    resultado.relaciones_creadas += len(nuevas)
+
+
+def importar_bloque(bloque, comunas, ruts_vistos, resultado, simular=False):
+    """Valida y guarda un bloque del archivo en una transacción."""
+    errores = validar_bloque(bloque, comunas, ruts_vistos)
+    validas = errores.str.len() == 0
+    for indice in _tutores_con_email_ajeno(bloque[validas]):
+        errores[indice].append('el email del tutor ya está registrado para otro RUT')
+    validas = errores.str.len() == 0
+
+    if not simular:
+        filas = bloque[validas]
+        with transaction.atomic():
+            existentes = Nino.objects.in_bulk(filas['rut_nino'].tolist())
+            nuevos, modificados = _guardar_ninos(filas, existentes, resultado, errores)
+            filas = bloque[errores.str.len() == 0]
+            _guardar_tutores(filas, resultado)
+            _guardar_relaciones(filas, resultado)
+
+            controles, vacunas = generar_calendarios(nuevos)
+            resultado.controles_creados += controles
+            resultado.vacunas_creadas += vacunas
+            motor_busqueda().indexar(nuevos, nuevos=True)
+            motor_busqueda().indexar(modificados)
+
+    resultado.filas += len(bloque)
+    for fila in bloque[errores.str.len() > 0].itertuples():
+        resultado.errores.append((fila.fila, fila.rut_nino, '; '.join(errores[fila.Index]) + '.'))
+
+
+def importar_ninos(archivo, nombre, tamano_bloque=None, simular=False, progreso=None):
+    """
+    Importa el archivo (abierto en modo binario; 'nombre' indica el formato por su extensión).
+    Con 'simular' solo valida. 'progreso' se llama tras cada bloque con el resultado parcial.
+    Devuelve un ResultadoImportacion. Lanza ArchivoInvalido si el archivo no se puede leer.
+    """
+    resultado = ResultadoImportacion()
+    comunas = _comunas()
+    ruts_vistos = set()
+    try:
+        for bloque in leer_bloques(archivo, nombre, tamano_bloque):
+            importar_bloque(bloque, comunas, ruts_vistos, resultado, simular)
+            if progreso:
+                progreso(resultado)
+    except (UnicodeDecodeError, pd.errors.ParserError, pd.errors.EmptyDataError, BadZipFile, InvalidFileException) as e:
+        raise ArchivoInvalido(f'No se pudo leer el archivo: {e}') from e
+    return resultado
@@ -0,0 +1,52 @@
+# control/management/commands/archivar_historial.py
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from control.archivo_historial import archivar_historial, modelos_historicos
+
+
+class Command(BaseCommand):
+    help = (
+        'Mueve las versiones de historial más antiguas que el horizonte de retención a '
+        'HistorialArchivado (comprimidas), conservando la primera y la última versión de '
+        'cada objeto. Las vistas de historial pueden mostrarlas a pedido.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int, default=getattr(settings, 'HISTORIAL_RETENCION_DIAS', 730),
+            help='Se archivan las versiones con más de estos días (por defecto: HISTORIAL_RETENCION_DIAS).'
+        )
+        parser.add_argument(
+            '--modelo', nargs='+',
+            help="Modelos a archivar, p. ej. 'control' o 'vacunaaplicada' (por defecto: todos)."
+        )
+        parser.add_argument(
+            '--simular', action='store_true',
+            help='Solo informa cuántas versiones se archivarían, sin modificar nada.'
+        )
+
+    def handle(self, *args, **options):
+        if options['dias'] < 1:
+            raise CommandError('--dias debe ser mayor que cero.')
+        corte = timezone.now() - timedelta(days=options['dias'])
+
+        modelos = modelos_historicos()
+        if options['modelo']:
+            pedidos = {nombre.lower() for nombre in options['modelo']}
+            modelos = [m for m in modelos if m.instance_type._meta.model_name in pedidos]
+            if not modelos:
+                raise CommandError(f"Ningún modelo con historial coincide con: {', '.join(sorted(pedidos))}.")
+
+        accion = 'Se archivarían' if options['simular'] else 'Archivadas'
+        self.stdout.write(f"Archivando versiones anteriores al {corte:%d/%m/%Y %H:%M}...")
+        total = 0
+        for modelo in modelos:
+            objetos, versiones = archivar_historial(modelo, corte, simular=options['simular'])
+            total += versiones
+            self.stdout.write(f"  {modelo.instance_type.__name__}: {accion.lower()} {versiones} versión(es) de {objetos} objeto(s).")
+        self.stdout.write(self.style.SUCCESS(f'{accion} {total} versión(es) en total.'))
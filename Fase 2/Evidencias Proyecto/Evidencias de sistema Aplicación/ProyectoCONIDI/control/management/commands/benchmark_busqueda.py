@@ -0,0 +1,98 @@
+# control/management/commands/benchmark_busqueda.py
+
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from control.models import Region, Ciudad, Comuna, Nino
+from control.busqueda import BusquedaIcontains, motor_busqueda
+
+NOMBRES = [
+    'Sofía', 'Agustina', 'Isidora', 'Emilia', 'Florencia', 'Martina', 'Josefa', 'Catalina',
+    'Mateo', 'Agustín', 'Benjamín', 'Vicente', 'Tomás', 'Joaquín', 'Maximiliano', 'Lucas',
+]
+APELLIDOS = [
+    'González', 'Muñoz', 'Rojas', 'Díaz', 'Pérez', 'Soto', 'Contreras', 'Silva', 'Martínez',
+    'Sepúlveda', 'Morales', 'Rodríguez', 'López', 'Fuentes', 'Hernández', 'Torres', 'Araya',
+    'Flores', 'Espinoza', 'Valenzuela', 'Castillo', 'Tapia', 'Reyes', 'Gutiérrez', 'Castro',
+]
+CONSULTAS = ['perez gonz', 'sofia', 'mu', 'valenzuela tapia', 'agus reyes', 'hernandez']
+
+
+class _Rollback(Exception):
+    """Se lanza al final de cada medición para deshacer los datos de prueba."""
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara la búsqueda de niños por nombre con LIKE (icontains) y con el motor de '
+        'búsqueda de la base de datos en uso. Los datos de prueba se revierten al final.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ninos', type=int, nargs='+', default=[100000],
+            help='Cantidades de niños a medir (por defecto: 100000).'
+        )
+        parser.add_argument(
+            '--repeticiones', type=int, default=5,
+            help='Veces que se ejecuta cada consulta para promediar (por defecto: 5).'
+        )
+
+    def handle(self, *args, **options):
+        for cantidad in options['ninos']:
+            try:
+                with transaction.atomic():
+                    self._medir(cantidad, options['repeticiones'])
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+    def _crear_ninos(self, cantidad):
+        region = Region.objects.create(nom_region='Benchmark')
+        ciudad = Ciudad.objects.create(nom_ciudad='Benchmark', region=region)
+        comuna = Comuna.objects.create(nom_comuna='Benchmark', ciudad=ciudad)
+
+        azar = random.Random(cantidad)
+        hoy = date.today()
+        ninos = []
+        for i in range(cantidad):
+            nino = Nino(
+                rut_nino=f'B{i:08d}',
+                nombre=azar.choice(NOMBRES),
+                ap_paterno=azar.choice(APELLIDOS),
+                ap_materno=azar.choice(APELLIDOS),
+                fecha_nacimiento=hoy - timedelta(days=i % (365 * 9)),
+                sexo='Femenino',
+                direccion='Sin dirección',
+                comuna=comuna,
+            )
+            nino.normalizar_campos()
+            ninos.append(nino)
+        Nino.objects.bulk_create(ninos, batch_size=500)
+        # bulk_create no pasa por save(): se indexan a mano, como en las cargas masivas.
+        motor_busqueda().indexar(ninos)
+
+    def _medir(self, cantidad, repeticiones):
+        self._crear_ninos(cantidad)
+        motor = motor_busqueda()
+        por_pagina = 50
+
+        self.stdout.write(self.style.SUCCESS(f'{cantidad} niños (motor: {type(motor).__name__}):'))
+        for texto in CONSULTAS:
+            tiempos = {}
+            for nombre, buscador in (('icontains', BusquedaIcontains()), ('motor', motor)):
+                inicio = time.perf_counter()
+                for _ in range(repeticiones):
+                    # Lo que hace el listado: contar las coincidencias y leer la primera página.
+                    coincidencias = buscador.filtrar(Nino.objects.all(), texto)
+                    total = coincidencias.count()
+                    list(coincidencias.order_by('relevancia', 'rut_nino')[:por_pagina])
+                tiempos[nombre] = (time.perf_counter() - inicio) / repeticiones * 1000
+            self.stdout.write(
+                f'  "{texto}": icontains {tiempos["icontains"]:.1f} ms | '
+                f'motor {tiempos["motor"]:.1f} ms ({total} resultados)'
+            )
@@ -0,0 +1,76 @@
+# control/management/commands/benchmark_calendarios.py
+
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from control.models import Region, Ciudad, Comuna, Nino
+from control.calendario import generar_calendarios
+
+
+class _Rollback(Exception):
+    """Se lanza al final de cada medición para deshacer los datos de prueba."""
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el costo por niño de generar calendarios en bloque. '
+        'Los datos de prueba se crean dentro de una transacción que se revierte al final.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ninos', type=int, nargs='+', default=[1000, 100000],
+            help='Cantidades de niños a medir (por defecto: 1000 100000).'
+        )
+
+    def handle(self, *args, **options):
+        for cantidad in options['ninos']:
+            try:
+                with transaction.atomic():
+                    self._medir(cantidad)
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+    def _medir(self, cantidad):
+        region = Region.objects.create(nom_region='Benchmark')
+        ciudad = Ciudad.objects.create(nom_ciudad='Benchmark', region=region)
+        comuna = Comuna.objects.create(nom_comuna='Benchmark', ciudad=ciudad)
+
+        hoy = date.today()
+        ninos = []
+        for i in range(cantidad):
+            nino = Nino(
+                rut_nino=f'B{i:08d}',
+                nombre='Niño',
+                ap_paterno='Benchmark',
+                fecha_nacimiento=hoy - timedelta(days=i % (365 * 9)),
+                sexo='Femenino',
+                direccion='Sin dirección',
+                comuna=comuna,
+            )
+            nino.normalizar_campos()
+            ninos.append(nino)
+        Nino.objects.bulk_create(ninos, batch_size=500)
+
+        consultas = 0
+
+        def contar_consultas(execute, sql, params, many, context):
+            nonlocal consultas
+            consultas += 1
+            return execute(sql, params, many, context)
+
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(contar_consultas):
+            controles, vacunas = generar_calendarios(ninos)
+        duracion = time.perf_counter() - inicio
+
+        filas = controles + vacunas
+        self.stdout.write(self.style.SUCCESS(f'{cantidad} niños:'))
+        self.stdout.write(f'  Filas insertadas: {filas} ({controles} controles, {vacunas} vacunas, más su historial)')
+        self.stdout.write(f'  Consultas SQL: {consultas}')
+        self.stdout.write(f'  Tiempo total: {duracion:.2f} s')
+        self.stdout.write(f'  Costo por niño: {duracion / cantidad * 1000:.3f} ms')
@@ -1,58 +1,95 @@
 # control/management/commands/enviar_alertas_controles.py
 
+import time
+
 from django.core.management.base import BaseCommand
 from django.core.mail import EmailMultiAlternatives # Changed from send_mail
 from django.template.loader import render_to_string # New import
 from django.conf import settings
-from django.utils import timezone
-from datetime import date, timedelta
+from django.db import connection, transaction
+from django.db.models import Prefetch
+from datetime import date
 from collections import defaultdict # New import for grouping
 
 from control.models import Control
-from login.models import NinoTutor, Tutor # Added Tutor import
+from control.outbox import encolar_correos
+from login.models import NinoTutor
+
+# Tamaño de los bloques de IDs en el UPDATE final (límite de parámetros de SQLite).
+TAMANO_BLOQUE_UPDATE = 500
+
+# Controles leídos por vez; acota también el IN (...) de la precarga de tutores.
+TAMANO_BLOQUE_CONSULTA = 500
+
+
+def controles_por_notificar(hoy):
+    """Controles atrasados cuyos tutores aún no fueron notificados (usa 'control_sin_notificar_idx')."""
+    return Control.objects.pendientes().filter(notificacion_enviada=False, fecha_control_programada__lt=hoy)
 
 
 class Command(BaseCommand):
     help = 'Envía notificaciones por correo a los tutores sobre controles que han pasado a estado atrasado.'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--benchmark', action='store_true',
+            help='Muestra al final la cantidad de consultas SQL ejecutadas y el tiempo total.'
+        )
+
     def handle(self, *args, **options):
+        if not options['benchmark']:
+            self._enviar_alertas()
+            return
+
+        consultas = 0
+
+        def contar_consultas(execute, sql, params, many, context):
+            nonlocal consultas
+            consultas += 1
+            return execute(sql, params, many, context)
+
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(contar_consultas):
+            self._enviar_alertas()
+        duracion = time.perf_counter() - inicio
+
+        self.stdout.write(self.style.NOTICE(f'[benchmark] Consultas SQL: {consultas}'))
+        self.stdout.write(self.style.NOTICE(f'[benchmark] Tiempo total: {duracion:.2f} s'))
+
+    def _enviar_alertas(self):
         self.stdout.write(self.style.NOTICE('Iniciando la tarea de envío de alertas de controles...'))
 
         hoy = date.today()
 
-        # 1. Identificar todos los controles atrasados que aún no han sido notificados
-        # y que tienen un niño asociado.
-        # Filtramos por controles que están atrasados (fecha programada < hoy)
-        # y que no han sido deshabilitados.
-        # También nos aseguramos de que el control no haya sido realizado y que la notificación no se haya enviado.
-        controles_atrasados_pendientes_notificar = Control.objects.filter(
-            fecha_realizacion_control__isnull=True,
-            deshabilitado=False,
-            notificacion_enviada=False,
-            fecha_control_programada__lt=hoy
-).select_related('nino', 'periodo').order_by('nino__ap_paterno', 'nino__nombre', 'fecha_control_programada')
-
-        if not controles_atrasados_pendientes_notificar.exists():
-            self.stdout.write(self.style.SUCCESS('No hay nuevos controles atrasados para notificar hoy.'))
-            return
-
-        self.stdout.write(f'Se encontraron {controles_atrasados_pendientes_notificar.count()} controles atrasados que requieren notificación.')
+        # 1. Identificar todos los controles atrasados que aún no han sido notificados,
+        # junto con sus niños y los tutores de cada niño. Se leen en bloques de
+        # TAMANO_BLOQUE_CONSULTA: por cada bloque, una consulta para controles+niños y dos
+        # para las relaciones niño-tutor y los tutores, con un IN (...) de tamaño acotado.
+        controles_atrasados_pendientes_notificar = (
+            controles_por_notificar(hoy)
+            .select_related('nino')
+            .prefetch_related(Prefetch('nino__ninotutor_set', queryset=NinoTutor.objects.select_related('tutor')))
+            .order_by('nino__ap_paterno', 'nino__nombre', 'fecha_control_programada')
+            .iterator(chunk_size=TAMANO_BLOQUE_CONSULTA)
+        )
 
         # Diccionario para agrupar los controles por tutor
         # {tutor_email: {'tutor_obj': Tutor, 'children_data': {nino_rut: {'nino_obj': Nino, 'controles': [Control, ...]}}}}
         tutors_to_notify = defaultdict(lambda: {'tutor_obj': None, 'children_data': defaultdict(lambda: {'nino_obj': None, 'controles': []})})
-        
-        all_notified_control_ids = [] # Para marcar todos los controles como notificados al final
 
-        # 2. Agrupar los controles atrasados por tutor
+        ninos_sin_tutor_avisados = set()
+        total_controles = 0
+
+        # 2. Agrupar los controles atrasados por tutor (en memoria, sin consultas extra)
         for control in controles_atrasados_pendientes_notificar:
+            total_controles += 1
             nino = control.nino
-            
-            # Obtener todos los tutores asociados a este niño
-            relaciones_nino_tutor = NinoTutor.objects.filter(nino=nino).select_related('tutor')
+            relaciones_nino_tutor = nino.ninotutor_set.all() # Ya viene precargado
 
-            if not relaciones_nino_tutor.exists():
-                self.stdout.write(self.style.WARNING(f'El niño {nino.nombre_completo} (RUT: {nino.rut_nino}) no tiene tutores asignados. No se puede notificar sobre su control "{control.nombre_control}".'))
+            if not relaciones_nino_tutor:
+                if nino.rut_nino not in ninos_sin_tutor_avisados:
+                    ninos_sin_tutor_avisados.add(nino.rut_nino)
+                    self.stdout.write(self.style.WARNING(f'El niño {nino} (RUT: {nino.rut_nino}) no tiene tutores asignados. No se puede notificar sobre sus controles atrasados.'))
                 continue
 
             for relacion in relaciones_nino_tutor:
@@ -61,15 +98,21 @@ class Command(BaseCommand):
                     tutors_to_notify[tutor.email]['tutor_obj'] = tutor
                     tutors_to_notify[tutor.email]['children_data'][nino.rut_nino]['nino_obj'] = nino
                     tutors_to_notify[tutor.email]['children_data'][nino.rut_nino]['controles'].append(control)
-                    all_notified_control_ids.append(control.id)
                 else:
-                    self.stdout.write(self.style.WARNING(f'El tutor {tutor.nombre_completo if tutor else "N/A"} (RUT: {tutor.rut if tutor else "N/A"}) asociado a {nino.nombre_completo} no tiene email o no existe. No se puede notificar.'))
+                    self.stdout.write(self.style.WARNING(f'El tutor {tutor.nombre_completo if tutor else "N/A"} (RUT: {tutor.rut if tutor else "N/A"}) asociado a {nino} no tiene email o no existe. No se puede notificar.'))
+
+        if not total_controles:
+            self.stdout.write(self.style.SUCCESS('No hay nuevos controles atrasados para notificar hoy.'))
+            return
+
+        self.stdout.write(f'Se encontraron {total_controles} controles atrasados que requieren notificación.')
 
-        # 3. Enviar un correo consolidado a cada tutor
+        # 3. Construir un correo consolidado para cada tutor
+        controles_por_mensaje = {} # {EmailMultiAlternatives: [control_id, ...]}
         for tutor_email, data in tutors_to_notify.items():
             tutor = data['tutor_obj']
             children_data = data['children_data'] # This is a defaultdict, convert to list of dicts for template
-            
+
             # Convertir children_data a un formato más amigable para la plantilla
             children_for_template = []
             for nino_rut, nino_info in children_data.items():
@@ -77,12 +120,12 @@ class Command(BaseCommand):
                     'nino_obj': nino_info['nino_obj'],
                     'controles': sorted(nino_info['controles'], key=lambda c: c.fecha_control_programada)
                 })
-            
+
             # Ordenar los niños por apellido paterno para el email
             children_for_template.sort(key=lambda x: x['nino_obj'].ap_paterno)
 
             asunto = f'Alerta Importante: Controles de Salud Atrasados de sus Hijos/as'
-            
+
             # Renderizar el cuerpo del correo desde una plantilla HTML
             mensaje_html = render_to_string('control/reportes_mail/email_alerta_controles_consolidados.html', {
                 'tutor_nombre': tutor.nombre_completo,
@@ -98,18 +141,25 @@ class Command(BaseCommand):
                 to=[tutor_email]
             )
             email.attach_alternative(mensaje_html, "text/html")
+            controles_por_mensaje[email] = [
+                control.id for nino_info in children_for_template for control in nino_info['controles']
+            ]
+
+        # 4. Dejar los correos en la bandeja de salida. El despachador de 'run_scheduler'
+        # los envía en lotes, con reintentos, así que una vez encolados no se pierden.
+        # En la misma transacción se marcan como notificados los controles incluidos en algún
+        # correo. El set elimina duplicados si un control fue asociado a múltiples tutores.
+        notified_control_ids = sorted(
+            {control_id for control_ids in controles_por_mensaje.values() for control_id in control_ids}
+        )
+        with transaction.atomic():
+            encolar_correos(controles_por_mensaje.keys(), origen='ALERTA_CONTROLES')
+            for i in range(0, len(notified_control_ids), TAMANO_BLOQUE_UPDATE):
+                Control.objects.filter(id__in=notified_control_ids[i:i + TAMANO_BLOQUE_UPDATE]).update(notificacion_enviada=True)
+
+        self.stdout.write(self.style.SUCCESS(f'Se encolaron {len(controles_por_mensaje)} correos consolidados para su envío.'))
+        if notified_control_ids:
+            self.stdout.write(self.style.NOTICE(f'Se marcaron {len(notified_control_ids)} controles como notificados.'))
 
-            try:
-                email.send()
-                self.stdout.write(self.style.SUCCESS(f'Correo consolidado enviado a {tutor_email} para {len(children_for_template)} niño(s).'))
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Error al enviar correo consolidado a {tutor_email}: {e}'))
-
-        # 4. Actualizar todos los controles que fueron incluidos en alguna notificación
-        if all_notified_control_ids:
-            # Usamos set para eliminar duplicados si un control fue asociado a múltiples tutores
-            Control.objects.filter(id__in=list(set(all_notified_control_ids))).update(notificacion_enviada=True)
-            self.stdout.write(self.style.NOTICE(f'Se marcaron {len(set(all_notified_control_ids))} controles como notificados.'))
 
-                    
         self.stdout.write(self.style.SUCCESS('Tarea de envío de alertas consolidadas finalizada.'))
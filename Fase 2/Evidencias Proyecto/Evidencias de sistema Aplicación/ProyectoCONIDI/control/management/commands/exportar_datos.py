@@ -0,0 +1,67 @@
+# control/management/commands/exportar_datos.py
+
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from control.exportacion import (
+    EXPORTACIONES, FORMATOS, ExportacionNoDisponible, escribir_csv, escribir_parquet, interpretar_desde,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Exporta niños, controles, vacunas y alergias (con los datos del niño) a CSV o Parquet '
+        'para análisis, leyendo la BD en bloques. Con --desde solo exporta lo creado o modificado desde esa fecha.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'tablas', nargs='*', metavar='TABLA',
+            help=f'Tablas a exportar: {", ".join(EXPORTACIONES)} (por defecto: todas).'
+        )
+        parser.add_argument(
+            '--formato', choices=FORMATOS, default='csv',
+            help="Formato de salida (por defecto: csv). 'parquet' requiere instalar pyarrow."
+        )
+        parser.add_argument(
+            '--desde', metavar='FECHA',
+            help='Exportación incremental: solo filas con cambios en su historial desde esta fecha (AAAA-MM-DD [HH:MM]).'
+        )
+        parser.add_argument(
+            '--directorio', default='.',
+            help='Carpeta donde se escriben los archivos <tabla>.csv / <tabla>.parquet (por defecto: la actual).'
+        )
+
+    def handle(self, *args, **options):
+        desconocidas = set(options['tablas']) - set(EXPORTACIONES)
+        if desconocidas:
+            raise CommandError(f'Tablas desconocidas: {", ".join(sorted(desconocidas))}. Use: {", ".join(EXPORTACIONES)}.')
+        desde = None
+        if options['desde']:
+            try:
+                desde = interpretar_desde(options['desde'])
+            except ValueError as e:
+                raise CommandError(str(e))
+        directorio = options['directorio']
+        os.makedirs(directorio, exist_ok=True)
+        formato = options['formato']
+
+        for nombre in options['tablas'] or EXPORTACIONES:
+            exportacion = EXPORTACIONES[nombre]
+            ruta = os.path.join(directorio, f'{nombre}.{formato}')
+            inicio = time.monotonic()
+            try:
+                if formato == 'parquet':
+                    total = escribir_parquet(exportacion, ruta, desde)
+                else:
+                    with open(ruta, 'w', newline='', encoding='utf-8') as destino:
+                        total = escribir_csv(exportacion, destino, desde)
+            except ExportacionNoDisponible as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(
+                f'-> {nombre}: {total} filas en {ruta} ({time.monotonic() - inicio:.1f} s).'
+            ))
+
+        self.stdout.write(self.style.SUCCESS('\n¡Exportación completada!'))
@@ -0,0 +1,65 @@
+# control/management/commands/generar_dataset.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from control.dataset import TAMANO_BLOQUE_DATASET, generar_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera un dataset sintético para pruebas de carga: niños, tutores, calendarios e historiales '
+        'clínicos con los perfiles de cumplimiento de script_simular_historial.py, con INSERT masivos. '
+        'Requiere los períodos, vacunas y categorías de alergia ya poblados.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ninos', type=int, required=True, help='Cantidad de niños a generar.')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Semilla: con la misma semilla, cantidad y tamaño de bloque se genera el mismo dataset (por defecto: 0).'
+        )
+        parser.add_argument(
+            '--tamano-bloque', type=int, default=TAMANO_BLOQUE_DATASET,
+            help=f'Niños generados y guardados por transacción (por defecto: {TAMANO_BLOQUE_DATASET}).'
+        )
+        parser.add_argument(
+            '--hoy', metavar='AAAA-MM-DD',
+            help='Fecha de referencia para edades y controles vencidos (por defecto: hoy). Fíjela para repetir un dataset.'
+        )
+
+    def handle(self, *args, **options):
+        if options['ninos'] <= 0 or options['tamano_bloque'] <= 0:
+            raise CommandError('--ninos y --tamano-bloque deben ser mayores que cero.')
+        hoy = None
+        if options['hoy']:
+            hoy = parse_date(options['hoy'])
+            if hoy is None:
+                raise CommandError(f"Fecha inválida: {options['hoy']} (use AAAA-MM-DD).")
+
+        self.stdout.write(self.style.WARNING(
+            f"Generando {options['ninos']} niños (semilla {options['seed']}) en bloques de {options['tamano_bloque']}..."
+        ))
+        inicio = time.monotonic()
+
+        def progreso(totales):
+            self.stdout.write(f"-> {totales['ninos']} niños generados ({time.monotonic() - inicio:.1f} s)...")
+
+        try:
+            totales = generar_dataset(
+                options['ninos'], options['seed'], tamano_bloque=options['tamano_bloque'], hoy=hoy, progreso=progreso,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"-> Niños: {totales['ninos']}. Tutores: {totales['tutores']}. Relaciones: {totales['relaciones']}."
+        ))
+        self.stdout.write(self.style.SUCCESS(
+            f"-> Controles: {totales['controles']} ({totales['controles_realizados']} realizados). "
+            f"Vacunas: {totales['vacunas']} ({totales['vacunas_aplicadas']} aplicadas). Alergias: {totales['alergias']}."
+        ))
+        self.stdout.write(self.style.SUCCESS(f"-> Resumen de controles reconstruido ({totales['filas_resumen']} filas)."))
+        self.stdout.write(self.style.SUCCESS(f'\n¡Dataset generado en {time.monotonic() - inicio:.1f} s!'))
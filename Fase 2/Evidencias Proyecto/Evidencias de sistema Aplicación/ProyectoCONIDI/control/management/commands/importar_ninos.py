@@ -0,0 +1,74 @@
+# control/management/commands/importar_ninos.py
+
+import csv
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from control.importacion import ArchivoInvalido, importar_ninos
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa niños y tutores desde un archivo CSV o Excel (.xlsx), por bloques: crea o '
+        'actualiza niños, tutores y sus relaciones, y genera los calendarios de los niños nuevos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo .csv o .xlsx (primera fila: encabezados).')
+        parser.add_argument(
+            '--tamano-bloque', type=int,
+            help='Filas validadas y guardadas por transacción (por defecto: IMPORTACION_BLOQUE).'
+        )
+        parser.add_argument('--simular', action='store_true', help='Solo valida el archivo, sin guardar nada.')
+        parser.add_argument('--errores', help='Escribe las filas rechazadas en este archivo CSV.')
+        parser.add_argument('--mostrar', type=int, default=20, help='Errores a listar en pantalla (por defecto: 20).')
+
+    def handle(self, *args, **options):
+        ruta = options['archivo']
+        if not os.path.isfile(ruta):
+            raise CommandError(f"No existe el archivo '{ruta}'.")
+
+        def progreso(resultado):
+            self.stdout.write(f'-> {resultado.filas} filas procesadas ({len(resultado.errores)} con errores)...')
+
+        self.stdout.write(self.style.WARNING(
+            f"{'Validando' if options['simular'] else 'Importando'} '{os.path.basename(ruta)}'..."
+        ))
+        inicio = time.monotonic()
+        try:
+            with open(ruta, 'rb') as archivo:
+                resultado = importar_ninos(
+                    archivo, ruta, tamano_bloque=options['tamano_bloque'],
+                    simular=options['simular'], progreso=progreso,
+                )
+        except ArchivoInvalido as e:
+            raise CommandError(str(e))
+        segundos = time.monotonic() - inicio
+
+        for fila, rut, mensaje in resultado.errores[:options['mostrar']]:
+            self.stdout.write(self.style.ERROR(f'  Fila {fila} ({rut or "sin RUT"}): {mensaje}'))
+        if len(resultado.errores) > options['mostrar']:
+            self.stdout.write(f'  ... y {len(resultado.errores) - options["mostrar"]} filas más con errores.')
+        if options['errores'] and resultado.errores:
+            with open(options['errores'], 'w', newline='', encoding='utf-8') as salida:
+                escritor = csv.writer(salida)
+                escritor.writerow(['fila', 'rut_nino', 'error'])
+                escritor.writerows(resultado.errores)
+            self.stdout.write(f"-> Errores guardados en '{options['errores']}'.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f'-> {resultado.filas_importadas} de {resultado.filas} filas válidas en {segundos:.1f} s.'
+        ))
+        if options['simular']:
+            self.stdout.write(self.style.SUCCESS('-> Simulación: no se guardó ningún cambio.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'-> Niños: {resultado.ninos_creados} creados, {resultado.ninos_actualizados} actualizados. '
+            f'Tutores: {resultado.tutores_creados} creados, {resultado.tutores_actualizados} actualizados. '
+            f'Relaciones: {resultado.relaciones_creadas} creadas.'
+        ))
+        self.stdout.write(self.style.SUCCESS(
+            f'-> Calendarios: {resultado.controles_creados} controles y {resultado.vacunas_creadas} vacunas.'
+        ))
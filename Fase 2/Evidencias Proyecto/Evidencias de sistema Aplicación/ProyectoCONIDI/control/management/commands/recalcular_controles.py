@@ -1,54 +1,83 @@
 # control/management/commands/recalcular_controles.py
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from control.models import Nino, Control, PeriodoControl
-from dateutil.relativedelta import relativedelta
+from control.calendario import (
+    construir_controles, guardar_controles, recalcular_controles_periodos, TAMANO_BLOQUE_NINOS
+)
+from control.resumenes import reconstruir_resumen_controles, resumen_en_pausa
 
 class Command(BaseCommand):
     help = 'Limpia y regenera todos los controles pendientes, respetando los que ya fueron realizados.'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--periodos', type=int, nargs='+', metavar='PERIODO_ID',
+            help='Modo incremental: solo recalcula los controles de estos períodos, '
+                 'actualizándolos en el lugar en vez de borrarlos y recrearlos.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=TAMANO_BLOQUE_NINOS,
+            help=f'Cantidad de niños procesados por bloque en modo incremental (por defecto: {TAMANO_BLOQUE_NINOS}).'
+        )
+
     def handle(self, *args, **options):
+        if options['periodos']:
+            self._recalcular_incremental(options['periodos'], options['chunk_size'])
+            return
+
         self.stdout.write(self.style.WARNING('Iniciando recálculo (versión final) de calendarios...'))
 
-        # PASO 1: Borrar TODOS los controles PENDIENTES en una sola operación.
-        controles_borrados, _ = Control.objects.filter(fecha_realizacion_control__isnull=True).delete()
-        self.stdout.write(self.style.SUCCESS(f'-> {controles_borrados} controles pendientes eliminados para empezar de cero.'))
-
-        # PASO 2: Obtener las reglas, los niños y, crucialmente, los controles YA REALIZADOS.
-        periodos_actuales = PeriodoControl.objects.all()
-        ninos = Nino.objects.all()
-        
-        # Creamos un conjunto de tuplas (nino_id, periodo_id) para una búsqueda ultra-rápida.
-        # Esto contiene la "lista de excepciones" de los controles que no debemos volver a crear.
-        controles_realizados = set(
-            Control.objects.filter(fecha_realizacion_control__isnull=False)
-            .values_list('nino_id', 'periodo_id')
-        )
-        self.stdout.write(f'-> Se encontraron {len(controles_realizados)} controles ya realizados que se respetarán.')
-
-        # PASO 3: Preparamos la lista para crear solo los controles necesarios.
-        controles_a_crear = []
-        for nino in ninos:
-            for periodo in periodos_actuales:
-                # LA LÓGICA CLAVE: Verificamos si este niño ya tiene este periodo realizado.
-                if (nino.pk, periodo.pk) not in controles_realizados:
-                    # Si no está en la lista de excepciones, lo añadimos para su creación.
-                    fecha_programada = nino.fecha_nacimiento + relativedelta(months=periodo.mes_control)
-                    controles_a_crear.append(
-                        Control(
-                            nino=nino,
-                            periodo=periodo,
-                            nombre_control=periodo.nombre_mes_control,
-                            fecha_control_programada=fecha_programada,
-                            estado_control="Pendiente"
-                        )
-                    )
-        
-        # PASO 4: Creamos todos los nuevos controles en una sola operación.
-        if controles_a_crear:
-            Control.objects.bulk_create(controles_a_crear)
-            self.stdout.write(self.style.SUCCESS(f'-> {len(controles_a_crear)} nuevos controles pendientes creados.'))
+        # El resumen diario se reconstruye al final: mientras tanto, las señales de Control no lo tocan.
+        with transaction.atomic(), resumen_en_pausa():
+            # PASO 1: Borrar TODOS los controles PENDIENTES en una sola operación.
+            controles_borrados, _ = Control.objects.filter(fecha_realizacion_control__isnull=True).delete()
+            self.stdout.write(self.style.SUCCESS(f'-> {controles_borrados} controles pendientes eliminados para empezar de cero.'))
+
+            # PASO 2: Obtener las reglas, los niños y, crucialmente, los controles YA REALIZADOS.
+            periodos_actuales = list(PeriodoControl.objects.all())
+            ninos = Nino.objects.only('rut_nino', 'fecha_nacimiento')
+
+            # Creamos un conjunto de tuplas (nino_id, periodo_id) para una búsqueda ultra-rápida.
+            # Esto contiene la "lista de excepciones" de los controles que no debemos volver a crear.
+            controles_realizados = set(
+                Control.objects.filter(fecha_realizacion_control__isnull=False)
+                .values_list('nino_id', 'periodo_id')
+            )
+            self.stdout.write(f'-> Se encontraron {len(controles_realizados)} controles ya realizados que se respetarán.')
+
+            # PASO 3 y 4: El servicio de calendario arma solo los controles necesarios
+            # y los crea (junto a su historial) con inserciones en bloque.
+            controles_creados = guardar_controles(
+                construir_controles(ninos, periodos_actuales, excluir=controles_realizados)
+            )
+
+            # PASO 5: Rehacer el resumen diario del dashboard con los controles nuevos.
+            filas_resumen = reconstruir_resumen_controles()
+            self.stdout.write(f'-> Resumen diario de controles reconstruido ({filas_resumen} filas).')
+
+        if controles_creados:
+            self.stdout.write(self.style.SUCCESS(f'-> {len(controles_creados)} nuevos controles pendientes creados.'))
         else:
             self.stdout.write(self.style.SUCCESS('-> No fue necesario crear nuevos controles pendientes.'))
-        
-        self.stdout.write(self.style.SUCCESS('\n¡Recálculo completado!'))
\ No newline at end of file
+
+        self.stdout.write(self.style.SUCCESS('\n¡Recálculo completado!'))
+
+    def _recalcular_incremental(self, periodo_ids, chunk_size):
+        self.stdout.write(self.style.WARNING('Iniciando recálculo incremental de calendarios...'))
+
+        periodos = list(PeriodoControl.objects.filter(pk__in=periodo_ids))
+        no_encontrados = set(periodo_ids) - {periodo.pk for periodo in periodos}
+        if no_encontrados:
+            self.stdout.write(self.style.WARNING(f'-> Períodos inexistentes ignorados: {sorted(no_encontrados)}'))
+        if not periodos:
+            self.stdout.write(self.style.SUCCESS('-> No hay períodos que recalcular.'))
+            return
+
+        self.stdout.write(f'-> Períodos a recalcular: {", ".join(p.nombre_mes_control for p in periodos)}')
+        actualizados, creados = recalcular_controles_periodos(periodos, chunk_size=chunk_size)
+
+        self.stdout.write(self.style.SUCCESS(f'-> {actualizados} controles pendientes actualizados en el lugar.'))
+        self.stdout.write(self.style.SUCCESS(f'-> {creados} controles faltantes creados.'))
+        self.stdout.write(self.style.SUCCESS('\n¡Recálculo completado!'))
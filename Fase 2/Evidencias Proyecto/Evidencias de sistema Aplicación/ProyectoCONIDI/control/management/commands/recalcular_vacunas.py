@@ -0,0 +1,55 @@
+# control/management/commands/recalcular_vacunas.py
+
+from django.core.management.base import BaseCommand
+
+from control.models import Vacuna
+from control.calendario import recalcular_vacunas, TAMANO_BLOQUE_NINOS
+from control.tareas import encolar_recalculo_vacunas
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula el calendario de vacunación: actualiza en el lugar las dosis pendientes '
+        'según Vacuna.meses_programada y crea las que falten, respetando las ya aplicadas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--vacunas', type=int, nargs='+', metavar='VACUNA_ID',
+            help='Solo recalcula estas vacunas (por defecto: todas las que tienen meses programados).'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=TAMANO_BLOQUE_NINOS,
+            help=f'Cantidad de niños procesados por bloque (por defecto: {TAMANO_BLOQUE_NINOS}).'
+        )
+        parser.add_argument(
+            '--encolar', action='store_true',
+            help="No ejecuta el recálculo: lo deja como tarea pendiente para 'run_scheduler'."
+        )
+
+    def handle(self, *args, **options):
+        vacunas = Vacuna.objects.filter(meses_programada__isnull=False)
+        if options['vacunas']:
+            vacunas = vacunas.filter(pk__in=options['vacunas'])
+            no_encontradas = set(options['vacunas']) - {vacuna.pk for vacuna in vacunas}
+            if no_encontradas:
+                self.stdout.write(self.style.WARNING(
+                    f'-> Vacunas inexistentes o sin meses programados ignoradas: {sorted(no_encontradas)}'
+                ))
+        vacunas = list(vacunas)
+        if not vacunas:
+            self.stdout.write(self.style.SUCCESS('-> No hay vacunas que recalcular.'))
+            return
+
+        if options['encolar']:
+            tarea = encolar_recalculo_vacunas([vacuna.pk for vacuna in vacunas])
+            self.stdout.write(self.style.SUCCESS(f'-> Tarea de recálculo #{tarea.pk} encolada.'))
+            return
+
+        self.stdout.write(self.style.WARNING('Iniciando recálculo incremental del calendario de vacunación...'))
+        self.stdout.write(f'-> Vacunas a recalcular: {", ".join(v.nom_vacuna for v in vacunas)}')
+        actualizadas, creadas = recalcular_vacunas(vacunas, chunk_size=options['chunk_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'-> {actualizadas} dosis pendientes actualizadas en el lugar.'))
+        self.stdout.write(self.style.SUCCESS(f'-> {creadas} dosis faltantes creadas.'))
+        self.stdout.write(self.style.SUCCESS('\n¡Recálculo completado!'))
@@ -0,0 +1,99 @@
+# control/management/commands/reporte_metricas.py
+
+import json
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+ORDENES = {
+    'p95': lambda r: r['p95_ms'],
+    'total': lambda r: r['total_ms'],
+    'consultas': lambda r: r['consultas_promedio'],
+    'peticiones': lambda r: r['peticiones'],
+}
+
+
+def _percentil(valores_ordenados, percentil):
+    indice = max(0, round(percentil / 100 * len(valores_ordenados)) - 1)
+    return valores_ordenados[indice]
+
+
+class Command(BaseCommand):
+    help = (
+        "Agrupa por nombre de URL las métricas que registra 'MetricasPeticionMiddleware' "
+        "(consultas SQL, tiempo en SQL, en plantillas y total) y muestra las vistas más costosas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--archivo', nargs='+',
+            help='Archivos de métricas a leer (por defecto: METRICAS_LOG_ARCHIVO y sus rotaciones).'
+        )
+        parser.add_argument(
+            '--orden', choices=sorted(ORDENES), default='p95',
+            help='Criterio para ordenar las vistas (por defecto: p95).'
+        )
+        parser.add_argument('--top', type=int, default=20, help='Cantidad de vistas a mostrar (por defecto: 20).')
+
+    def handle(self, *args, **options):
+        archivos = [Path(a) for a in options['archivo']] if options['archivo'] else self._archivos_por_defecto()
+        archivos = [a for a in archivos if a.exists()]
+        if not archivos:
+            raise CommandError('No se encontraron archivos de métricas. ¿Está activo METRICAS_HABILITADAS?')
+
+        por_vista = defaultdict(list)
+        for archivo in archivos:
+            with open(archivo, encoding='utf-8') as f:
+                for linea in f:
+                    try:
+                        registro = json.loads(linea)
+                    except ValueError:
+                        continue
+                    por_vista[registro.get('url_name') or registro.get('ruta')].append(registro)
+
+        resumen = [self._resumir(vista, registros) for vista, registros in por_vista.items()]
+        resumen.sort(key=ORDENES[options['orden']], reverse=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{sum(r['peticiones'] for r in resumen)} peticiones en {len(resumen)} vistas "
+            f"(ordenado por {options['orden']}):"
+        ))
+        self.stdout.write(
+            f"{'Vista':<40} {'N':>6} {'p50 ms':>8} {'p95 ms':>8} {'máx ms':>8} "
+            f"{'SQL prom':>8} {'SQL máx':>8} {'SQL ms':>8} {'tpl ms':>8}"
+        )
+        for r in resumen[:options['top']]:
+            self.stdout.write(
+                f"{str(r['vista'])[:40]:<40} {r['peticiones']:>6} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+                f"{r['max_ms']:>8.1f} {r['consultas_promedio']:>8.1f} {r['consultas_max']:>8} "
+                f"{r['sql_promedio_ms']:>8.1f} {r['plantillas_promedio_ms']:>8.1f}"
+            )
+            if r['consulta_mas_lenta']:
+                self.stdout.write(self.style.NOTICE(
+                    f"    consulta más lenta ({r['consulta_mas_lenta_ms']:.1f} ms): {r['consulta_mas_lenta'][:150]}"
+                ))
+
+    def _archivos_por_defecto(self):
+        base = Path(getattr(settings, 'METRICAS_LOG_ARCHIVO', settings.BASE_DIR / 'metricas.log'))
+        return [base] + sorted(base.parent.glob(base.name + '.*'))
+
+    def _resumir(self, vista, registros):
+        duraciones = sorted(r['duracion_ms'] for r in registros)
+        mas_lenta = max(registros, key=lambda r: r.get('consulta_mas_lenta_ms', 0))
+        n = len(registros)
+        return {
+            'vista': vista,
+            'peticiones': n,
+            'total_ms': sum(duraciones),
+            'p50_ms': _percentil(duraciones, 50),
+            'p95_ms': _percentil(duraciones, 95),
+            'max_ms': duraciones[-1],
+            'consultas_promedio': sum(r['consultas'] for r in registros) / n,
+            'consultas_max': max(r['consultas'] for r in registros),
+            'sql_promedio_ms': sum(r['sql_ms'] for r in registros) / n,
+            'plantillas_promedio_ms': sum(r['plantillas_ms'] for r in registros) / n,
+            'consulta_mas_lenta_ms': mas_lenta.get('consulta_mas_lenta_ms', 0),
+            'consulta_mas_lenta': mas_lenta.get('consulta_mas_lenta', ''),
+        }
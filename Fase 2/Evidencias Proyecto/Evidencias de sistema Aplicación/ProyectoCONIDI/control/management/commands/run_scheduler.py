@@ -10,7 +10,9 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from django.conf import settings
 from django.utils import timezone
 
-from control.scheduler import enviar_alertas_job
+from control.scheduler import (
+    enviar_alertas_job, procesar_tareas_recalculo_job, despachar_outbox_job, reconstruir_resumenes_job,
+)
 
 
 class Command(BaseCommand):
@@ -46,6 +48,30 @@ class Command(BaseCommand):
                 minute=17, # <-- Cambia este valor por el minuto deseado (ej: 30)
                 id='enviar_alertas_diarias', replace_existing=True
             )
+            # Revisa cada pocos segundos si hay recálculos de calendario encolados
+            # desde la configuración. max_instances=1 evita ejecuciones solapadas.
+            scheduler.add_job(
+                procesar_tareas_recalculo_job,
+                'interval',
+                seconds=5,
+                id='procesar_tareas_recalculo', replace_existing=True, max_instances=1
+            )
+            # Despachador de la bandeja de salida: todos los correos del sistema salen por aquí.
+            scheduler.add_job(
+                despachar_outbox_job,
+                'interval',
+                seconds=15,
+                id='despachar_outbox', replace_existing=True, max_instances=1
+            )
+            # Reconstrucción nocturna del resumen del Dashboard de Gestión: corrige lo que
+            # no pasa por Control.save() (cargas masivas, recálculos, cambios de sector).
+            scheduler.add_job(
+                reconstruir_resumenes_job,
+                'cron',
+                hour=3,
+                minute=0,
+                id='reconstruir_resumenes', replace_existing=True, max_instances=1
+            )
             logging.info("Tarea añadida. Iniciando el planificador... (Presiona Ctrl+C para detener)")
             
             scheduler.start()
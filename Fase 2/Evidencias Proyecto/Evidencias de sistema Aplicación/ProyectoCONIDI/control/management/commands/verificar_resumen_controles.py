@@ -0,0 +1,52 @@
+# control/management/commands/verificar_resumen_controles.py
+
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from control.resumenes import comparar_resumen_controles, reconstruir_resumen_controles
+
+
+def _fecha(valor):
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise CommandError(f"Fecha inválida '{valor}': use el formato AAAA-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = (
+        'Verifica que la tabla de resumen ResumenDiarioControles cuadre con los controles '
+        '(por fecha, sector, período y estado). Con --reparar la reconstruye desde Control.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Primera fecha programada a revisar (AAAA-MM-DD).')
+        parser.add_argument('--hasta', help='Última fecha programada a revisar (AAAA-MM-DD).')
+        parser.add_argument(
+            '--reparar', action='store_true',
+            help='Reconstruye el resumen del rango si encuentra diferencias.'
+        )
+        parser.add_argument('--mostrar', type=int, default=20, help='Diferencias a listar (por defecto: 20).')
+
+    def handle(self, *args, **options):
+        desde = _fecha(options['desde']) if options['desde'] else None
+        hasta = _fecha(options['hasta']) if options['hasta'] else None
+
+        diferencias = comparar_resumen_controles(desde, hasta)
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS('El resumen de controles cuadra con los datos de Control.'))
+            return
+
+        self.stdout.write(self.style.WARNING(f'{len(diferencias)} combinación(es) no cuadran:'))
+        for (fecha, sector, periodo_id, estado), en_control, en_resumen in diferencias[:options['mostrar']]:
+            self.stdout.write(
+                f"  {fecha} | {sector or 'Sin sector'} | período {periodo_id} | {estado}: "
+                f"Control={en_control}, resumen={en_resumen}"
+            )
+
+        if not options['reparar']:
+            raise CommandError('El resumen no cuadra. Ejecute de nuevo con --reparar para reconstruirlo.')
+
+        filas = reconstruir_resumen_controles(desde, hasta)
+        self.stdout.write(self.style.SUCCESS(f'Resumen reconstruido: {filas} fila(s).'))
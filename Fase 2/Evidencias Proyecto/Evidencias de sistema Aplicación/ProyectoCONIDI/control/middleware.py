@@ -0,0 +1,150 @@
+# control/middleware.py
+
+import contextvars
+import json
+import logging
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger('conidi.metricas')
+
+# Métricas de la petición en curso (None fuera de una petición instrumentada).
+_metricas_actuales = contextvars.ContextVar('metricas_peticion', default=None)
+
+
+class _Metricas:
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo_sql = 0.0
+        self.tiempo_plantillas = 0.0
+        self.consulta_mas_lenta = None
+        self.duracion_mas_lenta = 0.0
+        self._profundidad_plantillas = 0
+
+    def registrar_consulta(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.consultas += 1
+            self.tiempo_sql += duracion
+            if duracion > self.duracion_mas_lenta:
+                self.duracion_mas_lenta = duracion
+                self.consulta_mas_lenta = sql
+
+
+class _PlantillaConMetricas:
+    """
+    Envuelve una plantilla del backend para sumar su tiempo de render a la petición en curso.
+    Las plantillas anidadas ({% include %}) se renderizan dentro de la principal y no
+    pasan por aquí; un render_to_string dentro de otro render no se cuenta dos veces.
+    """
+
+    def __init__(self, plantilla):
+        self.plantilla = plantilla
+
+    def __getattr__(self, nombre):
+        return getattr(self.plantilla, nombre)
+
+    def render(self, context=None, request=None):
+        metricas = _metricas_actuales.get()
+        if metricas is None or metricas._profundidad_plantillas:
+            return self.plantilla.render(context, request)
+        metricas._profundidad_plantillas += 1
+        inicio = time.perf_counter()
+        try:
+            return self.plantilla.render(context, request)
+        finally:
+            metricas.tiempo_plantillas += time.perf_counter() - inicio
+            metricas._profundidad_plantillas -= 1
+
+
+class DjangoTemplatesConMetricas(DjangoTemplates):
+    """Backend de plantillas de Django que mide el render para MetricasPeticionMiddleware (ver TEMPLATES)."""
+
+    def from_string(self, template_code):
+        return _PlantillaConMetricas(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _PlantillaConMetricas(super().get_template(template_name))
+
+
+class MetricasPeticionMiddleware:
+    """
+    Mide cada petición: cantidad de consultas SQL, tiempo total en SQL, tiempo de render
+    de plantillas y la consulta más lenta. Lo informa en la cabecera 'Server-Timing'
+    (visible en las herramientas de desarrollo del navegador) y en una línea JSON del
+    logger 'conidi.metricas', que luego agrega el comando 'reporte_metricas'.
+
+    En las respuestas en streaming el cuerpo se genera después de enviar las cabeceras:
+    no llevan Server-Timing y su línea se registra al terminar de enviarse el cuerpo,
+    con las consultas hechas mientras tanto.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.habilitado = getattr(settings, 'METRICAS_HABILITADAS', True)
+        archivo = getattr(settings, 'METRICAS_LOG_ARCHIVO', None)
+        if self.habilitado and archivo:
+            # El handler del log abre el archivo recién con la primera petición; su carpeta debe existir.
+            Path(archivo).parent.mkdir(parents=True, exist_ok=True)
+
+    def __call__(self, request):
+        if not self.habilitado:
+            return self.get_response(request)
+
+        metricas = _Metricas()
+        token = _metricas_actuales.set(metricas)
+        inicio = time.perf_counter()
+        try:
+            with connection.execute_wrapper(metricas.registrar_consulta):
+                response = self.get_response(request)
+        finally:
+            _metricas_actuales.reset(token)
+
+        if response.streaming:
+            if getattr(response, 'is_async', False):
+                # Cuerpo asíncrono (ASGI): no se mide, se registra solo lo hecho en la vista.
+                self._registrar(request, response, metricas, inicio)
+            else:
+                response.streaming_content = self._medir_cuerpo(response.streaming_content, request, response, metricas, inicio)
+            return response
+
+        duracion = time.perf_counter() - inicio
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={metricas.tiempo_sql * 1000:.1f};desc="{metricas.consultas} consultas"',
+            f'tpl;dur={metricas.tiempo_plantillas * 1000:.1f};desc="Plantillas"',
+            f'total;dur={duracion * 1000:.1f}',
+        ])
+        self._registrar(request, response, metricas, inicio)
+        return response
+
+    def _medir_cuerpo(self, contenido, request, response, metricas, inicio):
+        """Entrega el cuerpo en streaming contando sus consultas; registra la línea al terminar."""
+        try:
+            with connection.execute_wrapper(metricas.registrar_consulta):
+                yield from contenido
+        finally:
+            self._registrar(request, response, metricas, inicio)
+
+    def _registrar(self, request, response, metricas, inicio):
+        duracion = time.perf_counter() - inicio
+        match = getattr(request, 'resolver_match', None)
+        logger.info(json.dumps({
+            'url_name': match.view_name if match else None,
+            'metodo': request.method,
+            # El patrón de la URL y no la ruta real, que puede traer datos personales (p. ej. el RUT del niño).
+            'ruta': f'/{match.route}' if match else request.path,
+            'estado': response.status_code,
+            'duracion_ms': round(duracion * 1000, 2),
+            'consultas': metricas.consultas,
+            'sql_ms': round(metricas.tiempo_sql * 1000, 2),
+            'plantillas_ms': round(metricas.tiempo_plantillas * 1000, 2),
+            'consulta_mas_lenta_ms': round(metricas.duracion_mas_lenta * 1000, 2),
+            'consulta_mas_lenta': (metricas.consulta_mas_lenta or '')[:500],
+        }, ensure_ascii=False))
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TareaRecalculo',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('tipo', models.CharField(choices=[('CONTROLES', 'Recálculo de Controles')], default='CONTROLES', max_length=20)),
+                ('parametros', models.JSONField(blank=True, default=dict, help_text='Argumentos de la tarea, por ejemplo los IDs de los períodos modificados.')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_CURSO', 'En curso'), ('COMPLETADA', 'Completada'), ('ERROR', 'Error')], db_index=True, default='PENDIENTE', max_length=20)),
+                ('progreso', models.PositiveSmallIntegerField(default=0, help_text='Porcentaje de avance (0-100).')),
+                ('filas_actualizadas', models.IntegerField(default=0)),
+                ('filas_creadas', models.IntegerField(default=0)),
+                ('mensaje_error', models.TextField(blank=True, null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('creado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Creado por')),
+            ],
+            options={
+                'verbose_name': 'Tarea de Recálculo',
+                'verbose_name_plural': 'Tareas de Recálculo',
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:51
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0003_tarearecalculo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEmail',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('origen', models.CharField(blank=True, help_text='Funcionalidad que generó el correo (PNAC, reporte, alertas...).', max_length=50)),
+                ('asunto', models.CharField(max_length=255)),
+                ('cuerpo', models.TextField(blank=True)),
+                ('cuerpo_html', models.TextField(blank=True, null=True)),
+                ('remitente', models.CharField(max_length=254)),
+                ('destinatarios', models.JSONField(default=list)),
+                ('adjuntos', models.JSONField(blank=True, default=list, help_text='Lista de {nombre, mimetype, contenido (base64)}.')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('ENVIANDO', 'Enviando'), ('ENVIADO', 'Enviado'), ('FALLIDO', 'Fallido')], default='PENDIENTE', max_length=20)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('max_intentos', models.PositiveSmallIntegerField(default=5)),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now, help_text='No se intenta enviar antes de esta fecha. Mientras está ENVIANDO, marca el fin de la reserva.')),
+                ('ultimo_error', models.TextField(blank=True, null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_envio', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Correo en Bandeja de Salida',
+                'verbose_name_plural': 'Bandeja de Salida de Correos',
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='outbox_estado_prox_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0004_outboxemail'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historialenvioreporte',
+            name='clave',
+            field=models.CharField(blank=True, default='', help_text='Día y destinatarios del reporte; evita generar dos veces el mismo reporte a la vez.', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='historialenvioreporte',
+            name='correo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='control.outboxemail', verbose_name='Correo encolado'),
+        ),
+        migrations.AddField(
+            model_name='historialenvioreporte',
+            name='estado',
+            field=models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_CURSO', 'Generando'), ('COMPLETADO', 'Encolado para envío'), ('ERROR', 'Error')], default='COMPLETADO', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='historialenvioreporte',
+            name='fecha_fin',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='historialenvioreporte',
+            name='mensaje_error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='historialenvioreporte',
+            name='controles_reportados_count',
+            field=models.IntegerField(default=0, verbose_name='Cantidad de Controles Reportados'),
+        ),
+        migrations.AddConstraint(
+            model_name='historialenvioreporte',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado__in', ['PENDIENTE', 'EN_CURSO'])), fields=('clave',), name='reporte_unico_en_curso'),
+        ),
+    ]
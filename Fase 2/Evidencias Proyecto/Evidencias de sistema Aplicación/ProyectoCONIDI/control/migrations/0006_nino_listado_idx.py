@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0005_historialenvioreporte_estado'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='nino',
+            index=models.Index(fields=['estado_seguimiento', 'ap_paterno', 'nombre', 'rut_nino'], name='nino_listado_idx'),
+        ),
+    ]
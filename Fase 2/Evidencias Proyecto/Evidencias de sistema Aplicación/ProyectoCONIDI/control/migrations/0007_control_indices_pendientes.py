@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0006_nino_listado_idx'),
+        ('login', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='control',
+            index=models.Index(fields=['nino', 'fecha_control_programada'], name='control_nino_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='control',
+            index=models.Index(condition=models.Q(('deshabilitado', False), ('fecha_realizacion_control__isnull', True)), fields=['fecha_control_programada'], name='control_pendiente_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='control',
+            index=models.Index(condition=models.Q(('deshabilitado', False), ('fecha_realizacion_control__isnull', True), ('notificacion_enviada', False)), fields=['fecha_control_programada'], name='control_sin_notificar_idx'),
+        ),
+    ]
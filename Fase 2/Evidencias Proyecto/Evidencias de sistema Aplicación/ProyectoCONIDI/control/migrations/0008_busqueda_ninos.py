@@ -0,0 +1,44 @@
+# Índices de búsqueda de niños por nombre (ver control/busqueda.py).
+# SQLite: tabla virtual FTS5. PostgreSQL: extensión pg_trgm e índice GIN de trigramas.
+
+from django.db import migrations
+
+
+def crear_indices_busqueda(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE control_nino_fts USING fts5("
+            "rut_nino UNINDEXED, nombre, ap_paterno, ap_materno, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        schema_editor.execute(
+            "INSERT INTO control_nino_fts (rut_nino, nombre, ap_paterno, ap_materno) "
+            "SELECT rut_nino, nombre_norm, ap_paterno_norm, COALESCE(ap_materno_norm, '') FROM control_nino"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX control_nino_trgm_idx ON control_nino USING gin ("
+            "(\"control_nino\".\"nombre_norm\" || ' ' || \"control_nino\".\"ap_paterno_norm\" || ' ' || "
+            "COALESCE(\"control_nino\".\"ap_materno_norm\", '')) gin_trgm_ops)"
+        )
+
+
+def eliminar_indices_busqueda(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS control_nino_fts")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS control_nino_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0007_control_indices_pendientes'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices_busqueda, eliminar_indices_busqueda),
+    ]
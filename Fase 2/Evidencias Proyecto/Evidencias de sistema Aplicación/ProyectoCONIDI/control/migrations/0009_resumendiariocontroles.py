@@ -0,0 +1,63 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, Count, Value, When
+from django.db.models.functions import Coalesce
+
+
+def llenar_resumen(apps, schema_editor):
+    # Carga inicial desde los controles existentes; luego lo mantienen las señales y el scheduler.
+    Control = apps.get_model('control', 'Control')
+    ResumenDiarioControles = apps.get_model('control', 'ResumenDiarioControles')
+    filas = (
+        Control.objects.annotate(
+            estado_resumen=Case(
+                When(deshabilitado=True, then=Value('DESHABILITADO')),
+                When(fecha_realizacion_control__isnull=False, then=Value('REALIZADO')),
+                default=Value('PENDIENTE'),
+                output_field=models.CharField(),
+            ),
+            sector_resumen=Coalesce('nino__sector', Value('')),
+        )
+        .values('fecha_control_programada', 'sector_resumen', 'periodo_id', 'estado_resumen')
+        .annotate(cantidad=Count('id'))
+        .order_by()
+    )
+    ResumenDiarioControles.objects.bulk_create(
+        [
+            ResumenDiarioControles(
+                fecha=fila['fecha_control_programada'], sector=fila['sector_resumen'],
+                periodo_id=fila['periodo_id'], estado=fila['estado_resumen'], cantidad=fila['cantidad'],
+            )
+            for fila in filas
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0008_busqueda_ninos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiarioControles',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('fecha', models.DateField(help_text='Fecha programada de los controles.')),
+                ('sector', models.CharField(blank=True, default='', help_text="Sector del niño ('' si no tiene).", max_length=50)),
+                ('estado', models.CharField(choices=[('REALIZADO', 'Realizado'), ('PENDIENTE', 'Pendiente'), ('DESHABILITADO', 'Deshabilitado')], max_length=20)),
+                ('cantidad', models.IntegerField(default=0)),
+                ('periodo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='control.periodocontrol')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario de Controles',
+                'verbose_name_plural': 'Resúmenes Diarios de Controles',
+                'indexes': [models.Index(fields=['fecha', 'sector'], name='resumen_ctrl_fecha_idx')],
+            },
+        ),
+        migrations.RunPython(llenar_resumen, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0009_resumendiariocontroles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistorialArchivado',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('modelo', models.CharField(help_text="Modelo de historial, p. ej. 'control.historicalcontrol'.", max_length=100)),
+                ('objeto_id', models.CharField(help_text='Clave primaria del objeto original, como texto.', max_length=100)),
+                ('fecha_desde', models.DateTimeField(help_text='Fecha de la versión archivada más antigua.')),
+                ('fecha_hasta', models.DateTimeField(help_text='Fecha de la versión archivada más reciente.')),
+                ('versiones', models.IntegerField(help_text="Cantidad de versiones guardadas en 'datos'.")),
+                ('datos', models.BinaryField()),
+                ('fecha_archivo', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Historial Archivado',
+                'verbose_name_plural': 'Historiales Archivados',
+                'indexes': [models.Index(fields=['modelo', 'objeto_id'], name='historial_arch_objeto_idx')],
+            },
+        ),
+    ]
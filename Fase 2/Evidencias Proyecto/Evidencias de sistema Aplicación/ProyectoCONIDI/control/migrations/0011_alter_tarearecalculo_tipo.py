@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0010_historialarchivado'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tarearecalculo',
+            name='tipo',
+            field=models.CharField(choices=[('CONTROLES', 'Recálculo de Controles'), ('VACUNAS', 'Recálculo de Vacunas')], default='CONTROLES', max_length=20),
+        ),
+    ]
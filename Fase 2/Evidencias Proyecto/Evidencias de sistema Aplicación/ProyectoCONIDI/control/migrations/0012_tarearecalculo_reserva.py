@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0011_alter_tarearecalculo_tipo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tarearecalculo',
+            name='fecha_actividad',
+            field=models.DateTimeField(blank=True, help_text='Último avance registrado por el proceso que la ejecuta.', null=True),
+        ),
+        migrations.AddField(
+            model_name='tarearecalculo',
+            name='intentos',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Veces que un proceso tomó la tarea.'),
+        ),
+    ]
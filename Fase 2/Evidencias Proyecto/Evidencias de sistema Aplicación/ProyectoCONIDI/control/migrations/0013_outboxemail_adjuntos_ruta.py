@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0012_tarearecalculo_reserva'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxemail',
+            name='adjuntos',
+            field=models.JSONField(blank=True, default=list, help_text='Lista de {nombre, mimetype, contenido (base64)}, o {nombre, mimetype, ruta} si el archivo está en disco.'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Índice FTS5 de búsqueda de niños (ver control/busqueda.py): rut_nino deja de ser UNINDEXED
+# para que borrar o reindexar un niño no recorra la tabla FTS entera. Solo SQLite.
+
+from django.db import migrations
+
+
+def _recrear_tabla_fts(schema_editor, columna_rut):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS control_nino_fts")
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE control_nino_fts USING fts5("
+        f"{columna_rut}, nombre, ap_paterno, ap_materno, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    schema_editor.execute(
+        "INSERT INTO control_nino_fts (rut_nino, nombre, ap_paterno, ap_materno) "
+        "SELECT rut_nino, nombre_norm, ap_paterno_norm, COALESCE(ap_materno_norm, '') FROM control_nino"
+    )
+
+
+def indexar_rut(apps, schema_editor):
+    _recrear_tabla_fts(schema_editor, 'rut_nino')
+
+
+def desindexar_rut(apps, schema_editor):
+    _recrear_tabla_fts(schema_editor, 'rut_nino UNINDEXED')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0013_outboxemail_adjuntos_ruta'),
+    ]
+
+    operations = [
+        migrations.RunPython(indexar_rut, desindexar_rut),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:21
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def unir_filas_repetidas(apps, schema_editor):
+    # Antes de la restricción podía haber varias filas por combinación: se suman en la de menor id.
+    ResumenDiarioControles = apps.get_model('control', 'ResumenDiarioControles')
+    repetidas = (
+        ResumenDiarioControles.objects.values('fecha', 'sector', 'periodo_id', 'estado')
+        .annotate(filas=Count('id'), primera=Min('id'), total=Sum('cantidad'))
+        .filter(filas__gt=1)
+        .order_by()
+    )
+    for grupo in repetidas:
+        ResumenDiarioControles.objects.filter(
+            fecha=grupo['fecha'], sector=grupo['sector'], periodo_id=grupo['periodo_id'], estado=grupo['estado'],
+        ).exclude(pk=grupo['primera']).delete()
+        ResumenDiarioControles.objects.filter(pk=grupo['primera']).update(cantidad=grupo['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0014_busqueda_ninos_rut_indexado'),
+    ]
+
+    operations = [
+        migrations.RunPython(unir_filas_repetidas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='resumendiariocontroles',
+            constraint=models.UniqueConstraint(condition=models.Q(('periodo__isnull', False)), fields=('fecha', 'sector', 'periodo', 'estado'), name='resumen_ctrl_unico'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumendiariocontroles',
+            constraint=models.UniqueConstraint(condition=models.Q(('periodo__isnull', True)), fields=('fecha', 'sector', 'estado'), name='resumen_ctrl_unico_sin_periodo'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0015_resumendiariocontroles_unico'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historialarchivado',
+            index=models.Index(fields=['modelo', 'fecha_hasta'], name='historial_arch_fecha_idx'),
+        ),
+    ]
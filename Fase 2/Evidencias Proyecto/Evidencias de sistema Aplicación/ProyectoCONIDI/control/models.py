@@ -2,9 +2,13 @@
 from django.db import models
 from datetime import date, timedelta # Asegúrate de tener este import
 from django.conf import settings
+from django.utils import timezone
+from django.db.models.functions import Coalesce
 from simple_history.models import HistoricalRecords
 from unidecode import unidecode
 
+from .busqueda import motor_busqueda
+
 # --- Modelos Geográficos ---
 class Region(models.Model):
     id = models.AutoField(primary_key=True)
@@ -29,6 +33,30 @@ class Comuna(models.Model):
     def __str__(self):
         return self.nom_comuna
 
+# --- Visibilidad por usuario ---
+class VisibleParaQuerySet(models.QuerySet):
+    """
+    Agrega visible_to(acceso): los registros que el usuario puede ver, resuelto en la misma
+    consulta que los trae. 'acceso' es request.conidi_access (login/acceso.py), que ya trae
+    el rol. Administradores y profesionales ven todo; un tutor, solo lo de los niños que
+    tiene a cargo (join con NinoTutor); cualquier otro usuario, nada.
+    'ruta_nino' es el camino desde el modelo hasta Nino ('' si el modelo es Nino).
+    """
+    ruta_nino = ''
+
+    def visible_to(self, acceso):
+        if acceso.es_administrador or acceso.es_profesional:
+            return self
+        if acceso.es_tutor:
+            prefijo = f'{self.ruta_nino}__' if self.ruta_nino else ''
+            return self.filter(**{f'{prefijo}ninotutor__tutor__usuario': acceso.user})
+        return self.none()
+
+
+class NinoQuerySet(VisibleParaQuerySet):
+    pass
+
+
 # --- Modelo Principal del Niño ---
 class Nino(models.Model):
 
@@ -92,6 +120,15 @@ class Nino(models.Model):
         db_index=True
     )
     history = HistoricalRecords()
+
+    objects = NinoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Cubre el orden del listado de niños (paginación por cursor en 'listar_ninos').
+            models.Index(fields=['estado_seguimiento', 'ap_paterno', 'nombre', 'rut_nino'], name='nino_listado_idx'),
+        ]
+
    # AÑADE LA FUNCIÓN DE NORMALIZACIÓN 
     def _normalize_text(self, text):
         """Convierte texto a minúsculas y quita acentos."""
@@ -100,6 +137,15 @@ class Nino(models.Model):
             return unidecode(text).lower()
         return text # Devuelve None o '' si el original era None o ''
 
+    def normalizar_campos(self):
+        """
+        Asigna los valores a los campos _norm. Se expone aparte de save()
+        porque bulk_create no llama a save() y las cargas masivas deben invocarlo.
+        """
+        self.nombre_norm = self._normalize_text(self.nombre)
+        self.ap_paterno_norm = self._normalize_text(self.ap_paterno)
+        self.ap_materno_norm = self._normalize_text(self.ap_materno)
+
     #  SOBREESCRIBE EL MÉTODO SAVE -
     def save(self, *args, **kwargs):
         """
@@ -107,13 +153,14 @@ class Nino(models.Model):
         se actualicen automáticamente antes de guardar.
         """
         # Normaliza y asigna los valores a los campos _norm
-        self.nombre_norm = self._normalize_text(self.nombre)
-        self.ap_paterno_norm = self._normalize_text(self.ap_paterno)
-        self.ap_materno_norm = self._normalize_text(self.ap_materno)
+        self.normalizar_campos()
 
         # Llama al método save original para guardar el objeto
         super().save(*args, **kwargs)
 
+        # Mantiene al día el índice de búsqueda por nombre (FTS5 en SQLite; en PostgreSQL no hace nada)
+        motor_busqueda().indexar([self])
+
     def __str__(self):
         return f"{self.nombre} {self.ap_paterno}"
 
@@ -181,6 +228,62 @@ class RegistroAlergias(models.Model):
         return f"Alergia a {self.agente_especifico} ({self.categoria.nombre}) en {self.nino.nombre}"
     
     
+# --- QuerySets con el estado de alerta calculado en la base de datos ---
+class ControlQuerySet(VisibleParaQuerySet):
+    ruta_nino = 'nino'
+
+    def pendientes(self):
+        """
+        Controles no realizados y habilitados. Es exactamente la condición de los índices
+        parciales de Control, así que las consultas que parten de aquí pueden usarlos.
+        """
+        return self.filter(fecha_realizacion_control__isnull=True, deshabilitado=False)
+
+    def with_estado_alerta(self, hoy=None):
+        """
+        Anota 'estado_alerta_db' con la misma lógica de Control.estado_alerta, pero en SQL,
+        para poder filtrar, contar o agrupar por estado (ej. "Alerta Roja") en la BD.
+        El margen de cada control sale de su período (7 días si no tiene).
+        """
+        hoy = hoy or date.today()
+        margen = models.ExpressionWrapper(
+            models.Value(timedelta(days=1)) * Coalesce(models.F('periodo__dias_margen'), models.Value(7)),
+            output_field=models.DurationField(),
+        )
+        fecha_limite = models.ExpressionWrapper(
+            models.F('fecha_control_programada') + margen,
+            output_field=models.DateField(),
+        )
+        return self.alias(fecha_limite_alerta=fecha_limite).annotate(
+            estado_alerta_db=models.Case(
+                models.When(deshabilitado=True, then=models.Value("Deshabilitado")),
+                models.When(fecha_realizacion_control__isnull=False, then=models.Value("Realizado")),
+                models.When(fecha_control_programada__gte=hoy, then=models.Value("Al día")),
+                models.When(fecha_limite_alerta__gte=hoy, then=models.Value("Alerta Amarilla")),
+                default=models.Value("Alerta Roja"),
+                output_field=models.CharField(),
+            )
+        )
+
+
+class VacunaAplicadaQuerySet(VisibleParaQuerySet):
+    ruta_nino = 'nino'
+
+    def with_estado_alerta(self, hoy=None):
+        """Anota 'estado_alerta_db' con la lógica de VacunaAplicada.estado_alerta, en SQL."""
+        hoy = hoy or date.today()
+        return self.annotate(
+            estado_alerta_db=models.Case(
+                models.When(deshabilitado=True, then=models.Value("Deshabilitado")),
+                models.When(fecha_aplicacion__isnull=False, then=models.Value("Realizado")),
+                models.When(fecha_programada__gte=hoy, then=models.Value("Pendiente")),
+                models.When(fecha_programada__gte=hoy - timedelta(days=30), then=models.Value("Atrasado")),
+                default=models.Value("Muy Atrasado"),
+                output_field=models.CharField(),
+            )
+        )
+
+
 # --- Modelo Principal de Control ---
 class Control(models.Model):
     TIPO_CONTROL_CHOICES = [
@@ -260,8 +363,15 @@ class Control(models.Model):
 
     history = HistoricalRecords()
 
+    objects = ControlQuerySet.as_manager()
+
     @property
     def estado_alerta(self):
+        # Si el QuerySet ya lo calculó en la BD (with_estado_alerta), se reutiliza.
+        estado = getattr(self, 'estado_alerta_db', None)
+        if estado is not None:
+            return estado
+
         # --- NUEVA LÓGICA ---
         # 1. Si está deshabilitado, ese es su estado principal.
         if self.deshabilitado:
@@ -304,6 +414,24 @@ class Control(models.Model):
     class Meta:
         verbose_name = "Control del Niño"
         verbose_name_plural = "Controles de Niños"
+        indexes = [
+            # Calendario de un niño ordenado por fecha (vista de detalle y recálculos).
+            models.Index(fields=['nino', 'fecha_control_programada'], name='control_nino_fecha_idx'),
+            # Índices parciales sobre el subconjunto pendiente: solo contienen los controles
+            # no realizados y habilitados, así que son pequeños aunque el historial crezca.
+            # Los usan el reporte de atrasados (vista 'reportes') y 'enviar_alertas_controles'.
+            # En motores sin índices parciales Django simplemente no los crea.
+            models.Index(
+                fields=['fecha_control_programada'],
+                name='control_pendiente_fecha_idx',
+                condition=models.Q(fecha_realizacion_control__isnull=True, deshabilitado=False),
+            ),
+            models.Index(
+                fields=['fecha_control_programada'],
+                name='control_sin_notificar_idx',
+                condition=models.Q(fecha_realizacion_control__isnull=True, deshabilitado=False, notificacion_enviada=False),
+            ),
+        ]
 
     def __str__(self):
         return f"Control {self.nombre_control} para {self.nino.nombre}"
@@ -348,8 +476,15 @@ class VacunaAplicada(models.Model):
     via = models.CharField(max_length=10, choices=VIA_CHOICES, null=True, blank=True)
     fecha_inoculacion = models.DateField(null=True, blank=True)
 
+    objects = VacunaAplicadaQuerySet.as_manager()
+
     @property
     def estado_alerta(self):
+        # Si el QuerySet ya lo calculó en la BD (with_estado_alerta), se reutiliza.
+        estado = getattr(self, 'estado_alerta_db', None)
+        if estado is not None:
+            return estado
+
         # --- LÓGICA ACTUALIZADA ---
         if self.deshabilitado:
             return "Deshabilitado" # Prioridad 1
@@ -394,15 +529,197 @@ class EntregaAlimentos(models.Model):
         return f"Alimentos para {self.nino.nombre} en fecha {self.fecha_entrega}"
 
 class HistorialEnvioReporte(models.Model):
+    """
+    Registro de cada reporte de controles atrasados solicitado desde la vista 'reportes'.
+    También guarda el estado de su generación en segundo plano (ver control/reportes.py).
+    """
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_CURSO', 'Generando'),
+        ('COMPLETADO', 'Encolado para envío'),
+        ('ERROR', 'Error'),
+    ]
+    ESTADOS_EN_CURSO = ('PENDIENTE', 'EN_CURSO')
+
     id = models.AutoField(primary_key=True)
     fecha_envio = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Envío")
     enviado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, verbose_name="Enviado por")
     destinatarios = models.TextField(verbose_name="Destinatarios", help_text="Lista de correos a los que se envió el reporte, separados por coma.")
-    controles_reportados_count = models.IntegerField(verbose_name="Cantidad de Controles Reportados")
+    controles_reportados_count = models.IntegerField(default=0, verbose_name="Cantidad de Controles Reportados")
+    clave = models.CharField(max_length=255, blank=True, default='', help_text="Día y destinatarios del reporte; evita generar dos veces el mismo reporte a la vez.")
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='COMPLETADO')
+    mensaje_error = models.TextField(blank=True, null=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    correo = models.ForeignKey('OutboxEmail', on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name="Correo encolado")
 
     class Meta:
         verbose_name = "Historial de Envío de Reporte"
         verbose_name_plural = "Historial de Envíos de Reportes"
+        constraints = [
+            # Solo puede haber un reporte en curso por día y conjunto de destinatarios.
+            models.UniqueConstraint(
+                fields=['clave'],
+                condition=models.Q(estado__in=['PENDIENTE', 'EN_CURSO']),
+                name='reporte_unico_en_curso',
+            ),
+        ]
+
+    @property
+    def en_curso(self):
+        return self.estado in self.ESTADOS_EN_CURSO
+
+    def __str__(self):
+        return f"Reporte enviado por {self.enviado_por} el {self.fecha_envio.strftime('%d/%m/%Y %H:%M')}"
+
+class TareaRecalculo(models.Model):
+    """
+    Tarea de recálculo de calendarios encolada desde las pantallas de configuración.
+    La ejecuta el proceso 'run_scheduler', así la petición HTTP no queda bloqueada.
+    """
+    TIPO_CHOICES = [
+        ('CONTROLES', 'Recálculo de Controles'),
+        ('VACUNAS', 'Recálculo de Vacunas'),
+    ]
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_CURSO', 'En curso'),
+        ('COMPLETADA', 'Completada'),
+        ('ERROR', 'Error'),
+    ]
+
+    id = models.AutoField(primary_key=True)
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES, default='CONTROLES')
+    parametros = models.JSONField(default=dict, blank=True, help_text="Argumentos de la tarea, por ejemplo los IDs de los períodos modificados.")
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='PENDIENTE', db_index=True)
+    progreso = models.PositiveSmallIntegerField(default=0, help_text="Porcentaje de avance (0-100).")
+    filas_actualizadas = models.IntegerField(default=0)
+    filas_creadas = models.IntegerField(default=0)
+    mensaje_error = models.TextField(blank=True, null=True)
+    creado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Creado por")
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_actividad = models.DateTimeField(null=True, blank=True, help_text="Último avance registrado por el proceso que la ejecuta.")
+    intentos = models.PositiveSmallIntegerField(default=0, help_text="Veces que un proceso tomó la tarea.")
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Tarea de Recálculo"
+        verbose_name_plural = "Tareas de Recálculo"
+
+    @property
+    def finalizada(self):
+        return self.estado in ('COMPLETADA', 'ERROR')
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} #{self.id} ({self.get_estado_display()})"
+
+
+class OutboxEmail(models.Model):
+    """
+    Bandeja de salida persistente. Todos los correos del sistema se guardan aquí
+    y los envía el despachador del proceso 'run_scheduler', con reintentos.
+    """
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('ENVIANDO', 'Enviando'),
+        ('ENVIADO', 'Enviado'),
+        ('FALLIDO', 'Fallido'),
+    ]
+
+    id = models.AutoField(primary_key=True)
+    origen = models.CharField(max_length=50, blank=True, help_text="Funcionalidad que generó el correo (PNAC, reporte, alertas...).")
+    asunto = models.CharField(max_length=255)
+    cuerpo = models.TextField(blank=True)
+    cuerpo_html = models.TextField(blank=True, null=True)
+    remitente = models.CharField(max_length=254)
+    destinatarios = models.JSONField(default=list)
+    adjuntos = models.JSONField(default=list, blank=True, help_text="Lista de {nombre, mimetype, contenido (base64)}, o {nombre, mimetype, ruta} si el archivo está en disco.")
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='PENDIENTE')
+    intentos = models.PositiveSmallIntegerField(default=0)
+    max_intentos = models.PositiveSmallIntegerField(default=5)
+    proximo_intento = models.DateTimeField(default=timezone.now, help_text="No se intenta enviar antes de esta fecha. Mientras está ENVIANDO, marca el fin de la reserva.")
+    ultimo_error = models.TextField(blank=True, null=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_envio = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Correo en Bandeja de Salida"
+        verbose_name_plural = "Bandeja de Salida de Correos"
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento'], name='outbox_estado_prox_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.asunto} → {', '.join(self.destinatarios)} ({self.get_estado_display()})"
+
+
+class ResumenDiarioControles(models.Model):
+    """
+    Tabla de resumen (rollup) de Control para el Dashboard de Gestión: cuántos controles
+    hay por fecha programada × sector del niño × período × estado. La mantienen al día
+    las señales de Control (ver control/resumenes.py) y se reconstruye cada noche desde
+    'run_scheduler'. Hay una sola fila por combinación: los cambios suman sobre ella.
+    """
+    ESTADO_CHOICES = [
+        ('REALIZADO', 'Realizado'),
+        ('PENDIENTE', 'Pendiente'),
+        ('DESHABILITADO', 'Deshabilitado'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    fecha = models.DateField(help_text="Fecha programada de los controles.")
+    sector = models.CharField(max_length=50, blank=True, default='', help_text="Sector del niño ('' si no tiene).")
+    periodo = models.ForeignKey(PeriodoControl, on_delete=models.CASCADE, null=True, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES)
+    cantidad = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Resumen Diario de Controles"
+        verbose_name_plural = "Resúmenes Diarios de Controles"
+        indexes = [
+            models.Index(fields=['fecha', 'sector'], name='resumen_ctrl_fecha_idx'),
+        ]
+        constraints = [
+            # Una fila por combinación. En SQL dos NULL no chocan: sin período va en su propia restricción.
+            models.UniqueConstraint(
+                fields=['fecha', 'sector', 'periodo', 'estado'],
+                condition=models.Q(periodo__isnull=False),
+                name='resumen_ctrl_unico',
+            ),
+            models.UniqueConstraint(
+                fields=['fecha', 'sector', 'estado'],
+                condition=models.Q(periodo__isnull=True),
+                name='resumen_ctrl_unico_sin_periodo',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.sector or 'Sin sector'} {self.periodo_id} {self.estado}: {self.cantidad}"
+
+
+class HistorialArchivado(models.Model):
+    """
+    Versiones antiguas de un objeto sacadas de su tabla de historial (simple_history) por
+    el comando 'archivar_historial'. Cada fila guarda, comprimidas en gzip+JSON, las
+    versiones intermedias de UN objeto archivadas en una ejecución; la primera y la última
+    versión del objeto siempre quedan en la tabla de historial. Ver control/archivo_historial.py.
+    """
+    id = models.BigAutoField(primary_key=True)
+    modelo = models.CharField(max_length=100, help_text="Modelo de historial, p. ej. 'control.historicalcontrol'.")
+    objeto_id = models.CharField(max_length=100, help_text="Clave primaria del objeto original, como texto.")
+    fecha_desde = models.DateTimeField(help_text="Fecha de la versión archivada más antigua.")
+    fecha_hasta = models.DateTimeField(help_text="Fecha de la versión archivada más reciente.")
+    versiones = models.IntegerField(help_text="Cantidad de versiones guardadas en 'datos'.")
+    datos = models.BinaryField()
+    fecha_archivo = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Historial Archivado"
+        verbose_name_plural = "Historiales Archivados"
+        indexes = [
+            models.Index(fields=['modelo', 'objeto_id'], name='historial_arch_objeto_idx'),
+            models.Index(fields=['modelo', 'fecha_hasta'], name='historial_arch_fecha_idx'),
+        ]
 
     def __str__(self):
-        return f"Reporte enviado por {self.enviado_por} el {self.fecha_envio.strftime('%d/%m/%Y %H:%M')}"
\ No newline at end of file
+        return f"{self.modelo} #{self.objeto_id}: {self.versiones} versión(es) hasta {self.fecha_hasta:%d/%m/%Y}"
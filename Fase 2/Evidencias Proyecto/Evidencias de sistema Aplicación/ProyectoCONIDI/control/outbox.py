@@ -0,0 +1,225 @@
+# control/outbox.py
+
+import base64
+import logging
+import os
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import Case, F, PositiveSmallIntegerField, Q, When
+from django.utils import timezone
+
+from .correo import enviar_en_lotes
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+
+def _config(nombre, por_defecto):
+    return getattr(settings, nombre, por_defecto)
+
+
+def ruta_para_adjunto(nombre):
+    """
+    Ruta nueva en OUTBOX_ADJUNTOS_DIR para escribir un adjunto grande directo en disco
+    y encolarlo con 'archivos' (sin pasar su contenido por memoria ni por la BD).
+    """
+    directorio = Path(_config('OUTBOX_ADJUNTOS_DIR', Path(tempfile.gettempdir()) / 'conidi' / 'outbox_adjuntos'))
+    directorio.mkdir(parents=True, exist_ok=True)
+    return directorio / f'{uuid.uuid4().hex}_{nombre}'
+
+
+def _outbox_desde_mensaje(mensaje, origen, archivos=()):
+    """
+    Convierte un EmailMessage/EmailMultiAlternatives en una fila (sin guardar) de la
+    bandeja de salida. Conserva la versión HTML y los adjuntos para reconstruirlo al enviar.
+    'archivos' son adjuntos ya escritos en disco, (nombre, ruta, mimetype): se guarda solo su ruta.
+    """
+    cuerpo_html = None
+    for contenido, mimetype in getattr(mensaje, 'alternatives', []):
+        if mimetype == 'text/html':
+            cuerpo_html = contenido
+
+    adjuntos = []
+    for adjunto in mensaje.attachments:
+        nombre, contenido, mimetype = adjunto
+        if isinstance(contenido, str):
+            contenido = contenido.encode('utf-8')
+        adjuntos.append({
+            'nombre': nombre,
+            'mimetype': mimetype,
+            'contenido': base64.b64encode(contenido).decode('ascii'),
+        })
+    for nombre, ruta, mimetype in archivos:
+        adjuntos.append({'nombre': nombre, 'mimetype': mimetype, 'ruta': str(ruta)})
+
+    return OutboxEmail(
+        origen=origen,
+        asunto=mensaje.subject,
+        cuerpo=mensaje.body,
+        cuerpo_html=cuerpo_html,
+        remitente=mensaje.from_email or settings.DEFAULT_FROM_EMAIL,
+        destinatarios=list(mensaje.to),
+        adjuntos=adjuntos,
+        max_intentos=_config('OUTBOX_MAX_INTENTOS', 5),
+    )
+
+
+def encolar_correo(mensaje, origen='', archivos=()):
+    """Guarda un correo en la bandeja de salida en vez de enviarlo en línea."""
+    correo = _outbox_desde_mensaje(mensaje, origen, archivos)
+    correo.save()
+    return correo
+
+
+def encolar_correos(mensajes, origen=''):
+    """Encola muchos correos con INSERT masivos."""
+    return OutboxEmail.objects.bulk_create(
+        [_outbox_desde_mensaje(mensaje, origen) for mensaje in mensajes], batch_size=500
+    )
+
+
+def construir_mensaje(correo):
+    """Reconstruye el EmailMultiAlternatives a partir de una fila de la bandeja de salida."""
+    mensaje = EmailMultiAlternatives(
+        subject=correo.asunto,
+        body=correo.cuerpo,
+        from_email=correo.remitente,
+        to=correo.destinatarios,
+    )
+    if correo.cuerpo_html:
+        mensaje.attach_alternative(correo.cuerpo_html, 'text/html')
+    for adjunto in correo.adjuntos:
+        if 'ruta' in adjunto:
+            # El archivo se lee recién al enviar, un correo a la vez.
+            with open(adjunto['ruta'], 'rb') as archivo:
+                contenido = archivo.read()
+        else:
+            contenido = base64.b64decode(adjunto['contenido'])
+        mensaje.attach(adjunto['nombre'], contenido, adjunto['mimetype'])
+    return mensaje
+
+
+def _borrar_archivos(correos):
+    """Borra del disco los adjuntos de correos que ya no se van a enviar (enviados o fallidos)."""
+    for correo in correos:
+        for adjunto in correo.adjuntos:
+            if 'ruta' in adjunto:
+                try:
+                    os.remove(adjunto['ruta'])
+                except FileNotFoundError:
+                    pass
+
+
+def _reservar_correos(limite):
+    """
+    Reserva hasta 'limite' correos listos para enviar y los marca ENVIANDO.
+    La reserva vence a los OUTBOX_RESERVA_SEGUNDOS: si el proceso muere a mitad
+    de un envío, otra ejecución los vuelve a tomar y nada se pierde. Ese envío
+    interrumpido cuenta como un intento, así un correo que tumba al proceso no se
+    reintenta para siempre: al agotar max_intentos queda FALLIDO.
+    """
+    ahora = timezone.now()
+    interrumpidos = Q(estado='ENVIANDO', proximo_intento__lte=ahora)
+    agotados = list(OutboxEmail.objects.filter(interrumpidos, intentos__gte=F('max_intentos') - 1).only('id', 'adjuntos'))
+    if agotados:
+        OutboxEmail.objects.filter(interrumpidos, id__in=[correo.id for correo in agotados]).update(
+            estado='FALLIDO', intentos=F('intentos') + 1, ultimo_error='Envío interrumpido: se agotaron los intentos.'
+        )
+        _borrar_archivos(agotados)
+
+    disponibles = Q(estado='PENDIENTE', proximo_intento__lte=ahora) | interrumpidos
+    ids = list(
+        OutboxEmail.objects.filter(disponibles)
+        .order_by('proximo_intento', 'id')
+        .values_list('id', flat=True)[:limite]
+    )
+    if not ids:
+        return []
+
+    fin_reserva = ahora + timedelta(seconds=_config('OUTBOX_RESERVA_SEGUNDOS', 600))
+    # Filtramos de nuevo por las condiciones para no pisar una reserva hecha por otro proceso.
+    OutboxEmail.objects.filter(disponibles, id__in=ids).update(
+        estado='ENVIANDO',
+        proximo_intento=fin_reserva,
+        intentos=Case(
+            When(estado='ENVIANDO', then=F('intentos') + 1), default=F('intentos'), output_field=PositiveSmallIntegerField()
+        ),
+    )
+    return list(OutboxEmail.objects.filter(id__in=ids, estado='ENVIANDO', proximo_intento=fin_reserva))
+
+
+def _enviar_grupo(correos):
+    """
+    Se ejecuta en un hilo del pool: abre su propia conexión y envía su grupo de correos.
+    No toca la BD; los resultados se registran en el hilo principal.
+    """
+    mensajes = {}
+    no_construidos = []
+    for correo in correos:
+        try:
+            mensajes[construir_mensaje(correo)] = correo
+        except OSError as e:  # Adjunto en disco que ya no está o no se puede leer
+            no_construidos.append((correo, e))
+    enviados, fallidos = enviar_en_lotes(mensajes.keys(), reintentos=0, connection=get_connection())
+    return (
+        [mensajes[mensaje] for mensaje in enviados],
+        [(mensajes[mensaje], error) for mensaje, error in fallidos] + no_construidos,
+    )
+
+
+def despachar_outbox(max_workers=None, limite=None):
+    """
+    Envía los correos pendientes de la bandeja de salida en paralelo, con una
+    concurrencia acotada a 'max_workers' conexiones simultáneas.
+
+    Los fallidos se reprograman con espera exponencial hasta agotar max_intentos,
+    y entonces quedan en estado FALLIDO con el último error registrado.
+
+    Devuelve una tupla (enviados, reprogramados, fallidos).
+    """
+    max_workers = max_workers or _config('OUTBOX_MAX_WORKERS', 4)
+    limite = limite or _config('OUTBOX_LOTE', 200)
+    espera_base = _config('OUTBOX_REINTENTO_BASE_SEGUNDOS', 60)
+
+    correos = _reservar_correos(limite)
+    if not correos:
+        return 0, 0, 0
+
+    grupos = [correos[i::max_workers] for i in range(max_workers) if correos[i::max_workers]]
+    enviados = []
+    fallidos = []
+    with ThreadPoolExecutor(max_workers=len(grupos), thread_name_prefix='outbox') as pool:
+        for enviados_grupo, fallidos_grupo in pool.map(_enviar_grupo, grupos):
+            enviados.extend(enviados_grupo)
+            fallidos.extend(fallidos_grupo)
+
+    ahora = timezone.now()
+    if enviados:
+        OutboxEmail.objects.filter(id__in=[correo.id for correo in enviados]).update(
+            estado='ENVIADO', fecha_envio=ahora, ultimo_error=None
+        )
+        _borrar_archivos(enviados)
+
+    reprogramados = 0
+    definitivos = 0
+    for correo, error in fallidos:
+        correo.intentos += 1
+        correo.ultimo_error = str(error)
+        if correo.intentos >= correo.max_intentos:
+            correo.estado = 'FALLIDO'
+            definitivos += 1
+            _borrar_archivos([correo])
+            logger.error(f"Outbox: correo #{correo.id} a {', '.join(correo.destinatarios)} falló definitivamente: {error}")
+        else:
+            correo.estado = 'PENDIENTE'
+            correo.proximo_intento = ahora + timedelta(seconds=espera_base * (2 ** (correo.intentos - 1)))
+            reprogramados += 1
+        correo.save(update_fields=['estado', 'intentos', 'ultimo_error', 'proximo_intento'])
+
+    return len(enviados), reprogramados, definitivos
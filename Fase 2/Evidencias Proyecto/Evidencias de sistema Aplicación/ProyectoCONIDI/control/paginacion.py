@@ -0,0 +1,117 @@
+# control/paginacion.py
+
+import base64
+import json
+
+from django.db.models import Q
+
+
+class PaginaKeyset:
+    """Resultado de una página: los objetos y los cursores para moverse a la página vecina."""
+
+    def __init__(self, objetos, cursor_siguiente=None, cursor_anterior=None, fila_siguiente=None):
+        self.objetos = objetos
+        self.cursor_siguiente = cursor_siguiente
+        self.cursor_anterior = cursor_anterior
+        self.fila_siguiente = fila_siguiente
+
+    @property
+    def hay_siguiente(self):
+        return self.cursor_siguiente is not None
+
+    @property
+    def hay_anterior(self):
+        return self.cursor_anterior is not None
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self):
+        return len(self.objetos)
+
+
+def _valor_json(valor):
+    # Fechas y horas con precisión completa: el cursor debe calzar exacto con la columna.
+    return valor.isoformat()
+
+
+def codificar_cursor(valores):
+    return base64.urlsafe_b64encode(json.dumps(valores, default=_valor_json).encode('utf-8')).decode('ascii')
+
+
+def decodificar_cursor(cursor, cantidad):
+    """Devuelve la lista de valores del cursor, o None si viene vacío o alterado."""
+    if not cursor:
+        return None
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        return None
+    if not isinstance(valores, list) or len(valores) != cantidad:
+        return None
+    return valores
+
+
+def _condicion_keyset(campos, valores, hacia_adelante):
+    """
+    Arma la condición "fila > cursor" (o "<") sobre varias columnas:
+    (a > A) OR (a = A AND b > B) OR (a = A AND b = B AND c > C) ...
+    Un campo con '-' (orden descendente) invierte su comparación.
+    """
+    condicion = Q()
+    iguales = {}
+    for campo, valor in zip(campos, valores):
+        nombre = campo.lstrip('-')
+        operador = 'gt' if hacia_adelante != campo.startswith('-') else 'lt'
+        condicion |= Q(**iguales, **{f'{nombre}__{operador}': valor})
+        iguales[nombre] = valor
+    return condicion
+
+
+def _invertir_orden(campo):
+    return campo[1:] if campo.startswith('-') else f'-{campo}'
+
+
+def paginar_keyset(queryset, campos, tamano, despues=None, antes=None):
+    """
+    Paginación por cursor (keyset / seek) sobre 'campos', que deben ser NO nulos y
+    terminar en una columna única para que el orden sea total. Un campo con '-'
+    delante se ordena de forma descendente, igual que en order_by().
+
+    A diferencia de OFFSET, cada página cuesta lo mismo sin importar qué tan lejos esté,
+    siempre que exista un índice compuesto con esas columnas en ese orden.
+    'despues' y 'antes' son cursores obtenidos de una página anterior.
+
+    Al avanzar se lee una fila de más para saber si hay página siguiente; queda en
+    'fila_siguiente' (la primera fila de la página que sigue) por si el llamador la necesita.
+    """
+    valores_despues = decodificar_cursor(despues, len(campos))
+    valores_antes = decodificar_cursor(antes, len(campos)) if valores_despues is None else None
+
+    if valores_antes is not None:
+        # Hacia atrás: se recorre en orden inverso y luego se da vuelta la lista.
+        orden = [_invertir_orden(campo) for campo in campos]
+        filas = list(queryset.filter(_condicion_keyset(campos, valores_antes, False)).order_by(*orden)[:tamano + 1])
+        hay_mas = len(filas) > tamano
+        objetos = list(reversed(filas[:tamano]))
+        hay_siguiente = True
+        hay_anterior = hay_mas
+        fila_siguiente = None
+    else:
+        if valores_despues is not None:
+            queryset = queryset.filter(_condicion_keyset(campos, valores_despues, True))
+        filas = list(queryset.order_by(*campos)[:tamano + 1])
+        objetos = filas[:tamano]
+        hay_siguiente = len(filas) > tamano
+        hay_anterior = valores_despues is not None
+        fila_siguiente = filas[tamano] if hay_siguiente else None
+
+    def cursor_de(objeto):
+        return codificar_cursor([getattr(objeto, campo.lstrip('-')) for campo in campos])
+
+    return PaginaKeyset(
+        objetos,
+        cursor_siguiente=cursor_de(objetos[-1]) if objetos and hay_siguiente else None,
+        cursor_anterior=cursor_de(objetos[0]) if objetos and hay_anterior else None,
+        fila_siguiente=fila_siguiente,
+    )
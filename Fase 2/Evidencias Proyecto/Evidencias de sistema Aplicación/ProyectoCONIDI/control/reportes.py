@@ -0,0 +1,260 @@
+# control/reportes.py
+
+import csv
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db import IntegrityError, close_old_connections, connection
+from django.template.loader import render_to_string
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+from login.models import NinoTutor
+from .models import Control, HistorialEnvioReporte
+from .outbox import encolar_correo, ruta_para_adjunto
+
+logger = logging.getLogger(__name__)
+
+# Columnas del Excel del reporte de controles atrasados, en orden.
+COLUMNAS_REPORTE = [
+    'RUT Niño', 'Nombre Niño', 'Control Atrasado', 'Fecha Programada',
+    'Nombre Tutor', 'Parentesco', 'Email Tutor', 'Teléfono Tutor',
+]
+
+# Un único pool por proceso: por muchos clics simultáneos que haya, nunca se generan
+# más de REPORTES_MAX_WORKERS reportes a la vez.
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _config(nombre, por_defecto):
+    return getattr(settings, nombre, por_defecto)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_config('REPORTES_MAX_WORKERS', 2),
+                thread_name_prefix='reportes',
+            )
+        return _executor
+
+
+def _clave_reporte(dia, destinatarios):
+    return f"{dia.isoformat()}|{','.join(sorted(set(destinatarios)))}"[:255]
+
+
+def _liberar_reportes_colgados(clave):
+    """
+    Marca como ERROR los reportes de la misma clave que llevan demasiado tiempo 'en curso'
+    (por ejemplo, si el servidor se reinició a mitad de la generación), para no bloquear
+    nuevas solicitudes para siempre.
+    """
+    limite = timezone.now() - timedelta(minutes=_config('REPORTES_TIEMPO_MAXIMO_MINUTOS', 30))
+    HistorialEnvioReporte.objects.filter(
+        clave=clave, estado__in=HistorialEnvioReporte.ESTADOS_EN_CURSO, fecha_envio__lt=limite
+    ).update(estado='ERROR', mensaje_error='Generación interrumpida.', fecha_fin=timezone.now())
+
+
+def solicitar_reporte_atrasados(destinatarios, usuario=None):
+    """
+    Registra y programa la generación del reporte de controles atrasados.
+
+    Si ya hay un reporte en curso para hoy con los mismos destinatarios, no se crea otro.
+    Devuelve una tupla (historial, creado).
+    """
+    hoy = date.today()
+    clave = _clave_reporte(hoy, destinatarios)
+    _liberar_reportes_colgados(clave)
+
+    # La restricción única parcial 'reporte_unico_en_curso' resuelve la carrera entre
+    # dos solicitudes simultáneas, incluso si vienen de procesos distintos.
+    try:
+        historial = HistorialEnvioReporte.objects.create(
+            enviado_por=usuario,
+            destinatarios=", ".join(destinatarios),
+            clave=clave,
+            estado='PENDIENTE',
+        )
+    except IntegrityError:
+        en_curso = HistorialEnvioReporte.objects.filter(
+            clave=clave, estado__in=HistorialEnvioReporte.ESTADOS_EN_CURSO
+        ).first()
+        return en_curso, False
+
+    # Solo viajan al hilo valores simples: el hilo arma su propio QuerySet.
+    fecha_corte = hoy - timedelta(days=7)  # Atrasados por más de 7 días
+    _get_executor().submit(_ejecutar_reporte, historial.id, list(destinatarios), fecha_corte)
+    return historial, True
+
+
+def _ejecutar_reporte(historial_id, destinatarios, fecha_corte):
+    """Trabajo del pool: genera el reporte, lo deja en la bandeja de salida y registra el resultado."""
+    close_old_connections()
+    try:
+        HistorialEnvioReporte.objects.filter(pk=historial_id).update(estado='EN_CURSO')
+
+        email, total, excel = construir_correo_reporte_atrasados(destinatarios, fecha_corte)
+        correo = encolar_correo(email, origen='REPORTE_ATRASADOS', archivos=[excel])
+
+        HistorialEnvioReporte.objects.filter(pk=historial_id).update(
+            estado='COMPLETADO',
+            controles_reportados_count=total,
+            correo=correo,
+            fecha_fin=timezone.now(),
+        )
+        logger.info(f"Reporte de controles atrasados #{historial_id} encolado para: {', '.join(destinatarios)}")
+    except Exception as e:
+        logger.exception(f"Error al generar el reporte de controles atrasados #{historial_id}")
+        HistorialEnvioReporte.objects.filter(pk=historial_id).update(
+            estado='ERROR', mensaje_error=str(e), fecha_fin=timezone.now()
+        )
+    finally:
+        # Los hilos del pool se reutilizan: cerramos su conexión para no dejarla abierta.
+        connection.close()
+
+
+def consulta_reporte_atrasados(fecha_corte):
+    """Controles pendientes anteriores a 'fecha_corte', con sus tutores (usa 'control_pendiente_fecha_idx')."""
+    return (
+        Control.objects.pendientes()
+        .filter(fecha_control_programada__lt=fecha_corte)
+        .order_by('nino__ap_paterno', 'nino__nombre', 'id', 'nino__ninotutor__id')
+        .values_list(
+            'id', 'nombre_control', 'fecha_control_programada',
+            'nino__rut_nino', 'nino__nombre', 'nino__ap_paterno', 'nino__ap_materno',
+            'nino__ninotutor__parentesco', 'nino__ninotutor__tutor__nombre_completo',
+            'nino__ninotutor__tutor__email', 'nino__ninotutor__tutor__telefono',
+        )
+    )
+
+
+def _filas_reporte_atrasados(fecha_corte):
+    """
+    Genera las filas del reporte (una tupla por control atrasado) sin cargar todo en memoria.
+
+    Una sola consulta con LEFT JOIN a los tutores, leída con iterator(). Un niño con
+    varios tutores repite el control en filas consecutivas; nos quedamos con la primera,
+    que corresponde al primer tutor asignado (como el antiguo 'ninotutor_set.first()').
+    """
+    parentescos = dict(NinoTutor.PARENTESCO_CHOICES)
+    filas = consulta_reporte_atrasados(fecha_corte).iterator(chunk_size=_config('REPORTES_CHUNK_SIZE', 2000))
+
+    ultimo_id = None
+    for (control_id, nombre_control, fecha_programada, rut, nombre, ap_paterno, ap_materno,
+         parentesco, tutor_nombre, tutor_email, tutor_telefono) in filas:
+        if control_id == ultimo_id:
+            continue
+        ultimo_id = control_id
+        yield (
+            rut,
+            f"{nombre} {ap_paterno} {ap_materno or ''}".strip(),
+            nombre_control,
+            fecha_programada,
+            tutor_nombre or 'No asignado',
+            parentescos.get(parentesco, parentesco) if parentesco else 'N/A',
+            tutor_email or 'No disponible',
+            tutor_telefono or 'No disponible',
+        )
+
+
+def _escribir_excel_reporte(filas, destino):
+    """
+    Escribe el Excel del reporte en 'destino' (ruta, archivo o buffer) y devuelve cuántas filas escribió.
+
+    El modo write-only de openpyxl necesita los anchos de columna antes de la primera fila,
+    así que se hacen dos pasadas: la primera vuelca las filas a un CSV temporal en disco
+    mientras calcula el ancho de cada columna; la segunda lee ese CSV y escribe el Excel
+    en streaming. La memoria usada no depende de la cantidad de filas.
+    """
+    anchos = [len(columna) for columna in COLUMNAS_REPORTE]
+    total = 0
+    with tempfile.TemporaryFile(mode='w+', newline='', encoding='utf-8') as volcado:
+        escritor = csv.writer(volcado)
+        for fila in filas:
+            fila = [valor.strftime('%d-%m-%Y') if isinstance(valor, date) else valor for valor in fila]
+            escritor.writerow(fila)
+            for i, valor in enumerate(fila):
+                if len(valor) > anchos[i]:
+                    anchos[i] = len(valor)
+            total += 1
+
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet('Controles Atrasados')
+        for i, ancho in enumerate(anchos, start=1):
+            worksheet.column_dimensions[get_column_letter(i)].width = ancho + 2  # Pequeño margen
+
+        worksheet.append(COLUMNAS_REPORTE)
+        volcado.seek(0)
+        for fila in csv.reader(volcado):
+            worksheet.append(fila)
+        workbook.save(destino)
+    return total
+
+
+def construir_correo_reporte_atrasados(destinatarios, fecha_corte):
+    """
+    Arma el correo del reporte de controles atrasados (anteriores a 'fecha_corte').
+
+    El Excel completo se escribe directo en disco (OUTBOX_ADJUNTOS_DIR) y no se adjunta
+    al correo: se devuelve como (nombre, ruta, mimetype) para encolarlo con
+    encolar_correo(..., archivos=[excel]), que guarda solo su ruta.
+    Devuelve una tupla (correo, cantidad de controles, excel).
+    """
+    today = date.today()
+    fecha_reporte_str = today.strftime("%d/%m/%Y")
+    asunto = f'Reporte de Controles Atrasados - {fecha_reporte_str}'
+
+    # --- 1. Generar el Excel en streaming, directo al archivo que se adjuntará ---
+    filas_en_correo = _config('REPORTES_FILAS_EN_CORREO', 100)
+    muestra = []
+
+    def filas_con_muestra():
+        for fila in _filas_reporte_atrasados(fecha_corte):
+            if len(muestra) < filas_en_correo:
+                muestra.append(fila)
+            yield fila
+
+    nombre_archivo = f'Reporte_Atrasados_{today.strftime("%Y-%m-%d")}.xlsx'
+    ruta_excel = ruta_para_adjunto(nombre_archivo)
+    try:
+        total = _escribir_excel_reporte(filas_con_muestra(), ruta_excel)
+    except Exception:
+        ruta_excel.unlink(missing_ok=True)
+        raise
+
+    # --- 2. Construir el correo ---
+    # El cuerpo HTML muestra solo las primeras filas; el detalle completo va en el Excel.
+    controles_atrasados = [
+        {
+            'nino': {'rut_nino': fila[0], 'nombre_completo': fila[1]},
+            'nombre_control': fila[2],
+            'fecha_control_programada': fila[3].strftime('%d/%m/%Y'),
+        }
+        for fila in muestra
+    ]
+    mensaje_html = render_to_string('control/reportes_mail/email_reporte_atrasados.html', {
+        'controles_atrasados': controles_atrasados,
+        'total_controles': total,
+        'fecha_reporte': fecha_reporte_str,
+    })
+
+    # Usamos EmailMultiAlternatives para poder adjuntar archivos
+    email = EmailMultiAlternatives(
+        subject=asunto,
+        body="Este es un correo HTML. Si no puede verlo, por favor active la vista HTML en su cliente de correo.",
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=destinatarios
+    )
+    email.attach_alternative(mensaje_html, "text/html")
+
+    excel = (nombre_archivo, ruta_excel, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    return email, total, excel
@@ -0,0 +1,217 @@
+# control/resumenes.py
+"""
+Mantenimiento de ResumenDiarioControles, la tabla de resumen que lee el Dashboard de Gestión.
+
+- Incremental: las señales de Control (pre_save/post_save/pre_delete/post_delete) restan
+  1 a la combinación anterior del control y suman 1 a la nueva.
+- En bloque: los cambios de calendario que no pasan por save() suman sus deltas con
+  'sumar_conteos': los calendarios nuevos de 'generar_calendarios' (executemany) vía
+  'sumar_controles_de_ninos' y el recálculo incremental de períodos (fecha anterior y nueva).
+- Completo: 'reconstruir_resumen_controles' vuelve a sumar desde Control, por rango de
+  fechas. Lo usa el recálculo completo de 'recalcular_controles' y lo ejecuta cada noche
+  'run_scheduler', que corrige lo que quede fuera (p. ej. cambios de sector de un niño).
+- Verificación: 'comparar_resumen_controles' (comando 'verificar_resumen_controles').
+"""
+
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Control, Nino, ResumenDiarioControles
+
+TAMANO_LOTE = 1000
+
+_en_pausa = contextvars.ContextVar('resumen_en_pausa', default=False)
+
+# Mismo criterio que estado_resumen(), en SQL.
+ESTADO_RESUMEN = models.Case(
+    models.When(deshabilitado=True, then=models.Value('DESHABILITADO')),
+    models.When(fecha_realizacion_control__isnull=False, then=models.Value('REALIZADO')),
+    default=models.Value('PENDIENTE'),
+    output_field=models.CharField(),
+)
+
+
+def estado_resumen(deshabilitado, fecha_realizacion_control):
+    if deshabilitado:
+        return 'DESHABILITADO'
+    if fecha_realizacion_control:
+        return 'REALIZADO'
+    return 'PENDIENTE'
+
+
+def clave_control(control, sector):
+    """Combinación (fecha, sector, periodo_id, estado) en la que se cuenta un control."""
+    return (
+        control.fecha_control_programada,
+        sector or '',
+        control.periodo_id,
+        estado_resumen(control.deshabilitado, control.fecha_realizacion_control),
+    )
+
+
+def _filtro_clave(fecha, sector, periodo_id, estado):
+    return ResumenDiarioControles.objects.filter(fecha=fecha, sector=sector, periodo_id=periodo_id, estado=estado)
+
+
+@contextmanager
+def resumen_en_pausa():
+    """
+    Dentro del bloque las señales de Control no tocan el resumen. Para cambios masivos que
+    luego lo reconstruyen (p. ej. 'recalcular_controles'): evita una consulta por fila.
+    """
+    token = _en_pausa.set(True)
+    try:
+        yield
+    finally:
+        _en_pausa.reset(token)
+
+
+def resumen_pausado():
+    return _en_pausa.get()
+
+
+def sumar_en_resumen(clave, delta):
+    """Suma 'delta' a la fila de la combinación; si no existe y delta es positivo, la crea."""
+    fecha, sector, periodo_id, estado = clave
+    filas = _filtro_clave(fecha, sector, periodo_id, estado)
+    with transaction.atomic():
+        if filas.update(cantidad=F('cantidad') + delta) or delta <= 0:
+            return
+        # Si otra transacción creó la fila entre medio, el INSERT se ignora y se suma sobre la suya.
+        ResumenDiarioControles.objects.bulk_create(
+            [ResumenDiarioControles(fecha=fecha, sector=sector, periodo_id=periodo_id, estado=estado, cantidad=0)],
+            ignore_conflicts=True,
+        )
+        filas.update(cantidad=F('cantidad') + delta)
+
+
+def sector_de_nino(nino_id):
+    return Nino.objects.filter(pk=nino_id).values_list('sector', flat=True).first()
+
+
+def _controles_en_rango(desde=None, hasta=None, controles=None):
+    controles = Control.objects.all() if controles is None else controles
+    if desde:
+        controles = controles.filter(fecha_control_programada__gte=desde)
+    if hasta:
+        controles = controles.filter(fecha_control_programada__lte=hasta)
+    return controles
+
+
+def _resumen_en_rango(desde=None, hasta=None):
+    resumen = ResumenDiarioControles.objects.all()
+    if desde:
+        resumen = resumen.filter(fecha__gte=desde)
+    if hasta:
+        resumen = resumen.filter(fecha__lte=hasta)
+    return resumen
+
+
+def agregar_controles(desde=None, hasta=None, controles=None):
+    """Cuenta los controles por combinación directamente desde Control (un solo GROUP BY)."""
+    filas = (
+        _controles_en_rango(desde, hasta, controles)
+        .annotate(estado_resumen=ESTADO_RESUMEN, sector_resumen=Coalesce('nino__sector', models.Value('')))
+        .values('fecha_control_programada', 'sector_resumen', 'periodo_id', 'estado_resumen')
+        .annotate(cantidad=Count('id'))
+        .order_by()
+    )
+    return Counter({
+        (fila['fecha_control_programada'], fila['sector_resumen'], fila['periodo_id'], fila['estado_resumen']): fila['cantidad']
+        for fila in filas
+    })
+
+
+def leer_resumen(desde=None, hasta=None):
+    """Suma la tabla de resumen por combinación (descarta las que quedaron en 0)."""
+    filas = (
+        _resumen_en_rango(desde, hasta)
+        .values('fecha', 'sector', 'periodo_id', 'estado')
+        .annotate(total=Sum('cantidad'))
+        .order_by()
+    )
+    return Counter({
+        (fila['fecha'], fila['sector'], fila['periodo_id'], fila['estado']): fila['total']
+        for fila in filas if fila['total']
+    })
+
+
+def sumar_conteos(conteos):
+    """
+    Suma cada delta de 'conteos' ({(fecha, sector, periodo_id, estado): delta}, p. ej. un
+    Counter) a la fila de su combinación, con unas pocas consultas en bloque. Las
+    combinaciones que aún no tienen fila se crean. Devuelve la cantidad de filas escritas.
+    """
+    conteos = {clave: delta for clave, delta in conteos.items() if delta}
+    if not conteos:
+        return 0
+    with transaction.atomic():
+        # Primero se asegura una fila (en 0) por combinación y luego se suma con UPDATE,
+        # así no se pisan los cambios que las señales hagan a la vez sobre las mismas filas.
+        ResumenDiarioControles.objects.bulk_create(
+            [
+                ResumenDiarioControles(fecha=fecha, sector=sector, periodo_id=periodo_id, estado=estado, cantidad=0)
+                for (fecha, sector, periodo_id, estado), delta in conteos.items() if delta > 0
+            ],
+            batch_size=TAMANO_LOTE,
+            ignore_conflicts=True,
+        )
+        fechas = sorted({fecha for fecha, _, _, _ in conteos})
+        filas = []
+        for i in range(0, len(fechas), TAMANO_LOTE):
+            for fila in ResumenDiarioControles.objects.filter(fecha__in=fechas[i:i + TAMANO_LOTE]).only(
+                'fecha', 'sector', 'periodo_id', 'estado'
+            ):
+                delta = conteos.get((fila.fecha, fila.sector, fila.periodo_id, fila.estado))
+                if delta:
+                    fila.cantidad = F('cantidad') + delta
+                    filas.append(fila)
+        ResumenDiarioControles.objects.bulk_update(filas, ['cantidad'], batch_size=TAMANO_LOTE)
+    return len(filas)
+
+
+def sumar_controles_de_ninos(nino_ids):
+    """
+    Suma al resumen todos los controles de los niños indicados (un GROUP BY y sumar_conteos).
+    Pensado para niños recién creados: sus controles aún no están contados.
+    Devuelve la cantidad de filas de resumen escritas.
+    """
+    return sumar_conteos(agregar_controles(controles=Control.objects.filter(nino_id__in=nino_ids)))
+
+
+def reconstruir_resumen_controles(desde=None, hasta=None):
+    """
+    Reemplaza el resumen del rango indicado (todo si no se indica) por uno calculado
+    desde Control. Devuelve la cantidad de filas de resumen escritas.
+    """
+    conteos = agregar_controles(desde, hasta)
+    with transaction.atomic():
+        _resumen_en_rango(desde, hasta).delete()
+        ResumenDiarioControles.objects.bulk_create(
+            [
+                ResumenDiarioControles(fecha=fecha, sector=sector, periodo_id=periodo_id, estado=estado, cantidad=cantidad)
+                for (fecha, sector, periodo_id, estado), cantidad in conteos.items()
+            ],
+            batch_size=TAMANO_LOTE,
+        )
+    return len(conteos)
+
+
+def comparar_resumen_controles(desde=None, hasta=None):
+    """
+    Compara el resumen con los datos de Control. Devuelve una lista ordenada de
+    (clave, cantidad_en_control, cantidad_en_resumen) con las combinaciones que no cuadran.
+    """
+    esperado = agregar_controles(desde, hasta)
+    registrado = leer_resumen(desde, hasta)
+    diferencias = [
+        (clave, esperado.get(clave, 0), registrado.get(clave, 0))
+        for clave in esperado.keys() | registrado.keys()
+        if esperado.get(clave, 0) != registrado.get(clave, 0)
+    ]
+    return sorted(diferencias, key=lambda d: (d[0][0], d[0][1], d[0][2] or 0, d[0][3]))
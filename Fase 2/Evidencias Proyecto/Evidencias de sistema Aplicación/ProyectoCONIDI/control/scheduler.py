@@ -1,9 +1,14 @@
 # control/scheduler.py
 
 from django.core.management import call_command
+from django_apscheduler.util import close_old_connections
 import logging
 from io import StringIO
 
+from control.tareas import procesar_tareas_pendientes
+from control.outbox import despachar_outbox
+from control.resumenes import reconstruir_resumen_controles
+
 logger = logging.getLogger(__name__)
 
 def enviar_alertas_job():
@@ -19,4 +24,33 @@ def enviar_alertas_job():
             logger.error(f"Scheduler: Errores del comando 'enviar_alertas_controles':\n{stderr_buffer.getvalue()}")
         logger.info("Scheduler: Tarea 'enviar_alertas_job' completada.")
     except Exception as e:
-        logger.error(f"Scheduler: Error inesperado al ejecutar 'enviar_alertas_job': {e}", exc_info=True)
\ No newline at end of file
+        logger.error(f"Scheduler: Error inesperado al ejecutar 'enviar_alertas_job': {e}", exc_info=True)
+
+@close_old_connections
+def procesar_tareas_recalculo_job():
+    """Toma de la cola las tareas de recálculo encoladas desde las vistas de configuración."""
+    try:
+        procesadas = procesar_tareas_pendientes()
+        if procesadas:
+            logger.info(f"Scheduler: {procesadas} tarea(s) de recálculo procesada(s).")
+    except Exception as e:
+        logger.error(f"Scheduler: Error inesperado al procesar tareas de recálculo: {e}", exc_info=True)
+
+@close_old_connections
+def despachar_outbox_job():
+    """Envía los correos acumulados en la bandeja de salida (OutboxEmail)."""
+    try:
+        enviados, reprogramados, fallidos = despachar_outbox()
+        if enviados or reprogramados or fallidos:
+            logger.info(f"Scheduler: Outbox -> {enviados} enviados, {reprogramados} reprogramados, {fallidos} fallidos.")
+    except Exception as e:
+        logger.error(f"Scheduler: Error inesperado al despachar la bandeja de salida: {e}", exc_info=True)
+
+@close_old_connections
+def reconstruir_resumenes_job():
+    """Reconstruye el resumen diario de controles del Dashboard de Gestión desde Control."""
+    try:
+        filas = reconstruir_resumen_controles()
+        logger.info(f"Scheduler: Resumen diario de controles reconstruido ({filas} filas).")
+    except Exception as e:
+        logger.error(f"Scheduler: Error inesperado al reconstruir el resumen de controles: {e}", exc_info=True)
@@ -1,53 +1,79 @@
 # control/signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
-from dateutil.relativedelta import relativedelta
 
 # Importamos todos los modelos que vamos a necesitar
-from .models import Nino, Control, PeriodoControl, Vacuna, VacunaAplicada
+from .models import Nino, Control
+from .calendario import generar_calendarios
+from .busqueda import motor_busqueda
+from .resumenes import clave_control, estado_resumen, resumen_pausado, sector_de_nino, sumar_en_resumen
 
 @receiver(post_save, sender=Nino)
-def crear_calendario_controles(sender, instance, created, **kwargs):
+def crear_calendarios(sender, instance, created, **kwargs):
     """
     Esta función se ejecuta cuando se guarda un Nino.
-    Si es nuevo (created=True), genera su calendario de controles.
+    Si es nuevo (created=True), genera su calendario de controles y de vacunación 💉
+    con inserciones en bloque dentro de una sola transacción.
     """
     if created:
-        print(f"Nuevo niño detectado: {instance.nombre}. Generando calendario de controles...")
-        todos_los_periodos = PeriodoControl.objects.all()
-
-        for periodo in todos_los_periodos:
-            fecha_programada = instance.fecha_nacimiento + relativedelta(months=periodo.mes_control)
-            
-            Control.objects.create(
-                nino=instance,
-                periodo=periodo,
-                nombre_control=periodo.nombre_mes_control,
-                fecha_control_programada=fecha_programada,
-                estado_control="Pendiente"
-            )
-        print(f"Calendario de controles para {instance.nombre} generado.")
+        print(f"Nuevo niño detectado: {instance.nombre}. Generando calendarios...")
+        controles_creados, vacunas_creadas = generar_calendarios([instance])
+        print(f"Calendarios para {instance.nombre} generados: {controles_creados} controles y {vacunas_creadas} vacunas.")
 
+@receiver(post_delete, sender=Nino)
+def quitar_de_busqueda(sender, instance, **kwargs):
+    """Saca al niño eliminado del índice de búsqueda por nombre."""
+    motor_busqueda().eliminar([instance.rut_nino])
 
-@receiver(post_save, sender=Nino)
-def crear_calendario_vacunacion(sender, instance, created, **kwargs):
-    """
-    Esta función también se ejecuta cuando se guarda un Nino.
-    Si es nuevo (created=True), genera su calendario de vacunación. 💉
-    """
-    if created:
-        print(f"Generando calendario de vacunación para {instance.nombre}...")
-        # Obtenemos solo las vacunas que tienen un mes de aplicación definido
-        vacunas_programadas = Vacuna.objects.filter(meses_programada__isnull=False)
-
-        for vacuna in vacunas_programadas:
-            fecha_programada = instance.fecha_nacimiento + relativedelta(months=vacuna.meses_programada)
-
-            # Creamos el registro de 'VacunaAplicada' como pendiente
-            VacunaAplicada.objects.create(
-                nino=instance,
-                vacuna=vacuna,
-                fecha_programada=fecha_programada
-                # Los demás campos (fecha_aplicacion, dosis, etc.) se quedan vacíos por defecto
-            )
-        print(f"Calendario de vacunación para {instance.nombre} generado.")
\ No newline at end of file
+
+@receiver(pre_save, sender=Control)
+def recordar_clave_resumen(sender, instance, raw=False, **kwargs):
+    """Guarda en qué combinación del resumen diario estaba contado el control antes del cambio."""
+    instance._clave_resumen_anterior = None
+    instance._sector_resumen = None
+    if raw or instance.pk is None or resumen_pausado():
+        return
+    anterior = Control.objects.filter(pk=instance.pk).values(
+        'nino_id', 'nino__sector', 'fecha_control_programada', 'periodo_id',
+        'deshabilitado', 'fecha_realizacion_control',
+    ).first()
+    if anterior is None:
+        return
+    instance._clave_resumen_anterior = (
+        anterior['fecha_control_programada'],
+        anterior['nino__sector'] or '',
+        anterior['periodo_id'],
+        estado_resumen(anterior['deshabilitado'], anterior['fecha_realizacion_control']),
+    )
+    if anterior['nino_id'] == instance.nino_id:
+        instance._sector_resumen = anterior['nino__sector'] or ''
+
+@receiver(post_save, sender=Control)
+def actualizar_resumen_al_guardar(sender, instance, raw=False, **kwargs):
+    """Mueve el control de su combinación anterior a la nueva en ResumenDiarioControles."""
+    if raw or resumen_pausado():
+        return
+    sector = getattr(instance, '_sector_resumen', None)
+    if sector is None:
+        sector = sector_de_nino(instance.nino_id)
+    anterior = getattr(instance, '_clave_resumen_anterior', None)
+    nueva = clave_control(instance, sector)
+    if anterior == nueva:
+        return
+    if anterior is not None:
+        sumar_en_resumen(anterior, -1)
+    sumar_en_resumen(nueva, 1)
+
+@receiver(pre_delete, sender=Control)
+def recordar_clave_resumen_al_eliminar(sender, instance, **kwargs):
+    # El sector se lee antes de borrar: si se elimina el niño, su fila aún existe aquí.
+    if resumen_pausado():
+        instance._clave_resumen_anterior = None
+        return
+    instance._clave_resumen_anterior = clave_control(instance, sector_de_nino(instance.nino_id))
+
+@receiver(post_delete, sender=Control)
+def actualizar_resumen_al_eliminar(sender, instance, **kwargs):
+    clave = getattr(instance, '_clave_resumen_anterior', None)
+    if clave is not None:
+        sumar_en_resumen(clave, -1)
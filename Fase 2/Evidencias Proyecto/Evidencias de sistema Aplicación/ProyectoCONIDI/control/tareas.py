@@ -0,0 +1,119 @@
+# control/tareas.py
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Nino, PeriodoControl, TareaRecalculo, Vacuna
+from .calendario import recalcular_controles_periodos, recalcular_vacunas
+
+logger = logging.getLogger(__name__)
+
+
+def encolar_recalculo_controles(periodo_ids, usuario=None):
+    """Registra una tarea pendiente para recalcular los controles de los períodos dados."""
+    return TareaRecalculo.objects.create(
+        tipo='CONTROLES',
+        parametros={'periodos': list(periodo_ids)},
+        creado_por=usuario,
+    )
+
+
+def encolar_recalculo_vacunas(vacuna_ids, usuario=None):
+    """Registra una tarea pendiente para recalcular el calendario de las vacunas dadas."""
+    return TareaRecalculo.objects.create(
+        tipo='VACUNAS',
+        parametros={'vacunas': list(vacuna_ids)},
+        creado_por=usuario,
+    )
+
+
+def _config(nombre, por_defecto):
+    return getattr(settings, nombre, por_defecto)
+
+
+def _tareas_disponibles(ahora):
+    """
+    Pendientes, o EN_CURSO sin avance en TAREAS_RESERVA_MINUTOS: el proceso que la
+    tenía murió a mitad del recálculo (que se puede repetir sin problema) y se retoma.
+    """
+    vencida = ahora - timedelta(minutes=_config('TAREAS_RESERVA_MINUTOS', 30))
+    return Q(estado='PENDIENTE') | Q(estado='EN_CURSO', fecha_actividad__lt=vencida)
+
+
+def tomar_siguiente_tarea():
+    """
+    Reserva la tarea disponible más antigua y la marca EN_CURSO.
+    El UPDATE condicionado al estado evita que dos workers tomen la misma tarea.
+    Una tarea interrumpida TAREAS_MAX_INTENTOS veces queda en ERROR en vez de retomarse.
+    """
+    max_intentos = _config('TAREAS_MAX_INTENTOS', 3)
+    while True:
+        ahora = timezone.now()
+        disponibles = _tareas_disponibles(ahora)
+        TareaRecalculo.objects.filter(disponibles, estado='EN_CURSO', intentos__gte=max_intentos).update(
+            estado='ERROR', fecha_fin=ahora,
+            mensaje_error=f'La tarea se interrumpió {max_intentos} veces sin terminar.',
+        )
+        tarea = TareaRecalculo.objects.filter(disponibles).order_by('fecha_creacion', 'id').first()
+        if tarea is None:
+            return None
+        reservada = TareaRecalculo.objects.filter(disponibles, pk=tarea.pk).update(
+            estado='EN_CURSO', fecha_inicio=ahora, fecha_actividad=ahora, progreso=0, intentos=F('intentos') + 1
+        )
+        if reservada:
+            tarea.refresh_from_db()
+            if tarea.intentos > 1:
+                logger.warning(f"Tarea de recálculo #{tarea.pk} interrumpida; se retoma (intento {tarea.intentos}).")
+            return tarea
+
+
+def ejecutar_tarea(tarea):
+    """Ejecuta una tarea ya reservada, registrando avance, conteos y errores."""
+    total_ninos = Nino.objects.count() or 1
+
+    def actualizar_progreso(procesados, actualizados, creados):
+        TareaRecalculo.objects.filter(pk=tarea.pk).update(
+            progreso=min(99, procesados * 100 // total_ninos),
+            fecha_actividad=timezone.now(),
+            filas_actualizadas=actualizados,
+            filas_creadas=creados,
+        )
+
+    try:
+        if tarea.tipo == 'CONTROLES':
+            periodos = PeriodoControl.objects.filter(pk__in=tarea.parametros.get('periodos', []))
+            actualizados, creados = recalcular_controles_periodos(periodos, progreso=actualizar_progreso)
+        elif tarea.tipo == 'VACUNAS':
+            vacunas = Vacuna.objects.filter(pk__in=tarea.parametros.get('vacunas', []))
+            actualizados, creados = recalcular_vacunas(vacunas, progreso=actualizar_progreso)
+        else:
+            raise ValueError(f"Tipo de tarea desconocido: {tarea.tipo}")
+    except Exception as e:
+        logger.error(f"Tarea de recálculo #{tarea.pk} falló: {e}", exc_info=True)
+        tarea.estado = 'ERROR'
+        tarea.mensaje_error = str(e)
+        tarea.fecha_fin = timezone.now()
+        tarea.save(update_fields=['estado', 'mensaje_error', 'fecha_fin'])
+        return tarea
+
+    tarea.estado = 'COMPLETADA'
+    tarea.progreso = 100
+    tarea.filas_actualizadas = actualizados
+    tarea.filas_creadas = creados
+    tarea.fecha_fin = timezone.now()
+    tarea.save(update_fields=['estado', 'progreso', 'filas_actualizadas', 'filas_creadas', 'fecha_fin'])
+    logger.info(f"Tarea de recálculo #{tarea.pk} completada: {actualizados} actualizados, {creados} creados.")
+    return tarea
+
+
+def procesar_tareas_pendientes():
+    """Ejecuta, una tras otra, todas las tareas pendientes de la cola."""
+    procesadas = 0
+    while (tarea := tomar_siguiente_tarea()) is not None:
+        ejecutar_tarea(tarea)
+        procesadas += 1
+    return procesadas
@@ -1,3 +1,1122 @@
-from django.test import TestCase
+from datetime import date, timedelta
+import json
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from openpyxl import load_workbook
+from django.core import mail
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+from simple_history.utils import bulk_update_with_history
+
+from control.management.commands import enviar_alertas_controles
+from control.management.commands.enviar_alertas_controles import controles_por_notificar
+from control import bi
+from control.archivo_historial import archivar_historial, archivos_de
+from control.busqueda import TABLA_FTS, motor_busqueda
+from control.calendario import (
+    construir_controles, construir_vacunas, generar_calendarios, guardar_controles, guardar_vacunas,
+    recalcular_controles_periodos, recalcular_vacunas,
+)
+from control.correo import enviar_en_lotes
+from control.dataset import digitos_verificadores, generar_dataset, sumar_meses
+from control.exportacion import EXPORTACIONES, trozos_csv
+from control.historial import pagina_historial
+from control.importacion import validar_ruts
+from control.middleware import MetricasPeticionMiddleware
+from control.models import (
+    CategoriaAlergia, Ciudad, Comuna, Control, HistorialArchivado, Nino, OutboxEmail, PeriodoControl, Region, RegistroAlergias,
+    ResumenDiarioControles, TareaRecalculo, Vacuna, VacunaAplicada,
+)
+from control.outbox import _reservar_correos, despachar_outbox, encolar_correo
+from control.paginacion import paginar_keyset
+from control.reportes import construir_correo_reporte_atrasados, consulta_reporte_atrasados
+from control.resumenes import comparar_resumen_controles
+from control.tareas import encolar_recalculo_controles, procesar_tareas_pendientes, tomar_siguiente_tarea
+from login.models import NinoTutor, Rol, Tutor, Usuario
+from login.views import validar_rut
 
 # Create your tests here.
+
+
+def crear_comuna():
+    region = Region.objects.create(nom_region='Región de prueba')
+    ciudad = Ciudad.objects.create(nom_ciudad='Ciudad de prueba', region=region)
+    return Comuna.objects.create(nom_comuna='Comuna de prueba', ciudad=ciudad)
+
+
+def crear_nino(rut, comuna, fecha_nacimiento=date(2024, 1, 1), **campos):
+    return Nino.objects.create(
+        rut_nino=rut, nombre=campos.pop('nombre', 'Niño'), ap_paterno=campos.pop('ap_paterno', 'Prueba'),
+        fecha_nacimiento=fecha_nacimiento, sexo=campos.pop('sexo', 'Masculino'), direccion='Calle 1',
+        comuna=comuna, **campos,
+    )
+
+
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'EXPLAIN solo se verifica en SQLite y PostgreSQL.')
+class IndicesControlesAtrasadosTests(TestCase):
+    """Las consultas de controles atrasados deben usar los índices parciales de Control."""
+
+    def plan(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Con tablas casi vacías PostgreSQL prefiere un Seq Scan; lo desactivamos
+            # para comprobar que el índice es utilizable por la consulta.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_alertas_usan_indice_sin_notificar(self):
+        plan = self.plan(controles_por_notificar(date.today()))
+        self.assertIn('control_sin_notificar_idx', plan)
+
+    def test_reporte_usa_indice_pendientes(self):
+        plan = self.plan(consulta_reporte_atrasados(date.today() - timedelta(days=7)))
+        self.assertIn('control_pendiente_fecha_idx', plan)
+
+
+class DetalleNinoConsultasTests(TestCase):
+    """La ficha del niño se arma con un número fijo de consultas, sin importar cuántos registros tenga."""
+
+    # Sesión + usuario + niño + controles + vacunas + alergias.
+    CONSULTAS_FICHA = 6
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(nom_region='Región de prueba')
+        ciudad = Ciudad.objects.create(nom_ciudad='Ciudad de prueba', region=region)
+        cls.comuna = Comuna.objects.create(nom_comuna='Comuna de prueba', ciudad=ciudad)
+        cls.periodos = [
+            PeriodoControl.objects.create(mes_control=mes, nombre_mes_control=f'{mes} meses') for mes in range(1, 13)
+        ]
+        cls.vacunas = [Vacuna.objects.create(nom_vacuna=f'Vacuna {i}') for i in range(12)]
+        cls.categoria = CategoriaAlergia.objects.create(nombre='Alimentaria')
+        rol = Rol.objects.create(nombre_rol='Administrador', descripcion='Administrador')
+        cls.usuario = Usuario.objects.create_user('11111111-1', 'admin@conidi.cl', 'Admin Prueba', rol, 'clave')
+
+    def crear_nino(self, rut, cantidad):
+        nino = Nino.objects.create(
+            rut_nino=rut, nombre='Niño', ap_paterno='Prueba', fecha_nacimiento=date(2024, 1, 1),
+            sexo='Masculino', direccion='Calle 1', comuna=self.comuna,
+        )
+        nino.controles.all().delete()
+        nino.vacunas_aplicadas.all().delete()
+        for i in range(cantidad):
+            fecha = date(2024, 2, 1) + timedelta(days=30 * i)
+            Control.objects.create(
+                nino=nino, nombre_control=f'Control {i}', periodo=self.periodos[i],
+                fecha_control_programada=fecha, fecha_realizacion_control=fecha if i % 2 else None,
+                estado_control='Pendiente',
+            )
+            VacunaAplicada.objects.create(nino=nino, vacuna=self.vacunas[i], fecha_programada=fecha)
+            RegistroAlergias.objects.create(
+                nino=nino, categoria=self.categoria, agente_especifico=f'Agente {i}', fecha_aparicion=fecha,
+            )
+        return nino
+
+    def consultas_ficha(self, nino):
+        self.client.force_login(self.usuario)
+        with self.assertNumQueries(self.CONSULTAS_FICHA):
+            respuesta = self.client.get(reverse('control:detalle_nino', kwargs={'nino_rut': nino.rut_nino}))
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta
+
+    def test_consultas_constantes(self):
+        for rut, cantidad in (('1-9', 1), ('2-7', 12)):
+            with self.subTest(cantidad=cantidad):
+                respuesta = self.consultas_ficha(self.crear_nino(rut, cantidad))
+                self.assertEqual(len(respuesta.context['controles']), cantidad)
+                self.assertEqual(len(respuesta.context['vacunas_aplicadas']), cantidad)
+                self.assertEqual(len(respuesta.context['alergias_registradas']), cantidad)
+
+    def test_ultimo_control_en_memoria(self):
+        respuesta = self.consultas_ficha(self.crear_nino('3-5', 6))
+        # Los controles impares están realizados; el más reciente es el de índice 5.
+        self.assertEqual(respuesta.context['ultimo_control'].nombre_control, 'Control 5')
+
+
+class ValidarRutsTests(SimpleTestCase):
+    """La validación vectorizada de la importación debe coincidir con login.views.validar_rut."""
+
+    def test_coincide_con_validar_rut(self):
+        ruts = [
+            '12.345.678-5', '12345678-5', '12345678-4', '7.654.321-6', '7654321-k', '11111111-1',
+            '1-9', '', 'abc', '123456789-0', '19.000.003-K', '19000003-k', '5.126.663-3',
+        ]
+        normalizados, validos = validar_ruts(pd.Series(ruts))
+        for rut, normalizado, valido in zip(ruts, normalizados, validos):
+            with self.subTest(rut=rut):
+                self.assertEqual(bool(valido), validar_rut(rut))
+                if valido:
+                    self.assertEqual(normalizado, rut.upper().replace('.', ''))
+
+
+class ExportacionTests(TestCase):
+    """El CSV de exportación trae una fila por registro y, con 'desde', solo lo modificado."""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(nom_region='Región de prueba')
+        ciudad = Ciudad.objects.create(nom_ciudad='Ciudad de prueba', region=region)
+        comuna = Comuna.objects.create(nom_comuna='Comuna de prueba', ciudad=ciudad)
+        periodo = PeriodoControl.objects.create(mes_control=1, nombre_mes_control='1 mes')
+        for rut in ('1-9', '2-7'):
+            nino = Nino.objects.create(
+                rut_nino=rut, nombre='Niño', ap_paterno='Prueba', fecha_nacimiento=date(2024, 1, 1),
+                sexo='Femenino', direccion='Calle 1', comuna=comuna,
+            )
+            nino.controles.all().delete()
+            Control.objects.create(
+                nino=nino, nombre_control='Control 1 mes', periodo=periodo,
+                fecha_control_programada=date(2024, 2, 1), estado_control='Pendiente',
+            )
+
+    def lineas(self, desde=None, filas_por_trozo=None):
+        texto = ''.join(trozos_csv(EXPORTACIONES['controles'], desde, filas_por_trozo))
+        return texto.splitlines()
+
+    def test_exporta_controles_con_datos_del_nino(self):
+        lineas = self.lineas(filas_por_trozo=1)
+        self.assertEqual(lineas[0].split(','), EXPORTACIONES['controles'].encabezados)
+        self.assertEqual(len(lineas), 3)
+        self.assertIn('1-9,Femenino,2024-01-01,Comuna de prueba', lineas[1])
+
+    def test_incremental_desde_historial(self):
+        desde = timezone.now()
+        self.assertEqual(len(self.lineas(desde)), 1)  # Solo el encabezado
+        control = Control.objects.get(nino_id='2-7')
+        control.observaciones = 'Editado'
+        control.save()
+        lineas = self.lineas(desde)
+        self.assertEqual(len(lineas), 2)
+        self.assertIn('2-7', lineas[1])
+
+    def descargar(self, **parametros):
+        rol_admin = Rol.objects.create(nombre_rol='Administrador', descripcion='Administrador')
+        usuario = Usuario.objects.create_user('22222222-2', 'admin@conidi.cl', 'Admin Prueba', rol_admin, 'clave')
+        self.client.force_login(usuario)
+        return self.client.get(reverse('control:exportar_datos'), {'tabla': 'controles', **parametros})
+
+    def test_formato_desconocido(self):
+        self.assertEqual(self.descargar(formato='xlsx').status_code, 400)
+
+    @override_settings(EXPORTACION_PARQUET_MAX_FILAS=1)
+    def test_parquet_web_limitado(self):
+        respuesta = self.descargar(formato='parquet')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, 'admite hasta 1 filas')
+        self.assertTrue(EXPORTACIONES['controles'].supera(1))
+        self.assertFalse(EXPORTACIONES['controles'].supera(2))
+
+
+class GenerarDatasetTests(TestCase):
+    """El generador calcula fechas y RUT igual que el resto del sistema y es reproducible con la semilla."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for mes in (0, 1, 2, 6, 18):
+            PeriodoControl.objects.create(mes_control=mes, nombre_mes_control=f'{mes} meses')
+        Vacuna.objects.create(nom_vacuna='BCG', meses_programada=0)
+        Vacuna.objects.create(nom_vacuna='Hexavalente', meses_programada=2)
+
+    def test_sumar_meses_como_relativedelta(self):
+        nacimientos = [date(2024, 1, 31), date(2024, 2, 29), date(2023, 8, 31), date(2025, 12, 15)]
+        meses = [1, 6, 12, 13, 25]
+        resultado = sumar_meses(np.array(nacimientos, dtype='datetime64[D]')[:, None], meses)
+        for i, nacimiento in enumerate(nacimientos):
+            for j, mes in enumerate(meses):
+                self.assertEqual(resultado[i, j].astype(object), nacimiento + relativedelta(months=mes))
+
+    def test_ruts_validos(self):
+        cuerpos = np.array([12345678, 7654321, 19000003, 11111111, 5126663])
+        for cuerpo, dv in zip(cuerpos, digitos_verificadores(cuerpos)):
+            self.assertTrue(validar_rut(f'{cuerpo}-{dv}'))
+
+    def generar(self):
+        generar_dataset(30, semilla=5, tamano_bloque=20, hoy=date(2026, 1, 1))
+        return list(Control.objects.order_by('nino_id', 'periodo__mes_control').values_list(
+            'nino_id', 'fecha_control_programada', 'fecha_realizacion_control', 'pesokg',
+        ))
+
+    def test_reproducible_con_la_semilla(self):
+        primera = self.generar()
+        self.assertEqual(len(primera), 30 * 5)
+        self.assertEqual(VacunaAplicada.objects.count(), 30 * 2)
+        self.assertEqual(Control.history.count(), 30 * 5)
+        Nino.objects.all().delete()
+        self.assertEqual(self.generar(), primera)
+
+
+class TareasRecalculoTests(TestCase):
+    """La cola de recálculo ejecuta lo encolado y retoma las tareas de un proceso que murió."""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(nom_region='Región de prueba')
+        ciudad = Ciudad.objects.create(nom_ciudad='Ciudad de prueba', region=region)
+        comuna = Comuna.objects.create(nom_comuna='Comuna de prueba', ciudad=ciudad)
+        cls.periodo = PeriodoControl.objects.create(mes_control=1, nombre_mes_control='1 mes')
+        cls.nino = Nino.objects.create(
+            rut_nino='1-9', nombre='Niño', ap_paterno='Prueba', fecha_nacimiento=date(2024, 1, 31),
+            sexo='Masculino', direccion='Calle 1', comuna=comuna,
+        )
+
+    def test_encolar_y_ejecutar(self):
+        self.periodo.mes_control = 2
+        self.periodo.save()
+        tarea = encolar_recalculo_controles([self.periodo.id])
+        self.assertEqual(tarea.estado, 'PENDIENTE')
+        self.assertEqual(procesar_tareas_pendientes(), 1)
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.progreso, tarea.intentos), ('COMPLETADA', 100, 1))
+        control = Control.objects.get(nino=self.nino, periodo=self.periodo)
+        self.assertEqual(control.fecha_control_programada, date(2024, 3, 31))
+        self.assertEqual(procesar_tareas_pendientes(), 0)
+
+    def test_en_curso_con_avance_reciente_no_se_toma(self):
+        tarea = encolar_recalculo_controles([self.periodo.id])
+        self.assertEqual(tomar_siguiente_tarea().pk, tarea.pk)
+        self.assertIsNone(tomar_siguiente_tarea())
+
+    def test_reserva_vencida_se_retoma(self):
+        tarea = encolar_recalculo_controles([self.periodo.id])
+        tomar_siguiente_tarea()
+        hace_una_hora = timezone.now() - timedelta(hours=1)
+        TareaRecalculo.objects.filter(pk=tarea.pk).update(fecha_actividad=hace_una_hora)
+        retomada = tomar_siguiente_tarea()
+        self.assertEqual((retomada.pk, retomada.estado, retomada.intentos), (tarea.pk, 'EN_CURSO', 2))
+
+    def test_interrumpida_demasiadas_veces_queda_en_error(self):
+        tarea = encolar_recalculo_controles([self.periodo.id])
+        hace_una_hora = timezone.now() - timedelta(hours=1)
+        TareaRecalculo.objects.filter(pk=tarea.pk).update(estado='EN_CURSO', fecha_actividad=hace_una_hora, intentos=3)
+        self.assertIsNone(tomar_siguiente_tarea())
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, 'ERROR')
+
+
+class AlertasControlesTests(TestCase):
+    """El comando de alertas agrupa por tutor leyendo los controles en bloques acotados."""
+
+    @classmethod
+    def setUpTestData(cls):
+        comuna = crear_comuna()
+        for mes in (1, 2):
+            PeriodoControl.objects.create(mes_control=mes, nombre_mes_control=f'{mes} meses')
+        madre = Tutor.objects.create(rut='11111111-1', nombre_completo='Madre Prueba', email='madre@conidi.cl')
+        padre = Tutor.objects.create(rut='22222222-2', nombre_completo='Padre Prueba', email='padre@conidi.cl')
+        for rut, tutores in (('1-9', [madre]), ('2-7', [madre, padre]), ('3-5', [])):
+            nino = crear_nino(rut, comuna)
+            for tutor in tutores:
+                NinoTutor.objects.create(nino=nino, tutor=tutor)
+
+    def test_un_correo_por_tutor(self):
+        # Bloques de 2 controles: los 6 atrasados se leen en 3 consultas con su precarga.
+        with mock.patch.object(enviar_alertas_controles, 'TAMANO_BLOQUE_CONSULTA', 2):
+            call_command('enviar_alertas_controles', stdout=StringIO())
+        self.assertEqual(OutboxEmail.objects.count(), 2)
+        # Los controles del niño sin tutor quedan sin notificar.
+        self.assertEqual(list(controles_por_notificar(date.today()).values_list('nino_id', flat=True)), ['3-5', '3-5'])
+
+        self.assertEqual(despachar_outbox(), (2, 0, 0))
+        destinatarios = sorted(mensaje.to[0] for mensaje in mail.outbox)
+        self.assertEqual(destinatarios, ['madre@conidi.cl', 'padre@conidi.cl'])
+        correo_madre = next(mensaje for mensaje in mail.outbox if mensaje.to == ['madre@conidi.cl'])
+        html = correo_madre.alternatives[0][0]
+        self.assertIn('1-9', html)
+        self.assertIn('2-7', html)
+
+    def test_no_repite_notificaciones(self):
+        call_command('enviar_alertas_controles', stdout=StringIO())
+        salida = StringIO()
+        call_command('enviar_alertas_controles', stdout=salida)
+        self.assertEqual(OutboxEmail.objects.count(), 2)
+        self.assertIn('Se encolaron 0 correos', salida.getvalue())
+
+
+class LocmemQueFalla(LocmemEmailBackend):
+    """Backend locmem que falla al enviar a 'falla@conidi.cl' y cuenta las llamadas a send_messages."""
+
+    llamadas = 0
+
+    def send_messages(self, messages):
+        LocmemQueFalla.llamadas += 1
+        if any('falla@conidi.cl' in mensaje.to for mensaje in messages):
+            raise ConnectionError('Servidor rechazó el mensaje')
+        return super().send_messages(messages)
+
+
+class EnvioEnLotesTests(SimpleTestCase):
+    """enviar_en_lotes envía cada lote con una sola llamada y reintenta de a uno si el lote falla."""
+
+    def setUp(self):
+        mail.outbox = []
+        LocmemQueFalla.llamadas = 0
+
+    def mensajes(self, *destinatarios):
+        return [EmailMessage('Asunto', 'Cuerpo', 'conidi@conidi.cl', [destinatario]) for destinatario in destinatarios]
+
+    def enviar(self, mensajes):
+        conexion = get_connection(f'{LocmemQueFalla.__module__}.LocmemQueFalla')
+        return enviar_en_lotes(mensajes, tamano_lote=2, pausa_entre_lotes=0, reintentos=1, espera_reintento=0, connection=conexion)
+
+    def test_un_send_messages_por_lote(self):
+        mensajes = self.mensajes(*[f'tutor{i}@conidi.cl' for i in range(5)])
+        enviados, fallidos = self.enviar(mensajes)
+        self.assertEqual((len(enviados), fallidos), (5, []))
+        self.assertEqual(LocmemQueFalla.llamadas, 3)
+        self.assertEqual([mensaje.to for mensaje in mail.outbox], [mensaje.to for mensaje in mensajes])
+
+    def test_lote_fallido_se_reintenta_de_a_uno(self):
+        mensajes = self.mensajes('a@conidi.cl', 'falla@conidi.cl', 'b@conidi.cl')
+        enviados, fallidos = self.enviar(mensajes)
+        self.assertEqual([mensaje.to[0] for mensaje in enviados], ['a@conidi.cl', 'b@conidi.cl'])
+        self.assertEqual([mensaje.to[0] for mensaje, error in fallidos], ['falla@conidi.cl'])
+        # Lote 1 (falla) + 'a' + 'falla' dos veces (1 reintento) + lote 2.
+        self.assertEqual(LocmemQueFalla.llamadas, 5)
+
+
+class OutboxTests(TestCase):
+    """La bandeja de salida envía con el backend configurado, reprograma fallos y no reintenta para siempre."""
+
+    def setUp(self):
+        self.correo = encolar_correo(EmailMessage('Asunto', 'Cuerpo', 'conidi@conidi.cl', ['tutor@conidi.cl']), 'PRUEBA')
+
+    def interrumpir(self):
+        """Simula un proceso que reservó el correo y murió antes de registrar el resultado."""
+        _reservar_correos(10)
+        OutboxEmail.objects.filter(pk=self.correo.pk).update(proximo_intento=timezone.now() - timedelta(seconds=1))
+
+    def test_envia_pendientes(self):
+        self.assertEqual(despachar_outbox(), (1, 0, 0))
+        self.assertEqual(mail.outbox[0].to, ['tutor@conidi.cl'])
+        self.correo.refresh_from_db()
+        self.assertEqual((self.correo.estado, self.correo.intentos), ('ENVIADO', 0))
+        self.assertEqual(despachar_outbox(), (0, 0, 0))
+
+    @override_settings(EMAIL_BACKEND=f'{LocmemQueFalla.__module__}.LocmemQueFalla')
+    def test_fallo_se_reprograma(self):
+        OutboxEmail.objects.filter(pk=self.correo.pk).update(destinatarios=['falla@conidi.cl'])
+        self.assertEqual(despachar_outbox(), (0, 1, 0))
+        self.correo.refresh_from_db()
+        self.assertEqual((self.correo.estado, self.correo.intentos), ('PENDIENTE', 1))
+        self.assertGreater(self.correo.proximo_intento, timezone.now())
+
+    def test_reserva_vencida_cuenta_como_intento(self):
+        self.interrumpir()
+        self.assertEqual(despachar_outbox(), (1, 0, 0))
+        self.correo.refresh_from_db()
+        self.assertEqual((self.correo.estado, self.correo.intentos), ('ENVIADO', 1))
+
+    def test_interrumpido_hasta_agotar_intentos_queda_fallido(self):
+        OutboxEmail.objects.filter(pk=self.correo.pk).update(max_intentos=2)
+        self.interrumpir()
+        self.interrumpir()
+        self.assertEqual(despachar_outbox(), (0, 0, 0))
+        self.assertEqual(mail.outbox, [])
+        self.correo.refresh_from_db()
+        self.assertEqual((self.correo.estado, self.correo.intentos), ('FALLIDO', 2))
+
+
+class ReporteAtrasadosTests(TestCase):
+    """El Excel del reporte se escribe en disco y viaja por la bandeja de salida solo como ruta."""
+
+    @classmethod
+    def setUpTestData(cls):
+        PeriodoControl.objects.create(mes_control=1, nombre_mes_control='1 mes')
+        nino = crear_nino('1-9', crear_comuna(), fecha_nacimiento=date(2024, 1, 1))
+        tutor = Tutor.objects.create(rut='11111111-1', nombre_completo='Madre Prueba', email='madre@conidi.cl')
+        NinoTutor.objects.create(nino=nino, tutor=tutor)
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(OUTBOX_ADJUNTOS_DIR=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def test_excel_adjunto_por_ruta(self):
+        email, total, excel = construir_correo_reporte_atrasados(['jefe@conidi.cl'], date.today())
+        self.assertEqual(total, 1)
+        self.assertIn('01/02/2024', email.alternatives[0][0])
+        correo = encolar_correo(email, 'REPORTE_ATRASADOS', archivos=[excel])
+        adjunto, = OutboxEmail.objects.get(pk=correo.pk).adjuntos
+        self.assertNotIn('contenido', adjunto)
+        self.assertTrue(excel[1].exists())
+
+        self.assertEqual(despachar_outbox(), (1, 0, 0))
+        nombre, contenido, mimetype = mail.outbox[0].attachments[0]
+        self.assertEqual(nombre, excel[0])
+        filas = list(load_workbook(BytesIO(contenido), read_only=True).active.values)
+        self.assertEqual(filas[1][:5], ('1-9', 'Niño Prueba', '1 mes', '01-02-2024', 'Madre Prueba'))
+        # Enviado el correo, el archivo ya no hace falta.
+        self.assertFalse(excel[1].exists())
+
+
+class PaginacionKeysetTests(TestCase):
+    """Los cursores recorren el orden completo hacia adelante y hacia atrás, con empates y campos descendentes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        comuna = crear_comuna()
+        # Apellidos y fechas repetidos: el RUT desempata.
+        datos = [
+            ('1-9', 'Soto', date(2024, 3, 1)), ('2-7', 'Araya', date(2024, 1, 1)), ('3-5', 'Soto', date(2024, 1, 1)),
+            ('4-3', 'Araya', date(2024, 3, 1)), ('5-1', 'Soto', date(2024, 2, 1)), ('6-K', 'Muñoz', date(2024, 1, 1)),
+            ('7-8', 'Araya', date(2024, 2, 1)),
+        ]
+        for rut, apellido, nacimiento in datos:
+            crear_nino(rut, comuna, fecha_nacimiento=nacimiento, ap_paterno=apellido)
+
+    def recorrer(self, campos, tamano):
+        """Avanza página a página hasta el final y luego retrocede; devuelve ambas listas de páginas."""
+        consulta = Nino.objects.all()
+        adelante = [paginar_keyset(consulta, campos, tamano)]
+        while adelante[-1].hay_siguiente:
+            adelante.append(paginar_keyset(consulta, campos, tamano, despues=adelante[-1].cursor_siguiente))
+        atras = [adelante[-1]]
+        while atras[-1].hay_anterior:
+            atras.append(paginar_keyset(consulta, campos, tamano, antes=atras[-1].cursor_anterior))
+        ruts = lambda paginas: [[nino.rut_nino for nino in pagina] for pagina in paginas]
+        return ruts(adelante), ruts(reversed(atras))
+
+    def test_orden_con_empates(self):
+        esperado = list(Nino.objects.order_by('ap_paterno', 'rut_nino').values_list('rut_nino', flat=True))
+        adelante, atras = self.recorrer(['ap_paterno', 'rut_nino'], 3)
+        self.assertEqual([rut for pagina in adelante for rut in pagina], esperado)
+        self.assertEqual([len(pagina) for pagina in adelante], [3, 3, 1])
+        self.assertEqual(atras, adelante)
+
+    def test_campo_descendente(self):
+        esperado = list(Nino.objects.order_by('-fecha_nacimiento', 'rut_nino').values_list('rut_nino', flat=True))
+        adelante, atras = self.recorrer(['-fecha_nacimiento', 'rut_nino'], 2)
+        self.assertEqual([rut for pagina in adelante for rut in pagina], esperado)
+        self.assertEqual(atras, adelante)
+
+    def test_cursor_alterado_vuelve_al_inicio(self):
+        pagina = paginar_keyset(Nino.objects.all(), ['rut_nino'], 3, despues='no-es-un-cursor')
+        self.assertEqual([nino.rut_nino for nino in pagina], ['1-9', '2-7', '3-5'])
+        self.assertFalse(pagina.hay_anterior)
+
+
+class EstadoAlertaTests(TestCase):
+    """La anotación SQL with_estado_alerta debe coincidir con la propiedad estado_alerta en los bordes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.nino = crear_nino('1-9', crear_comuna())
+        cls.vacuna = Vacuna.objects.create(nom_vacuna='BCG', meses_programada=0)
+        hoy = date.today()
+        # Alrededor de hoy y de los márgenes (3 días, 7 por defecto sin período, 30 en vacunas).
+        cls.desfases = [-31, -30, -29, -8, -7, -6, -4, -3, -2, -1, 0, 1]
+        for margen, periodo in ((3, PeriodoControl.objects.create(mes_control=1, nombre_mes_control='1 mes', dias_margen=3)), (7, None)):
+            for dias in cls.desfases:
+                Control.objects.create(
+                    nino=cls.nino, periodo=periodo, nombre_control=f'{margen}/{dias}',
+                    fecha_control_programada=hoy + timedelta(days=dias), estado_control='Pendiente',
+                )
+        for dias in cls.desfases:
+            VacunaAplicada.objects.create(nino=cls.nino, vacuna=cls.vacuna, fecha_programada=hoy + timedelta(days=dias))
+        Control.objects.create(
+            nino=cls.nino, nombre_control='Realizado', fecha_control_programada=hoy - timedelta(days=20),
+            fecha_realizacion_control=hoy - timedelta(days=19), estado_control='Realizado',
+        )
+        Control.objects.create(
+            nino=cls.nino, nombre_control='Deshabilitado', fecha_control_programada=hoy - timedelta(days=20),
+            fecha_realizacion_control=hoy, deshabilitado=True, estado_control='Deshabilitado',
+        )
+        VacunaAplicada.objects.create(nino=cls.nino, vacuna=cls.vacuna, fecha_programada=hoy - timedelta(days=40), fecha_aplicacion=hoy)
+        VacunaAplicada.objects.create(nino=cls.nino, vacuna=cls.vacuna, fecha_programada=hoy - timedelta(days=40), deshabilitado=True)
+
+    def comparar(self, modelo):
+        anotados = {objeto.pk: objeto.estado_alerta_db for objeto in modelo.objects.filter(nino=self.nino).with_estado_alerta()}
+        en_python = {objeto.pk: objeto.estado_alerta for objeto in modelo.objects.filter(nino=self.nino).select_related()}
+        self.assertEqual(anotados, en_python)
+        return set(anotados.values())
+
+    def test_controles(self):
+        estados = self.comparar(Control)
+        self.assertEqual(estados, {'Al día', 'Alerta Amarilla', 'Alerta Roja', 'Realizado', 'Deshabilitado'})
+
+    def test_vacunas(self):
+        estados = self.comparar(VacunaAplicada)
+        self.assertEqual(estados, {'Pendiente', 'Atrasado', 'Muy Atrasado', 'Realizado', 'Deshabilitado'})
+
+
+class BusquedaNinosTests(TestCase):
+    """La búsqueda por nombre filtra dentro del alcance del rol, sin tope, y sigue los cambios del niño."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.comuna = crear_comuna()
+        cls.propio = crear_nino('1-9', cls.comuna, nombre='Sofía', ap_paterno='González', ap_materno='Soto')
+        crear_nino('2-7', cls.comuna, nombre='Sofía', ap_paterno='Pérez')
+        crear_nino('3-5', cls.comuna, nombre='Mateo', ap_paterno='González')
+        rol_tutor = Rol.objects.create(nombre_rol='Tutor', descripcion='Tutor')
+        rol_admin = Rol.objects.create(nombre_rol='Administrador', descripcion='Administrador')
+        cls.usuario_tutor = Usuario.objects.create_user('11111111-1', 'madre@conidi.cl', 'Madre Prueba', rol_tutor, 'clave')
+        tutor = Tutor.objects.create(rut='11111111-1', nombre_completo='Madre Prueba', email='madre@conidi.cl', usuario=cls.usuario_tutor)
+        NinoTutor.objects.create(nino=cls.propio, tutor=tutor)
+        cls.usuario_admin = Usuario.objects.create_user('22222222-2', 'admin@conidi.cl', 'Admin Prueba', rol_admin, 'clave')
+
+    def ruts(self, texto, ninos=None):
+        coincidencias = motor_busqueda().filtrar(ninos if ninos is not None else Nino.objects.all(), texto)
+        return sorted(coincidencias.values_list('rut_nino', flat=True))
+
+    def test_todas_las_palabras_como_prefijo(self):
+        self.assertEqual(self.ruts('sofi'), ['1-9', '2-7'])
+        self.assertEqual(self.ruts('SOFÍA gonz'), ['1-9'])
+        self.assertEqual(self.ruts('gonzalez'), ['1-9', '3-5'])
+        self.assertEqual(self.ruts('   '), [])
+
+    def test_sigue_cambios_y_eliminaciones(self):
+        self.propio.ap_paterno = 'Rojas'
+        self.propio.save()
+        self.assertEqual(self.ruts('gonzalez'), ['3-5'])
+        self.assertEqual(self.ruts('rojas'), ['1-9'])
+        Nino.objects.get(pk='3-5').delete()
+        self.assertEqual(self.ruts('gonzalez'), [])
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT rut_nino FROM {TABLA_FTS} ORDER BY rut_nino')
+                self.assertEqual([fila[0] for fila in cursor.fetchall()], ['1-9', '2-7'])
+
+    def listar(self, usuario, nombre, por_pagina=50):
+        self.client.force_login(usuario)
+        respuesta = self.client.get(reverse('control:listar_ninos'), {'nombre': nombre, 'por_pagina': por_pagina})
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta
+
+    def test_sin_tope_y_dentro_del_alcance_del_tutor(self):
+        # Muchos niños más relevantes que el del tutor para 'gonzalez' (el apellido aparece dos veces).
+        otros = []
+        for i in range(250):
+            nino = Nino(
+                rut_nino=f'{100 + i}-0', nombre='Gonzalo', ap_paterno='González', ap_materno='González',
+                fecha_nacimiento=date(2024, 1, 1), sexo='Masculino', direccion='Calle 1', comuna=self.comuna,
+            )
+            nino.normalizar_campos()
+            otros.append(nino)
+        Nino.objects.bulk_create(otros)
+        motor_busqueda().indexar(otros, nuevos=True)
+
+        respuesta = self.listar(self.usuario_admin, 'gonzalez', por_pagina=200)
+        self.assertEqual(respuesta.context['total_ninos'], 252)
+        primera = [nino.rut_nino for nino in respuesta.context['ninos']]
+        # La segunda página sigue el cursor sobre la relevancia y trae el resto, sin repetir.
+        segunda = self.client.get(reverse('control:listar_ninos') + respuesta.context['url_siguiente'])
+        ruts = primera + [nino.rut_nino for nino in segunda.context['ninos']]
+        self.assertEqual((len(primera), len(ruts), len(set(ruts))), (200, 252, 252))
+        self.assertEqual(sorted(ruts[-2:]), ['1-9', '3-5'])  # Los menos relevantes, al final
+
+        respuesta = self.listar(self.usuario_tutor, 'gonzalez')
+        self.assertEqual(respuesta.context['total_ninos'], 1)
+        self.assertEqual([nino.rut_nino for nino in respuesta.context['ninos']], ['1-9'])
+
+    @override_settings(NINOS_CONTEO_MAXIMO=2)
+    def test_total_con_tope(self):
+        respuesta = self.listar(self.usuario_admin, '')
+        self.assertEqual((respuesta.context['total_ninos'], respuesta.context['total_acotado']), (2, True))
+        self.assertContains(respuesta, 'Mostrando 3 de más de 2 niños')
+
+        respuesta = self.listar(self.usuario_admin, 'gonzalez')
+        self.assertEqual((respuesta.context['total_ninos'], respuesta.context['total_acotado']), (2, False))
+
+
+@override_settings(METRICAS_HABILITADAS=True, METRICAS_LOG_ARCHIVO=None)
+class MetricasPeticionTests(TestCase):
+    def medir(self, vista):
+        middleware = MetricasPeticionMiddleware(vista)
+        request = RequestFactory().get('/ninos/1-9/')
+        with self.assertLogs('conidi.metricas', 'INFO') as registro:
+            respuesta = middleware(request)
+            if respuesta.streaming:
+                self.assertEqual(registro.output, [])  # Aún no se envía el cuerpo
+                contenido = b''.join(respuesta.streaming_content)
+            else:
+                contenido = respuesta.content
+        self.assertEqual(len(registro.records), 1)
+        return respuesta, contenido, json.loads(registro.records[0].getMessage())
+
+    def test_respuesta_normal_lleva_server_timing(self):
+        def vista(request):
+            Comuna.objects.count()
+            return HttpResponse('ok')
+
+        respuesta, _, linea = self.medir(vista)
+        self.assertIn('db;dur=', respuesta['Server-Timing'])
+        self.assertEqual(linea['consultas'], 1)
+
+    def test_streaming_se_registra_al_terminar_el_cuerpo(self):
+        def trozos():
+            yield b'a'
+            Comuna.objects.count()  # Consulta hecha mientras se envía el cuerpo
+            yield b'b'
+
+        respuesta, contenido, linea = self.medir(lambda request: StreamingHttpResponse(trozos()))
+        self.assertEqual(contenido, b'ab')
+        self.assertNotIn('Server-Timing', respuesta)
+        self.assertEqual((linea['consultas'], linea['estado']), (1, 200))
+
+
+class SinSectorBITests(TestCase):
+    """'Sin sector' en el dashboard BI agrupa a los niños con sector NULL y con sector ''."""
+
+    @classmethod
+    def setUpTestData(cls):
+        comuna = crear_comuna()
+        vacuna = Vacuna.objects.create(nom_vacuna='BCG', meses_programada=0)
+        for rut, sector, realizado in (('1-9', None, True), ('2-7', '', False), ('3-5', 'Norte', True)):
+            nino = crear_nino(rut, comuna, sector=sector)
+            Control.objects.create(
+                nino=nino, nombre_control='1 mes', fecha_control_programada=date(2025, 3, 10),
+                fecha_realizacion_control=date(2025, 3, 10) if realizado else None,
+                estado_control='Realizado' if realizado else 'Pendiente', calificacion_nutricional='Normal',
+            )
+            VacunaAplicada.objects.create(
+                nino=nino, vacuna=vacuna, fecha_programada=date(2025, 3, 10),
+                fecha_aplicacion=date(2025, 3, 10) if realizado else None,
+            )
+
+    def test_adherencia(self):
+        hoy = date(2025, 12, 31)
+        self.assertEqual(bi.adherencia_mensual([2025], sector=bi.SIN_SECTOR, hoy=hoy)[2025][2], 50.0)
+        self.assertEqual(bi.adherencia_mensual([2025], sector='Norte', hoy=hoy)[2025][2], 100.0)
+
+    def test_nutricional(self):
+        Control.objects.create(
+            nino_id='2-7', nombre_control='2 meses', fecha_control_programada=date(2025, 4, 10),
+            fecha_realizacion_control=date(2025, 4, 10), estado_control='Realizado', calificacion_nutricional='Normal',
+        )
+        _, _, totales = bi.distribucion_nutricional([2025], sector=bi.SIN_SECTOR)
+        self.assertEqual(totales, {2025: 2})  # Los realizados de los niños con sector NULL y ''
+
+    def test_cobertura_un_solo_grupo(self):
+        filas = bi.cobertura_vacunacion_por_sector(2025, hoy=date(2025, 12, 31))
+        self.assertEqual(
+            [(fila['sector'], fila['programadas'], fila['aplicadas']) for fila in filas],
+            [(bi.SIN_SECTOR, 2, 1), ('Norte', 1, 1)],
+        )
+
+
+class ResumenControlesTests(TestCase):
+    """Las señales y la suma en bloque mantienen una fila por combinación que cuadra con Control."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.comuna = crear_comuna()
+        cls.periodo = PeriodoControl.objects.create(mes_control=1, nombre_mes_control='1 mes')
+        cls.nino = crear_nino('1-9', cls.comuna, sector='Norte')
+
+    def assertCuadra(self):
+        self.assertEqual(comparar_resumen_controles(), [])
+        combinaciones = ResumenDiarioControles.objects.values('fecha', 'sector', 'periodo_id', 'estado').distinct().count()
+        self.assertEqual(ResumenDiarioControles.objects.count(), combinaciones)
+
+    def test_senales(self):
+        control = Control.objects.create(
+            nino=self.nino, periodo=self.periodo, nombre_control='Extra',
+            fecha_control_programada=date(2024, 2, 1), estado_control='Pendiente',
+        )
+        self.assertCuadra()
+        control.fecha_realizacion_control = date(2024, 2, 1)
+        control.estado_control = 'Realizado'
+        control.save()
+        self.assertCuadra()
+        control.deshabilitado = True
+        control.save()
+        self.assertCuadra()
+        control.delete()
+        self.assertCuadra()
+        self.nino.delete()
+        self.assertCuadra()
+
+    def test_recalculos_completo_e_incremental(self):
+        otro = crear_nino('2-7', self.comuna)  # Sin sector
+        control = otro.controles.get()
+        control.fecha_realizacion_control = date(2024, 2, 3)
+        control.save()
+        self.assertCuadra()
+
+        call_command('recalcular_controles', stdout=StringIO())
+        self.assertCuadra()
+
+        PeriodoControl.objects.filter(pk=self.periodo.pk).update(mes_control=2)
+        nuevo_periodo = PeriodoControl.objects.create(mes_control=4, nombre_mes_control='4 meses')
+        self.assertEqual(recalcular_controles_periodos(PeriodoControl.objects.all()), (1, 2))
+        self.assertCuadra()
+        self.assertEqual(self.nino.controles.get(periodo=self.periodo).fecha_control_programada, date(2024, 3, 1))
+        self.assertTrue(otro.controles.filter(periodo=nuevo_periodo).exists())
+
+    def test_calendario_de_nino_nuevo(self):
+        # Nino.objects.create genera el calendario con executemany (sin señales de Control)
+        # y lo suma al resumen, en las filas que ya existen para la misma combinación.
+        self.assertCuadra()
+        filas = ResumenDiarioControles.objects.count()
+        crear_nino('2-7', self.comuna, sector='Norte')  # Mismo calendario que self.nino
+        self.assertEqual(ResumenDiarioControles.objects.count(), filas)
+        self.assertEqual(ResumenDiarioControles.objects.get(estado='PENDIENTE').cantidad, 2)
+        self.assertCuadra()
+
+
+class ArchivoHistorialTests(TestCase):
+    """Archivar no cambia lo que muestran las páginas de historial con ?archivadas=1."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for nombre in ('Alimentos', 'Medicamentos'):
+            categoria = CategoriaAlergia.objects.create(nombre=nombre)
+            for i in range(5):
+                categoria.nombre = f'{nombre} {i}'
+                categoria.save()
+        # Versiones de ambas categorías intercaladas, todas antes del corte.
+        inicio = timezone.now() - timedelta(days=1000)
+        for i, history_id in enumerate(CategoriaAlergia.history.order_by('history_id').values_list('history_id', flat=True)):
+            CategoriaAlergia.history.filter(history_id=history_id).update(history_date=inicio + timedelta(hours=i))
+        cls.corte = timezone.now() - timedelta(days=30)
+
+    def recorrer(self, **opciones):
+        """Páginas de 3 versiones hacia atrás y luego de vuelta hacia adelante: [(history_id, cambios)]."""
+        def resumen(pagina):
+            return [
+                (version.history_id, sorted((c.field, c.old, c.new) for c in getattr(version, 'cambios_calculados', [])))
+                for version in pagina
+            ]
+
+        paginas, pagina = [], pagina_historial(CategoriaAlergia.history.all(), tamano=3, **opciones)
+        paginas.append(resumen(pagina))
+        while pagina.hay_siguiente:
+            pagina = pagina_historial(CategoriaAlergia.history.all(), despues=pagina.cursor_siguiente, tamano=3, **opciones)
+            paginas.append(resumen(pagina))
+        de_vuelta = [resumen(pagina)]
+        while pagina.hay_anterior:
+            pagina = pagina_historial(CategoriaAlergia.history.all(), antes=pagina.cursor_anterior, tamano=3, **opciones)
+            de_vuelta.append(resumen(pagina))
+        self.assertEqual(de_vuelta[::-1], paginas)
+        return paginas
+
+    def test_simular_no_modifica(self):
+        self.assertEqual(archivar_historial(CategoriaAlergia.history.model, self.corte, simular=True), (2, 8))
+        self.assertEqual(CategoriaAlergia.history.count(), 12)
+        self.assertFalse(HistorialArchivado.objects.exists())
+
+    def test_archivar_y_restaurar(self):
+        antes_de_archivar = self.recorrer()
+        self.assertEqual(len(antes_de_archivar), 4)
+
+        self.assertEqual(archivar_historial(CategoriaAlergia.history.model, self.corte, tamano_bloque=1), (2, 8))
+        for categoria in CategoriaAlergia.objects.all():
+            quedan = list(categoria.history.order_by('history_date').values_list('history_type', 'nombre'))
+            self.assertEqual(quedan, [('+', categoria.nombre.split()[0]), ('~', categoria.nombre)])
+
+        modelo = CategoriaAlergia.history.model
+        self.assertEqual(self.recorrer(archivos=archivos_de(modelo)), antes_de_archivar)
+        # Historial de un solo objeto.
+        categoria = CategoriaAlergia.objects.get(nombre='Medicamentos 4')
+        de_uno = pagina_historial(categoria.history.all(), tamano=10, archivos=archivos_de(modelo, categoria.pk))
+        self.assertEqual(len(de_uno), 6)
+        self.assertTrue(all(getattr(version, 'cambios_calculados', None) for version in list(de_uno)[:-1]))
+
+        rol_admin = Rol.objects.create(nombre_rol='Administrador', descripcion='Administrador')
+        self.client.force_login(Usuario.objects.create_user('22222222-2', 'admin@conidi.cl', 'Admin Prueba', rol_admin, 'clave'))
+        respuesta = self.client.get(reverse('control:historial_categorias_alergia'), {'archivadas': '1'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(respuesta.context['historial']), 12)
+
+
+class AccesoTests(TestCase):
+    """Alcance de cada rol (login/acceso.py y visible_to) y sesiones de usuario."""
+
+    @classmethod
+    def setUpTestData(cls):
+        comuna = crear_comuna()
+        cls.propio = crear_nino('1-9', comuna)
+        cls.ajeno = crear_nino('2-7', comuna)
+        rol_tutor = Rol.objects.create(nombre_rol='Tutor', descripcion='Tutor')
+        cls.usuario_tutor = Usuario.objects.create_user('11111111-1', 'madre@conidi.cl', 'Madre Prueba', rol_tutor, 'clave')
+        cls.tutor = Tutor.objects.create(rut='11111111-1', nombre_completo='Madre Prueba', email='madre@conidi.cl', usuario=cls.usuario_tutor)
+        NinoTutor.objects.create(nino=cls.propio, tutor=cls.tutor)
+
+    def test_sesion_iniciada_con_model_backend(self):
+        # Sesiones abiertas antes de UsuarioBackend: guardan la ruta de ModelBackend.
+        self.client.force_login(self.usuario_tutor, backend='django.contrib.auth.backends.ModelBackend')
+        respuesta = self.client.get(reverse('control:detalle_nino', args=[self.propio.rut_nino]))
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_relacion_nueva_se_ve_en_la_siguiente_peticion(self):
+        self.client.force_login(self.usuario_tutor)
+        url = reverse('control:detalle_nino', args=[self.ajeno.rut_nino])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        NinoTutor.objects.bulk_create([NinoTutor(nino=self.ajeno, tutor=self.tutor)])  # Sin señales
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_tutor_no_ve_controles_ni_vacunas_de_otra_familia(self):
+        vacuna = Vacuna.objects.create(nom_vacuna='BCG', meses_programada=0)
+        registros = {}
+        for nino in (self.propio, self.ajeno):
+            control = Control.objects.create(nino=nino, nombre_control='1 mes', fecha_control_programada=date(2024, 2, 1))
+            aplicada = VacunaAplicada.objects.create(nino=nino, vacuna=vacuna, fecha_programada=date(2024, 1, 1))
+            registros[nino.rut_nino] = (
+                reverse('control:ver_control', args=[control.pk]), reverse('control:ver_vacuna', args=[aplicada.pk]),
+            )
+        self.client.force_login(self.usuario_tutor)
+        for url in registros[self.propio.rut_nino]:
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+        for url in registros[self.ajeno.rut_nino]:
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+
+class ConfigurarCategoriasAlergiaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alimentos = CategoriaAlergia.objects.create(nombre='Alimentos')
+        cls.medicamentos = CategoriaAlergia.objects.create(nombre='Medicamentos')
+        rol_admin = Rol.objects.create(nombre_rol='Administrador', descripcion='Administrador')
+        cls.usuario_admin = Usuario.objects.create_user('22222222-2', 'admin@conidi.cl', 'Admin Prueba', rol_admin, 'clave')
+
+    def guardar(self, nombres):
+        self.client.force_login(self.usuario_admin)
+        datos = {'action': 'update', **{f'nombre_categoria_{pk}': nombre for pk, nombre in nombres.items()}}
+        return self.client.post(reverse('control:configurar_categorias_alergia'), datos, follow=True)
+
+    def test_intercambiar_nombres(self):
+        respuesta = self.guardar({self.alimentos.pk: 'Medicamentos', self.medicamentos.pk: 'Alimentos'})
+        self.assertContains(respuesta, 'La lista de categorías ha sido actualizada.')
+        self.assertEqual(
+            dict(CategoriaAlergia.objects.values_list('pk', 'nombre')),
+            {self.alimentos.pk: 'Medicamentos', self.medicamentos.pk: 'Alimentos'},
+        )
+        # El nombre temporal no queda en el historial.
+        self.assertEqual(
+            sorted(CategoriaAlergia.history.filter(history_type='~').values_list('nombre', flat=True)),
+            ['Alimentos', 'Medicamentos'],
+        )
+
+    def test_intercambiar_nombres_de_largo_maximo(self):
+        largo = CategoriaAlergia._meta.get_field('nombre').max_length
+        nombres = {self.alimentos.pk: 'A' * largo, self.medicamentos.pk: 'M' * largo}
+        CategoriaAlergia.objects.filter(pk=self.alimentos.pk).update(nombre=nombres[self.alimentos.pk])
+        CategoriaAlergia.objects.filter(pk=self.medicamentos.pk).update(nombre=nombres[self.medicamentos.pk])
+
+        # SQLite no revisa max_length: se mira el valor temporal justo antes del UPDATE final.
+        temporales = []
+
+        def registrar_temporales(*args, **kwargs):
+            temporales.extend(CategoriaAlergia.objects.values_list('nombre', flat=True))
+            return bulk_update_with_history(*args, **kwargs)
+
+        with mock.patch('control.configuracion.bulk_update_with_history', side_effect=registrar_temporales):
+            self.guardar({self.alimentos.pk: nombres[self.medicamentos.pk], self.medicamentos.pk: nombres[self.alimentos.pk]})
+        self.assertEqual(sorted(temporales), sorted([f'#{self.alimentos.pk}', f'#{self.medicamentos.pk}']))
+        self.assertEqual(CategoriaAlergia.objects.get(pk=self.alimentos.pk).nombre, 'M' * largo)
+
+    def test_nombre_tomado_a_la_vez_es_error_del_formulario(self):
+        with mock.patch('control.views.guardar_en_bloque', side_effect=IntegrityError):
+            respuesta = self.guardar({self.alimentos.pk: 'Polen'})
+        self.assertContains(respuesta, 'Uno de los nombres ya está en uso.')
+        self.assertEqual(CategoriaAlergia.objects.get(pk=self.alimentos.pk).nombre, 'Alimentos')
+
+
+class GenerarCalendariosTests(TestCase):
+    """El INSERT con executemany deja las mismas filas e historial que bulk_create_with_history."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.comuna = crear_comuna()
+        for mes in (1, 2, 6, 12, 18):
+            PeriodoControl.objects.create(mes_control=mes, nombre_mes_control=f'{mes} meses')
+        for i, meses in enumerate((0, 2, 4, 6, 12, 18)):
+            Vacuna.objects.create(nom_vacuna=f'Vacuna {i}', meses_programada=meses)
+        Vacuna.objects.create(nom_vacuna='Campaña', meses_programada=None)
+
+    def nino_sin_senales(self, rut):
+        nino = Nino(
+            rut_nino=rut, nombre='Niño', ap_paterno='Prueba', fecha_nacimiento=date(2024, 1, 31),
+            sexo='Masculino', direccion='Calle 1', comuna=self.comuna,
+        )
+        Nino.objects.bulk_create([nino])
+        return nino
+
+    def filas(self, nino):
+        def sin_ids(filas, *excluir):
+            return sorted(
+                tuple(sorted((campo, valor) for campo, valor in fila.items() if campo not in excluir))
+                for fila in filas
+            )
+
+        ids = ('id', 'nino_id', 'history_id', 'history_date')
+        return (
+            sin_ids(Control.objects.filter(nino=nino).values(), *ids),
+            sin_ids(Control.history.filter(nino=nino).values(), *ids),
+            sin_ids(VacunaAplicada.objects.filter(nino=nino).values(), *ids),
+            sin_ids(VacunaAplicada.history.filter(nino=nino).values(), *ids),
+        )
+
+    def test_mismas_filas_que_el_camino_anterior(self):
+        nuevo = self.nino_sin_senales('1-9')
+        self.assertEqual(generar_calendarios([nuevo]), (5, 6))
+
+        anterior = self.nino_sin_senales('2-7')
+        guardar_controles(construir_controles([anterior], list(PeriodoControl.objects.all())))
+        guardar_vacunas(construir_vacunas([anterior], list(Vacuna.objects.filter(meses_programada__isnull=False))))
+
+        self.assertEqual(self.filas(nuevo), self.filas(anterior))
+        self.assertEqual(len(self.filas(nuevo)[1]), 5)  # Una versión '+' por control
+
+
+class ImportarNinosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.comuna = crear_comuna()
+        PeriodoControl.objects.create(mes_control=1, nombre_mes_control='1 mes')
+        Vacuna.objects.create(nom_vacuna='BCG', meses_programada=0)
+        crear_nino('12345678-5', cls.comuna, nombre='Ana')
+        crear_nino('11111111-1', cls.comuna, nombre='Luis')
+        Tutor.objects.create(rut='22222222-2', nombre_completo='Tutor Registrado', email='tutor@conidi.cl')
+
+    def importar(self, filas):
+        encabezado = 'rut_nino;nombre;ap_paterno;fecha_nacimiento;sexo;direccion;comuna;rut_tutor;nombre_tutor;email_tutor;parentesco'
+        directorio = tempfile.mkdtemp()
+        ruta, ruta_errores = f'{directorio}/ninos.csv', f'{directorio}/errores.csv'
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            archivo.write('\n'.join([encabezado, *filas]) + '\n')
+        salida = StringIO()
+        call_command('importar_ninos', ruta, errores=ruta_errores, tamano_bloque=2, stdout=salida)
+        with open(ruta_errores, encoding='utf-8') as archivo:
+            errores = archivo.read().splitlines()
+        return salida.getvalue(), errores
+
+    def test_importacion_completa(self):
+        salida, errores = self.importar([
+            '33.333.333-3;Sofía;Pérez;2024-01-01;F;Calle 2;Comuna de prueba;44444444-4;Madre Nueva;nueva@conidi.cl;madre',
+            '12345678-5;Ana María;Prueba;01-01-2024;Femenino;Calle 1;Comuna de prueba;;;;',
+            '11111111-1;Luis;Prueba;2023-05-05;M;Calle 1;Comuna de prueba;;;;',
+            '55555555-5;Tomás;Rojas;2024-02-01;M;Calle 3;Comuna de prueba;66666666-6;Otro Tutor;tutor@conidi.cl;Padre',
+        ])
+
+        # Creado, con su tutor, calendario, resumen (sumado a las filas que ya había) e índice de búsqueda.
+        nuevo = Nino.objects.get(pk='33333333-3')
+        self.assertEqual((nuevo.nombre, nuevo.sexo, nuevo.fecha_nacimiento), ('Sofía', 'Femenino', date(2024, 1, 1)))
+        self.assertEqual(list(NinoTutor.objects.filter(nino=nuevo).values_list('tutor_id', 'parentesco')), [('44444444-4', 'Madre')])
+        self.assertEqual((nuevo.controles.count(), nuevo.vacunas_aplicadas.count()), (1, 1))
+        self.assertEqual(comparar_resumen_controles(), [])
+        self.assertEqual(ResumenDiarioControles.objects.get(estado='PENDIENTE').cantidad, 3)
+        self.assertIn('33333333-3', [n.rut_nino for n in motor_busqueda().filtrar(Nino.objects.all(), 'sofia perez')])
+
+        # Actualizado, sin tocar su calendario.
+        actualizado = Nino.objects.get(pk='12345678-5')
+        self.assertEqual((actualizado.nombre, actualizado.sexo), ('Ana María', 'Femenino'))
+        self.assertEqual(actualizado.controles.count(), 1)
+
+        # Rechazados: fecha de nacimiento distinta y email de otro tutor.
+        self.assertEqual(Nino.objects.get(pk='11111111-1').fecha_nacimiento, date(2024, 1, 1))
+        self.assertFalse(Nino.objects.filter(pk='55555555-5').exists())
+        self.assertFalse(Tutor.objects.filter(pk='66666666-6').exists())
+        self.assertEqual(errores, [
+            'fila,rut_nino,error',
+            '4,11111111-1,la fecha de nacimiento no coincide con la registrada (corríjala desde la ficha).',
+            '5,55555555-5,el email del tutor ya está registrado para otro RUT.',
+        ])
+        self.assertIn('2 de 4 filas válidas', salida)
+
+
+class RecalcularControlesPeriodosTests(TestCase):
+    """El recálculo incremental mueve en el lugar solo los controles pendientes del período."""
+
+    @classmethod
+    def setUpTestData(cls):
+        comuna = crear_comuna()
+        cls.periodo = PeriodoControl.objects.create(mes_control=1, nombre_mes_control='1 mes')
+        cls.pendiente = crear_nino('1-9', comuna, fecha_nacimiento=date(2024, 1, 31)).controles.get()
+        Control.objects.filter(pk=cls.pendiente.pk).update(notificacion_enviada=True)
+        cls.realizado = crear_nino('2-7', comuna).controles.get()
+        cls.realizado.fecha_realizacion_control = date(2024, 2, 2)
+        cls.realizado.save()
+        rol_admin = Rol.objects.create(nombre_rol='Administrador', descripcion='Administrador')
+        cls.usuario_admin = Usuario.objects.create_user('22222222-2', 'admin@conidi.cl', 'Admin Prueba', rol_admin, 'clave')
+
+    def test_recalculo_en_el_lugar(self):
+        PeriodoControl.objects.filter(pk=self.periodo.pk).update(mes_control=2, nombre_mes_control='2 meses')
+        self.assertEqual(recalcular_controles_periodos([PeriodoControl.objects.get()]), (1, 0))
+
+        pendiente = Control.objects.get(pk=self.pendiente.pk)  # Mismo ID
+        self.assertEqual(
+            (pendiente.fecha_control_programada, pendiente.nombre_control, pendiente.notificacion_enviada),
+            (date(2024, 3, 31), '2 meses', True),
+        )
+        realizado = Control.objects.get(pk=self.realizado.pk)
+        self.assertEqual((realizado.fecha_control_programada, realizado.nombre_control), (date(2024, 2, 1), '1 mes'))
+        self.assertEqual(Control.objects.count(), 2)
+
+        # Una segunda pasada no tiene nada que hacer.
+        self.assertEqual(recalcular_controles_periodos([PeriodoControl.objects.get()]), (0, 0))
+
+    def guardar(self, **valores):
+        self.client.force_login(self.usuario_admin)
+        datos = {
+            'action': 'update',
+            f'nombre_control_{self.periodo.pk}': valores.get('nombre', '1 mes'),
+            f'mes_control_{self.periodo.pk}': valores.get('mes', '1'),
+            f'dias_margen_{self.periodo.pk}': valores.get('margen', '7'),
+        }
+        return self.client.post(reverse('control:configurar_periodos'), datos)
+
+    def test_solo_margen_no_encola_recalculo(self):
+        respuesta = self.guardar(margen='10')
+        self.assertRedirects(respuesta, reverse('control:configurar_periodos'))
+        self.assertEqual(PeriodoControl.objects.get().dias_margen, 10)
+        self.assertFalse(TareaRecalculo.objects.exists())
+
+    def test_cambio_de_mes_encola_recalculo(self):
+        respuesta = self.guardar(mes='2')
+        tarea = TareaRecalculo.objects.get()
+        self.assertRedirects(respuesta, reverse('control:estado_tarea_recalculo', args=[tarea.pk]))
+
+
+class RecalcularVacunasTests(TestCase):
+    """Recálculo incremental del calendario de vacunación y alta de vacunas desde la configuración."""
+
+    @classmethod
+    def setUpTestData(cls):
+        comuna = crear_comuna()
+        for numero in range(13):
+            crear_nino(f'{numero + 1}-K', comuna)
+        rol_admin = Rol.objects.create(nombre_rol='Administrador', descripcion='Administrador')
+        cls.usuario_admin = Usuario.objects.create_user('22222222-2', 'admin@conidi.cl', 'Admin Prueba', rol_admin, 'clave')
+
+    def test_vacuna_nueva_cambio_de_mes_y_repeticion(self):
+        vacuna = Vacuna.objects.create(nom_vacuna='Hexavalente', meses_programada=2)
+        # Vacuna nueva: se crea la dosis de cada niño
+        self.assertEqual(recalcular_vacunas([vacuna], chunk_size=5, batch_size=4), (0, 13))
+
+        vacuna.meses_programada = 4
+        vacuna.save()
+        self.assertEqual(recalcular_vacunas([vacuna], chunk_size=5, batch_size=4), (13, 0))
+        self.assertEqual(
+            set(VacunaAplicada.objects.filter(vacuna=vacuna).values_list('fecha_programada', flat=True)),
+            {date(2024, 5, 1)},
+        )
+
+        # Sin cambios no hay nada que hacer
+        self.assertEqual(recalcular_vacunas([vacuna], chunk_size=5, batch_size=4), (0, 0))
+
+    def test_crear_vacuna_con_mes_no_numerico(self):
+        self.client.force_login(self.usuario_admin)
+        respuesta = self.client.post(
+            reverse('control:configurar_vacunas'),
+            {'action': 'create', 'nuevo_nombre': 'Hexavalente', 'nuevo_mes': 'dos'},
+            follow=True,
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, 'no es un número entero')
+        self.assertFalse(Vacuna.objects.exists())
+        self.assertFalse(TareaRecalculo.objects.exists())
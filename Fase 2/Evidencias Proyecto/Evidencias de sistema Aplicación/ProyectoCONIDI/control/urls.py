@@ -7,6 +7,8 @@ app_name = 'control' # Espacio de nombres para evitar colisiones
 urlpatterns = [
     # --- Vistas Principales (Relacionadas con el Niño) ---
     path('ninos/', views.listar_ninos, name='listar_ninos'),
+    # Carga masiva (antes de 'ninos/<rut>/' para que 'importar' no se tome como RUT)
+    path('ninos/importar/', views.importar_ninos, name='importar_ninos'),
     # Vista general del niño con pestañas
     path('ninos/<str:nino_rut>/', views.controles, name='detalle_nino'), 
 
@@ -34,6 +36,9 @@ urlpatterns = [
     # Periodos de Control
     path('configuracion/periodos/', views.configurar_periodos, name='configurar_periodos'),
     path('configuracion/periodos/historial/', views.historial_configuracion, name='historial_configuracion'),
+    # Tareas de recálculo en segundo plano
+    path('configuracion/tareas/<int:tarea_id>/', views.estado_tarea_recalculo, name='estado_tarea_recalculo'),
+    path('configuracion/tareas/<int:tarea_id>/estado/', views.estado_tarea_recalculo_json, name='estado_tarea_recalculo_json'),
     # Vacunas
     path('configuracion/vacunas/', views.configurar_vacunas, name='configurar_vacunas'),
     path('configuracion/vacunas/historial/', views.historial_vacunas, name='historial_vacunas'),
@@ -43,7 +48,12 @@ urlpatterns = [
     # Reportes por correo
     path('configuracion/reportes/', views.reportes, name='reportes'),
     path('configuracion/reportes/historial/', views.historial_envio_reportes, name='historial_envio_reportes'),
+    # Exportación de datos para análisis (CSV / Parquet)
+    path('configuracion/exportar/', views.exportar_datos, name='exportar_datos'),
 
 # --- RUTA NUEVA PARA EL DASHBOARD BI ---
     path('dashboard/bi/', views.dashboard_bi, name='dashboard_bi'),
+    path('dashboard/bi/api/adherencia/', views.dashboard_bi_adherencia, name='dashboard_bi_adherencia'),
+    path('dashboard/bi/api/nutricional/', views.dashboard_bi_nutricional, name='dashboard_bi_nutricional'),
+    path('dashboard/bi/api/vacunacion/', views.dashboard_bi_vacunacion, name='dashboard_bi_vacunacion'),
 ]
\ No newline at end of file
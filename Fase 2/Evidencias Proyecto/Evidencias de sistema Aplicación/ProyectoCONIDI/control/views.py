@@ -2,25 +2,76 @@ from django.shortcuts import render, get_object_or_404, redirect
 from datetime import date, timedelta
 from django.db import transaction
 from django.urls import reverse
-from unidecode import unidecode
-from .models import Nino, Control, PeriodoControl, Vacuna, VacunaAplicada, RegistroAlergias, CategoriaAlergia, HistorialEnvioReporte
+from .models import Nino, Control, PeriodoControl, Vacuna, VacunaAplicada, RegistroAlergias, CategoriaAlergia, HistorialEnvioReporte, TareaRecalculo
+from .tareas import encolar_recalculo_controles, encolar_recalculo_vacunas
+from .outbox import encolar_correo
+from .reportes import solicitar_reporte_atrasados
+from .paginacion import paginar_keyset
+from .historial import pagina_historial
+from .detalle_nino import cargar_detalle_nino
+from .importacion import COLUMNAS as COLUMNAS_IMPORTACION, ArchivoInvalido, importar_ninos as importar_archivo_ninos
+from .exportacion import EXPORTACIONES, FORMATOS, ExportacionNoDisponible, escribir_parquet, interpretar_desde, parquet_disponible, trozos_csv
+from .configuracion import entero, entero_opcional, guardar_en_bloque, leer_formulario, texto_obligatorio, valores_repetidos
+from .archivo_historial import archivos_de, hay_versiones_archivadas
+from .busqueda import motor_busqueda
+from . import bi
 from django.contrib.auth.decorators import login_required
-from login.models import Tutor, Profesional
-from django.core.exceptions import PermissionDenied
+from login.models import Tutor, Profesional, NinoTutor
 from django.contrib import messages
 from login.decorators import rol_requerido
 from django.core.management import call_command
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
 from django.conf import settings
 from simple_history.admin import SimpleHistoryAdmin
-from django.db.models import Q
+from django.db.models import Q, Prefetch
 from django.db import IntegrityError
 from django.urls import reverse
 from django.core.mail import EmailMultiAlternatives
-import threading
-import pandas as pd
-import io
+from django.http import FileResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+import tempfile
+from functools import wraps
+
+# Orden del listado de niños; debe coincidir con el índice 'nino_listado_idx'.
+ORDEN_LISTADO_NINOS = ['estado_seguimiento', 'ap_paterno', 'nombre', 'rut_nino']
+
+
+def _urls_paginacion(request, pagina):
+    """Enlaces a la página anterior y siguiente de una PaginaKeyset, conservando los demás filtros."""
+    parametros = request.GET.copy()
+    for clave in ('despues', 'antes'):
+        parametros.pop(clave, None)
+    url_siguiente = url_anterior = None
+    if pagina.hay_siguiente:
+        parametros['despues'] = pagina.cursor_siguiente
+        url_siguiente = '?' + parametros.urlencode()
+        del parametros['despues']
+    if pagina.hay_anterior:
+        parametros['antes'] = pagina.cursor_anterior
+        url_anterior = '?' + parametros.urlencode()
+    return url_anterior, url_siguiente
+
+
+def _pagina_historial(request, historial, objeto_id=None):
+    """
+    Contexto común de las vistas de historial. Con ?archivadas=1 se suman las versiones
+    que 'archivar_historial' sacó de la tabla (de un objeto, o de todo el modelo si no se indica).
+    """
+    modelo = historial.model
+    hay_archivadas = hay_versiones_archivadas(modelo, objeto_id)
+    con_archivadas = hay_archivadas and request.GET.get('archivadas') == '1'
+    pagina = pagina_historial(
+        historial,
+        despues=request.GET.get('despues'),
+        antes=request.GET.get('antes'),
+        archivos=archivos_de(modelo, objeto_id) if con_archivadas else None,
+    )
+    url_anterior, url_siguiente = _urls_paginacion(request, pagina)
+    return {
+        'historial': pagina,
+        'url_anterior': url_anterior,
+        'url_siguiente': url_siguiente,
+        'hay_archivadas': hay_archivadas,
+        'con_archivadas': con_archivadas,
+    }
 
 
 
@@ -29,19 +80,14 @@ import io
 
 @login_required
 def controles(request, nino_rut):
-    nino = get_object_or_404(Nino.objects.select_related('comuna'), pk=nino_rut)
+    # El permiso va en la misma consulta: un niño ajeno al usuario responde 404.
+    nino = get_object_or_404(Nino.objects.visible_to(request.conidi_access).select_related('comuna'), pk=nino_rut)
     user = request.user
 
-    # --- Verificación de permisos (sin cambios) ---
-    if user.rol.nombre_rol.lower() == 'tutor':
-        try:
-            if not user.perfil_tutor.ninos.filter(pk=nino.pk).exists():
-                raise PermissionDenied
-        except Tutor.DoesNotExist:
-             raise PermissionDenied
+    acceso = request.conidi_access
 
     # --- LÓGICA POST (CON VALIDACIÓN DE CONTRASEÑA) ---
-    if request.method == 'POST' and request.user.rol.nombre_rol.lower() in ['administrador', 'profesional']:
+    if request.method == 'POST' and acceso.tiene_rol(['administrador', 'profesional']):
         
         # 1. VALIDACIÓN DE SEGURIDAD: Verificar contraseña del usuario actual
         password_confirm = request.POST.get('password_confirm')
@@ -70,30 +116,16 @@ def controles(request, nino_rut):
         url_base = reverse('control:detalle_nino', kwargs={'nino_rut': nino.rut_nino})
         return redirect(f"{url_base}#gestion-pane")
 
-    # --- Lógica GET (sin cambios) ---
-    lista_controles = nino.controles.select_related('periodo').all().order_by('fecha_control_programada')
-    vacunas_aplicadas = nino.vacunas_aplicadas.select_related('vacuna').all().order_by('fecha_programada')
-    alergias_registradas = nino.alergias_registradas.select_related('categoria').all().order_by('-fecha_aparicion')
-
-    ultimo_control = nino.controles.filter(
-        fecha_realizacion_control__isnull=False,
-        deshabilitado=False
-    ).order_by('-fecha_realizacion_control').first()
-
-    contexto = {
-        "nino": nino,
-        "controles": lista_controles,
-        "vacunas_aplicadas": vacunas_aplicadas,
-        "alergias_registradas": alergias_registradas,
-        "ultimo_control": ultimo_control,
-        "estado_seguimiento_choices": Nino.ESTADO_SEGUIMIENTO_CHOICES,
-    }
+    # --- Lógica GET ---
+    # Listas de la ficha en un número fijo de consultas (ver control/detalle_nino.py).
+    contexto = cargar_detalle_nino(nino)
+    contexto["estado_seguimiento_choices"] = Nino.ESTADO_SEGUIMIENTO_CHOICES
     return render(request, 'control/nino/controles.html', contexto)
 
 @login_required
 def listar_ninos(request):
     user = request.user
-    rol_usuario = user.rol.nombre_rol.lower()
+    rol_usuario = request.conidi_access.rol
 
     # --- Lógica de Envío de Correo (POST) ---
     if request.method == 'POST':
@@ -116,10 +148,12 @@ def listar_ninos(request):
                     "Equipo CESFAM"
                 )
                 try:
-                    send_mail(asunto, mensaje, settings.DEFAULT_FROM_EMAIL, [tutor.email])
-                    messages.success(request, f"Correo de notificación PNAC enviado exitosamente a {tutor.email}.")
+                    # Se deja en la bandeja de salida; el despachador lo envía con reintentos.
+                    email = EmailMultiAlternatives(asunto, mensaje, settings.DEFAULT_FROM_EMAIL, [tutor.email])
+                    encolar_correo(email, origen='PNAC')
+                    messages.success(request, f"Correo de notificación PNAC encolado para su envío a {tutor.email}.")
                 except Exception as e:
-                    messages.error(request, f"Error al enviar el correo a {tutor.email}: {e}")
+                    messages.error(request, f"Error al encolar el correo a {tutor.email}: {e}")
             else:
                 messages.warning(request, f"No se pudo enviar el correo: el niño/a {nino.nombre} no tiene un tutor con email asignado.")
             return redirect('control:listar_ninos')
@@ -131,31 +165,65 @@ def listar_ninos(request):
     lista_ninos = Nino.objects.none() 
 
     if rol_usuario in ['administrador', 'profesional']:
-        lista_ninos = Nino.objects.prefetch_related('ninotutor_set__tutor').all()
+        lista_ninos = Nino.objects.prefetch_related(Prefetch('ninotutor_set', queryset=NinoTutor.objects.select_related('tutor').order_by('id')))
     
     elif rol_usuario == 'tutor':
         try:
-            lista_ninos = user.perfil_tutor.ninos.prefetch_related('ninotutor_set__tutor').all()
+            lista_ninos = user.perfil_tutor.ninos.prefetch_related(Prefetch('ninotutor_set', queryset=NinoTutor.objects.select_related('tutor').order_by('id')))
         except Tutor.DoesNotExist:
             lista_ninos = Nino.objects.none()
 
+    orden = ORDEN_LISTADO_NINOS
     if nombre_query:
-        nombre_query_norm = unidecode(nombre_query).lower()
-        lista_ninos = lista_ninos.filter(
-            Q(nombre_norm__icontains=nombre_query_norm) |
-            Q(ap_paterno_norm__icontains=nombre_query_norm) |
-            Q(ap_materno_norm__icontains=nombre_query_norm)
-        )
+        # El motor de búsqueda (FTS5 / pg_trgm) filtra en la misma consulta, dentro de lo que el
+        # rol puede ver y sin tope de resultados, y anota la relevancia: la página se ordena por
+        # ella en vez del orden alfabético habitual.
+        lista_ninos = motor_busqueda().filtrar(lista_ninos, nombre_query)
+        orden = ['relevancia', 'rut_nino']
 
     if rut_query:
         lista_ninos = lista_ninos.filter(rut_nino__icontains=rut_query)
 
-    # --- LÓGICA DE ORDENAMIENTO APLICADA ANTES DE PASAR AL CONTEXTO ---
+    # --- ORDENAMIENTO Y PAGINACIÓN POR CURSOR ---
     # Al ordenar por 'estado_seguimiento' primero, "ACTIVO" siempre irá al principio.
-    lista_ninos_ordenada = lista_ninos.order_by('estado_seguimiento', 'ap_paterno', 'nombre')
+    # El RUT desempata para que el orden sea total; el índice 'nino_listado_idx' cubre
+    # estas columnas, así que cada página cuesta lo mismo sin importar el tamaño del registro.
+    try:
+        por_pagina = int(request.GET.get('por_pagina', settings.NINOS_POR_PAGINA))
+    except ValueError:
+        por_pagina = settings.NINOS_POR_PAGINA
+    por_pagina = max(1, min(por_pagina, settings.NINOS_POR_PAGINA_MAX))
+
+    pagina = paginar_keyset(
+        lista_ninos,
+        orden,
+        por_pagina,
+        despues=request.GET.get('despues'),
+        antes=request.GET.get('antes'),
+    )
+
+    # El total se cuenta en la BD en cada petición (una caché quedaría desactualizada al crear,
+    # importar o eliminar niños), pero con tope: se cuentan a lo más NINOS_CONTEO_MAXIMO + 1
+    # filas y, si hay más, la página muestra "más de N" en vez de recorrer todo el registro.
+    limite_conteo = settings.NINOS_CONTEO_MAXIMO
+    total_ninos = lista_ninos.order_by()[:limite_conteo + 1].count()
+    total_acotado = total_ninos > limite_conteo
+    if total_acotado:
+        total_ninos = limite_conteo
+
+    # Primer tutor de cada niño, tomado de lo ya precargado (en la plantilla, '.first' volvería a consultar).
+    for nino in pagina:
+        relaciones = nino.ninotutor_set.all()
+        nino.relacion_tutor = relaciones[0] if relaciones else None
+
+    url_anterior, url_siguiente = _urls_paginacion(request, pagina)
 
     contexto = {
-        'ninos': lista_ninos_ordenada, # <-- Usamos la lista ya ordenada
+        'ninos': pagina,
+        'total_ninos': total_ninos,
+        'total_acotado': total_acotado,
+        'url_siguiente': url_siguiente,
+        'url_anterior': url_anterior,
         'rol_usuario': rol_usuario,
         'nombre_query': nombre_query,
         'rut_query': rut_query,
@@ -282,15 +350,12 @@ def registrar_control(request, control_id):
 
 @login_required
 def ver_control(request, control_id):
-    control = get_object_or_404(Control, pk=control_id)
-    nino = control.nino
-    user = request.user
-
     # --- Verificación de Seguridad ---
-    # Si el usuario es un tutor, nos aseguramos de que el niño le pertenezca
-    if user.rol.nombre_rol.lower() == 'tutor':
-        if not user.perfil_tutor.ninos.filter(pk=nino.pk).exists():
-            raise PermissionDenied
+    # Un tutor solo obtiene controles de sus niños (404 en otro caso), en una sola consulta.
+    control = get_object_or_404(
+        Control.objects.visible_to(request.conidi_access).select_related('nino', 'profesional__usuario'), pk=control_id
+    )
+    nino = control.nino
 
     contexto = {
         'control': control,
@@ -436,22 +501,10 @@ def editar_control(request, control_id):
 def historial_control(request, control_id):
     control = get_object_or_404(Control, pk=control_id)
     
-    # Obtenemos todos los registros históricos para este control
-    historial = control.history.all()
-    
-    # Procesamos el historial para que sea más fácil de mostrar en la plantilla
-    # La librería nos permite comparar cada versión con la anterior
-    for i in range(len(historial) - 1):
-        version_actual = historial[i]
-        version_anterior = historial[i+1]
-        # 'diff_against' nos devuelve un objeto con los cambios
-        delta = version_actual.diff_against(version_anterior)
-        # Guardamos los cambios en el objeto para usarlos en la plantilla
-        version_actual.cambios_calculados = delta.changes
-
+    # Una página de versiones con sus cambios ya calculados (control/historial.py)
     contexto = {
         'control': control,
-        'historial': historial
+        **_pagina_historial(request, control.history.all(), control.pk),
     }
     return render(request, 'control/control_nino_sano/historial_control.html', contexto)
 
@@ -465,35 +518,40 @@ def configurar_periodos(request):
         action = request.POST.get('action')
 
         if action == 'update':
-            periodos = PeriodoControl.objects.all()
-            hubo_cambios = False # Una bandera para saber si debemos recalcular
-
-            for periodo in periodos:
-                # Obtenemos los datos nuevos del formulario
-                nuevo_nombre = request.POST.get(f'nombre_control_{periodo.id}')
-                nuevo_mes = int(request.POST.get(f'mes_control_{periodo.id}'))
-                nuevo_margen = int(request.POST.get(f'dias_margen_{periodo.id}'))
-
-                # --- LÓGICA DE VERIFICACIÓN AÑADIDA ---
-                # Comparamos los datos nuevos con los que ya tiene el objeto
-                if (periodo.nombre_mes_control != nuevo_nombre or
-                    periodo.mes_control != nuevo_mes or
-                    periodo.dias_margen != nuevo_margen):
-                    
-                    # Si hay al menos una diferencia, actualizamos y guardamos
-                    periodo.nombre_mes_control = nuevo_nombre
-                    periodo.mes_control = nuevo_mes
-                    periodo.dias_margen = nuevo_margen
-                    periodo.save() # .save() solo se llama si hay cambios
-                    hubo_cambios = True # Marcamos que hubo al menos un cambio
-            
-            # Si hubo al menos un cambio, recalculamos los calendarios
-            if hubo_cambios:
-                try:
-                    call_command('recalcular_controles')
-                    messages.success(request, 'La configuración ha sido guardada y los calendarios recalculados.')
-                except Exception as e:
-                    messages.error(request, f'Configuración guardada, pero error al recalcular: {e}')
+            # Se valida todo el formulario y se guardan solo las filas que cambiaron, en bloque.
+            periodos = list(PeriodoControl.objects.all())
+            calendario_anterior = {periodo.id: (periodo.mes_control, periodo.nombre_mes_control) for periodo in periodos}
+            periodos_modificados, campos, errores = leer_formulario(
+                periodos, request.POST,
+                [
+                    ('nombre_mes_control', 'nombre_control_{id}', texto_obligatorio),
+                    ('mes_control', 'mes_control_{id}', entero),
+                    ('dias_margen', 'dias_margen_{id}', entero),
+                ],
+            )
+            if errores:
+                for error in errores:
+                    messages.error(request, error)
+                messages.warning(request, 'No se guardaron cambios. Corrige los valores indicados.')
+                return redirect('control:configurar_periodos')
+
+            # Solo el mes y el nombre del período se copian a los controles: si cambió solo
+            # el margen de días no hay nada que recalcular.
+            periodos_a_recalcular = [
+                periodo.id for periodo in periodos_modificados
+                if (periodo.mes_control, periodo.nombre_mes_control) != calendario_anterior[periodo.id]
+            ]
+
+            # El recálculo lo ejecuta el proceso 'run_scheduler', así la petición no queda bloqueada.
+            # Misma transacción: no puede quedar guardado el cambio sin su recálculo.
+            if periodos_modificados:
+                with transaction.atomic():
+                    guardar_en_bloque(PeriodoControl, periodos_modificados, campos, usuario=request.user)
+                    tarea = encolar_recalculo_controles(periodos_a_recalcular, usuario=request.user) if periodos_a_recalcular else None
+                if tarea:
+                    messages.success(request, 'La configuración ha sido guardada. El recálculo de calendarios se está ejecutando en segundo plano.')
+                    return redirect('control:estado_tarea_recalculo', tarea_id=tarea.id)
+                messages.success(request, 'La configuración ha sido guardada.')
             else:
                 messages.info(request, 'No se detectaron cambios para guardar.')
 
@@ -510,22 +568,31 @@ def configurar_periodos(request):
 
 @login_required
 @rol_requerido(['Administrador'])
-def historial_configuracion(request):
-    # Obtenemos el historial de todos los objetos PeriodoControl, ordenado por fecha
-    historial = PeriodoControl.history.all().order_by('-history_date')
-    
-    # --- LÓGICA AÑADIDA PARA CALCULAR CAMBIOS ---
-    for i in range(len(historial)):
-        version_actual = historial[i]
-        # Obtenemos el registro previo (si existe)
-        version_anterior = version_actual.prev_record
-        if version_anterior:
-            delta = version_actual.diff_against(version_anterior)
-            version_actual.cambios_calculados = delta.changes
+def estado_tarea_recalculo(request, tarea_id):
+    tarea = get_object_or_404(TareaRecalculo, pk=tarea_id)
+    contexto = {'tarea': tarea}
+    return render(request, 'control/config/estado_tarea_recalculo.html', contexto)
 
-    contexto = {
-        'historial': historial
-    }
+@login_required
+@rol_requerido(['Administrador'])
+def estado_tarea_recalculo_json(request, tarea_id):
+    # Endpoint que consulta la página de estado para ir actualizando el avance
+    tarea = get_object_or_404(TareaRecalculo, pk=tarea_id)
+    return JsonResponse({
+        'estado': tarea.estado,
+        'estado_display': tarea.get_estado_display(),
+        'progreso': tarea.progreso,
+        'filas_actualizadas': tarea.filas_actualizadas,
+        'filas_creadas': tarea.filas_creadas,
+        'mensaje_error': tarea.mensaje_error,
+        'finalizada': tarea.finalizada,
+    })
+
+@login_required
+@rol_requerido(['Administrador'])
+def historial_configuracion(request):
+    # Historial de todos los objetos PeriodoControl, del cambio más reciente al más antiguo
+    contexto = _pagina_historial(request, PeriodoControl.history.all())
     return render(request, 'control/config/historial_configuracion.html', contexto)
 
 
@@ -575,14 +642,13 @@ def registrar_vacuna(request, vacuna_aplicada_id):
 
 @login_required
 def ver_vacuna(request, vacuna_aplicada_id):
-    vacuna_aplicada = get_object_or_404(VacunaAplicada, pk=vacuna_aplicada_id)
+    # Verificación de seguridad para tutores, incluida en la consulta (404 si no es suya)
+    vacuna_aplicada = get_object_or_404(
+        VacunaAplicada.objects.visible_to(request.conidi_access).select_related('nino', 'vacuna', 'profesional__usuario'),
+        pk=vacuna_aplicada_id,
+    )
     nino = vacuna_aplicada.nino
 
-    # Verificación de seguridad para tutores
-    if request.user.rol.nombre_rol.lower() == 'tutor':
-        if not request.user.perfil_tutor.ninos.filter(pk=nino.pk).exists():
-            raise PermissionDenied
-
     contexto = {
         'vacuna_aplicada': vacuna_aplicada,
         'nino': nino
@@ -638,16 +704,9 @@ def historial_vacuna(request, vacuna_aplicada_id):
     vacuna_aplicada = get_object_or_404(VacunaAplicada, pk=vacuna_aplicada_id)
 
     # Obtenemos el historial usando la misma lógica que en los controles
-    historial = vacuna_aplicada.history.all()
-    for i in range(len(historial) - 1):
-        version_actual = historial[i]
-        version_anterior = historial[i+1]
-        delta = version_actual.diff_against(version_anterior)
-        version_actual.cambios_calculados = delta.changes
-
     contexto = {
         'vacuna_aplicada': vacuna_aplicada,
-        'historial': historial
+        **_pagina_historial(request, vacuna_aplicada.history.all(), vacuna_aplicada.pk),
     }
     return render(request, 'control/vacuna/historial_vacuna.html', contexto)
 
@@ -658,36 +717,57 @@ def configurar_vacunas(request):
         action = request.POST.get('action')
 
         if action == 'update':
-            vacunas = Vacuna.objects.all()
-            for vacuna in vacunas:
-                nuevo_nombre = request.POST.get(f'nombre_vacuna_{vacuna.id}')
-                nuevo_mes = request.POST.get(f'meses_programada_{vacuna.id}')
-
-                # Convertimos el mes a entero o None si está vacío
-                if nuevo_mes:
-                    nuevo_mes = int(nuevo_mes)
-                else:
-                    nuevo_mes = None
-                
-                # Guardamos solo si hay cambios
-                if (vacuna.nom_vacuna != nuevo_nombre or vacuna.meses_programada != nuevo_mes):
-                    vacuna.nom_vacuna = nuevo_nombre
-                    vacuna.meses_programada = nuevo_mes
-                    vacuna.save()
-            
+            vacunas = list(Vacuna.objects.all())
+            meses_anteriores = {vacuna.id: vacuna.meses_programada for vacuna in vacunas}
+
+            # Se valida todo el formulario y se guardan solo las filas que cambiaron, en bloque.
+            modificadas, campos, errores = leer_formulario(
+                vacunas, request.POST,
+                [
+                    ('nom_vacuna', 'nombre_vacuna_{id}', texto_obligatorio),
+                    ('meses_programada', 'meses_programada_{id}', entero_opcional),
+                ],
+            )
+            if errores:
+                for error in errores:
+                    messages.error(request, error)
+                messages.warning(request, 'No se guardaron cambios. Corrige los valores indicados.')
+                return redirect('control:configurar_vacunas')
+
+            # Solo las que cambiaron de mes necesitan recalcularse
+            vacunas_modificadas = [
+                vacuna.id for vacuna in modificadas if vacuna.meses_programada != meses_anteriores[vacuna.id]
+            ]
+
+            # Las fechas de las dosis pendientes se recalculan en segundo plano ('run_scheduler').
+            # El cambio y su tarea de recálculo se guardan en la misma transacción.
+            with transaction.atomic():
+                guardar_en_bloque(Vacuna, modificadas, campos, usuario=request.user)
+                tarea = encolar_recalculo_vacunas(vacunas_modificadas, usuario=request.user) if vacunas_modificadas else None
+            if tarea:
+                messages.success(request, 'La configuración de vacunas ha sido actualizada. El recálculo del calendario se está ejecutando en segundo plano.')
+                return redirect('control:estado_tarea_recalculo', tarea_id=tarea.id)
             messages.success(request, 'La configuración de vacunas ha sido actualizada.')
-            # Aquí podríamos llamar a un futuro 'recalcular_vacunas'
 
         elif action == 'create':
             nuevo_nombre = request.POST.get('nuevo_nombre')
             nuevo_mes = request.POST.get('nuevo_mes')
 
             if nuevo_nombre and nuevo_mes:
-                Vacuna.objects.create(
-                    nom_vacuna=nuevo_nombre,
-                    meses_programada=int(nuevo_mes)
-                )
-                messages.success(request, f'Nueva vacuna "{nuevo_nombre}" agregada.')
+                try:
+                    meses_programada = entero(nuevo_mes)
+                except ValueError as error:
+                    messages.error(request, f'Mes programado: {error}.')
+                    return redirect('control:configurar_vacunas')
+                with transaction.atomic():
+                    vacuna = Vacuna.objects.create(
+                        nom_vacuna=nuevo_nombre,
+                        meses_programada=meses_programada
+                    )
+                    # Los niños ya registrados reciben la nueva dosis en segundo plano.
+                    tarea = encolar_recalculo_vacunas([vacuna.id], usuario=request.user)
+                messages.success(request, f'Nueva vacuna "{nuevo_nombre}" agregada. Su calendario se está generando en segundo plano.')
+                return redirect('control:estado_tarea_recalculo', tarea_id=tarea.id)
 
         return redirect('control:configurar_vacunas')
 
@@ -699,20 +779,8 @@ def configurar_vacunas(request):
 @login_required
 @rol_requerido(['Administrador'])
 def historial_vacunas(request):
-    # Obtenemos el historial de todos los objetos Vacuna
-    historial = Vacuna.history.all().order_by('-history_date')
-
-    # Calculamos los cambios entre versiones
-    for i in range(len(historial)):
-        version_actual = historial[i]
-        version_anterior = version_actual.prev_record
-        if version_anterior:
-            delta = version_actual.diff_against(version_anterior)
-            version_actual.cambios_calculados = delta.changes
-
-    contexto = {
-        'historial': historial
-    }
+    # Historial de todos los objetos Vacuna, con los cambios entre versiones ya calculados
+    contexto = _pagina_historial(request, Vacuna.history.all())
     return render(request, 'control/config/historial_configuracion_vacunas.html', contexto)
 
 # control/views.py
@@ -811,16 +879,9 @@ def historial_alergia(request, registro_alergia_id):
     registro = get_object_or_404(RegistroAlergias, pk=registro_alergia_id)
 
     # Obtenemos el historial usando la misma lógica que en los otros modelos
-    historial = registro.history.all()
-    for i in range(len(historial) - 1):
-        version_actual = historial[i]
-        version_anterior = historial[i+1]
-        delta = version_actual.diff_against(version_anterior)
-        version_actual.cambios_calculados = delta.changes
-
     contexto = {
         'registro': registro,
-        'historial': historial
+        **_pagina_historial(request, registro.history.all(), registro.pk),
     }
     return render(request, 'control/alergia/historial_alergia.html', contexto)
 
@@ -830,22 +891,26 @@ def configurar_categorias_alergia(request):
     if request.method == 'POST':
         action = request.POST.get('action')
 
-        # Bandera para saber si se realizó alguna acción exitosa
-        accion_exitosa = False
-
         if action == 'update':
-            for categoria in CategoriaAlergia.objects.all():
-                nuevo_nombre = request.POST.get(f'nombre_categoria_{categoria.id}')
-                if nuevo_nombre and categoria.nombre != nuevo_nombre:
-                    # Verificamos si el nuevo nombre ya existe
-                    if CategoriaAlergia.objects.filter(nombre=nuevo_nombre).exclude(pk=categoria.id).exists():
-                        messages.error(request, f'Ya existe una categoría llamada "{nuevo_nombre}".')
-                    else:
-                        categoria.nombre = nuevo_nombre
-                        categoria.save()
-                        accion_exitosa = True
-            if accion_exitosa:
-                messages.success(request, 'La lista de categorías ha sido actualizada.')
+            categorias = list(CategoriaAlergia.objects.all())
+            modificadas, campos, errores = leer_formulario(
+                categorias, request.POST, [('nombre', 'nombre_categoria_{id}', texto_obligatorio)],
+            )
+            # La unicidad se revisa en memoria: la tabla completa ya está cargada.
+            for nombre in valores_repetidos(categorias, 'nombre'):
+                errores.append(f'Ya existe una categoría llamada "{nombre}".')
+
+            if errores:
+                for error in errores:
+                    messages.error(request, error)
+                messages.warning(request, 'No se guardaron cambios. Corrige los valores indicados.')
+            else:
+                try:
+                    if guardar_en_bloque(CategoriaAlergia, modificadas, campos, usuario=request.user):
+                        messages.success(request, 'La lista de categorías ha sido actualizada.')
+                except IntegrityError:
+                    # Otra persona creó a la vez una categoría con uno de los nombres nuevos.
+                    messages.error(request, 'Uno de los nombres ya está en uso. No se guardaron cambios.')
 
         elif action == 'create':
             nuevo_nombre = request.POST.get('nuevo_nombre')
@@ -882,106 +947,82 @@ def configurar_categorias_alergia(request):
 @login_required
 @rol_requerido(['Administrador'])
 def historial_categorias_alergia(request): # <-- Asegúrate que la función tenga este nombre
-    historial = CategoriaAlergia.history.all().order_by('-history_date')
-    
-    for i in range(len(historial)):
-        version_actual = historial[i]
-        version_anterior = version_actual.prev_record
-        if version_anterior:
-            delta = version_actual.diff_against(version_anterior)
-            version_actual.cambios_calculados = delta.changes
-
-    contexto = {
-        'historial': historial
-    }
+    contexto = _pagina_historial(request, CategoriaAlergia.history.all())
     return render(request, 'control/config/historial_categorias_alergia.html', contexto)
 
-def _enviar_reporte_atrasados_async(destinatarios, controles_atrasados):
-    """
-    Función que se ejecuta en un hilo separado para enviar el correo electrónico.
-    Esto evita que la vista principal se bloquee esperando la respuesta del servidor de correo.
-    """
-    try:
-        today = date.today()
-        fecha_reporte_str = today.strftime("%d/%m/%Y")
-        asunto = f'Reporte de Controles Atrasados - {fecha_reporte_str}'
-
-        # --- 1. Preparar datos para el Excel ---
-        datos_excel = []
-        for control in controles_atrasados:
-            nino = control.nino
-            relacion_tutor = nino.ninotutor_set.select_related('tutor').first()
-            
-            datos_fila = {
-                'RUT Niño': nino.rut_nino,
-                'Nombre Niño': f"{nino.nombre} {nino.ap_paterno} {nino.ap_materno}".strip(),
-                'Control Atrasado': control.nombre_control,
-                'Fecha Programada': control.fecha_control_programada.strftime("%d-%m-%Y"),
-                'Nombre Tutor': relacion_tutor.tutor.nombre_completo if relacion_tutor else 'No asignado',
-                'Parentesco': relacion_tutor.get_parentesco_display() if relacion_tutor else 'N/A',
-                'Email Tutor': relacion_tutor.tutor.email if relacion_tutor and relacion_tutor.tutor.email else 'No disponible',
-                'Teléfono Tutor': relacion_tutor.tutor.telefono if relacion_tutor and relacion_tutor.tutor.telefono else 'No disponible',
-            }
-            datos_excel.append(datos_fila)
-
-        # --- 2. Crear el archivo Excel en memoria con columnas autoajustadas ---
-        df = pd.DataFrame(datos_excel)
-        excel_buffer = io.BytesIO()
-
-        # Usamos ExcelWriter para tener más control sobre el archivo y poder ajustar las columnas
-        with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Controles Atrasados')
-
-            # Obtenemos la hoja de trabajo (worksheet) de openpyxl para manipularla
-            worksheet = writer.sheets['Controles Atrasados']
-
-            # Iteramos sobre cada columna para ajustar su ancho al contenido más largo
-            for column_cells in worksheet.columns:
-                max_length = 0
-                column_letter = column_cells[0].column_letter  # Obtener la letra de la columna (A, B, C...)
-                for cell in column_cells:
-                    try:
-                        # Buscamos la longitud del valor más largo en la columna
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = (max_length + 2)  # Añadimos un pequeño margen para que no quede apretado
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-        
-        # CORRECCIÓN: Rebobinamos el buffer al inicio después de escribir en él.
-        excel_buffer.seek(0)
-
-        # --- 3. Construir el correo y adjuntar el archivo ---
-        # Renderizamos el cuerpo del correo desde una plantilla HTML
-        mensaje_html = render_to_string('control/reportes_mail/email_reporte_atrasados.html', {
-            'controles_atrasados': controles_atrasados,
-            'fecha_reporte': fecha_reporte_str,
-        })
-
-        # Usamos EmailMultiAlternatives para poder adjuntar archivos
-        email = EmailMultiAlternatives(
-            subject=asunto,
-            body="Este es un correo HTML. Si no puede verlo, por favor active la vista HTML en su cliente de correo.",
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=destinatarios
-        )
-        email.attach_alternative(mensaje_html, "text/html")
-
-        # Adjuntamos el archivo Excel
-        nombre_archivo = f'Reporte_Atrasados_{today.strftime("%Y-%m-%d")}.xlsx'
-        email.attach(
-            nombre_archivo,
-            excel_buffer.read(),
-            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-
-        email.send()
-        print(f"Reporte en segundo plano enviado exitosamente a: {', '.join(destinatarios)}")
-
-    except Exception as e:
-        # En un sistema de producción, aquí se debería registrar el error en un log
-        print(f"Error al enviar el reporte en segundo plano: {e}")
+
+@login_required
+@rol_requerido(['Administrador'])
+def importar_ninos(request):
+    # Carga masiva desde CSV/Excel. Para archivos muy grandes conviene el comando 'importar_ninos'.
+    contexto = {}
+    if request.method == 'POST':
+        archivo = request.FILES.get('archivo')
+        simular = request.POST.get('simular') == 'on'
+        if not archivo:
+            messages.error(request, 'Debes seleccionar un archivo CSV o Excel.')
+        else:
+            try:
+                resultado = importar_archivo_ninos(archivo.file, archivo.name, simular=simular)
+            except ArchivoInvalido as e:
+                messages.error(request, str(e))
+            else:
+                limite = settings.IMPORTACION_ERRORES_EN_PANTALLA
+                contexto.update({
+                    'resultado': resultado,
+                    'simular': simular,
+                    'nombre_archivo': archivo.name,
+                    'errores': resultado.errores[:limite],
+                    'errores_ocultos': max(len(resultado.errores) - limite, 0),
+                })
+                if simular:
+                    messages.info(request, f'Validación terminada: {resultado.filas_importadas} de {resultado.filas} filas se pueden importar.')
+                else:
+                    messages.success(request, f'Importación terminada: {resultado.filas_importadas} de {resultado.filas} filas importadas.')
+    contexto['columnas'] = COLUMNAS_IMPORTACION
+    return render(request, 'control/nino/importar_ninos.html', contexto)
+
+
+@login_required
+@rol_requerido(['Administrador'])
+def exportar_datos(request):
+    # Sin 'tabla' muestra el formulario; con 'tabla' descarga el archivo sin cargarlo en memoria.
+    nombre = request.GET.get('tabla')
+    if nombre in EXPORTACIONES:
+        formato = request.GET.get('formato', 'csv')
+        if formato not in FORMATOS:
+            return HttpResponseBadRequest(f'Formato desconocido: "{formato}". Use: {", ".join(FORMATOS)}.')
+        desde = None
+        try:
+            if request.GET.get('desde'):
+                desde = interpretar_desde(request.GET['desde'])
+            if formato == 'parquet':
+                # Parquet escribe su pie al final: se arma en un temporal (en disco) y se envía desde ahí.
+                # Eso ocurre dentro de la petición, así que solo se permite hasta cierto tamaño.
+                limite = settings.EXPORTACION_PARQUET_MAX_FILAS
+                if EXPORTACIONES[nombre].supera(limite, desde):
+                    raise ValueError(
+                        f'La exportación a Parquet desde la web admite hasta {limite} filas. '
+                        'Descargue el CSV o use el comando exportar_datos.'
+                    )
+                archivo = tempfile.TemporaryFile()
+                try:
+                    escribir_parquet(EXPORTACIONES[nombre], archivo, desde)
+                except Exception:
+                    archivo.close()
+                    raise
+                archivo.seek(0)
+                return FileResponse(archivo, as_attachment=True, filename=f'{nombre}.parquet')
+            respuesta = StreamingHttpResponse(trozos_csv(EXPORTACIONES[nombre], desde), content_type='text/csv; charset=utf-8')
+            respuesta['Content-Disposition'] = f'attachment; filename="{nombre}.csv"'
+            return respuesta
+        except (ValueError, ExportacionNoDisponible) as e:
+            messages.error(request, str(e))
+
+    return render(request, 'control/config/exportar_datos.html', {
+        'tablas': list(EXPORTACIONES),
+        'parquet_disponible': parquet_disponible(),
+    })
 
 @login_required
 @rol_requerido(['Administrador'])
@@ -1029,36 +1070,23 @@ def reportes(request):
                 messages.error(request, 'No se puede enviar el reporte porque no hay un profesional encargado asignado.')
                 return redirect('control:reportes')
 
-            # Buscamos los niños con controles atrasados para el REPORTE A PROFESIONALES.
-            # Esta lógica es independiente de las notificaciones a tutores (campo 'notificacion_enviada').
-            # Un control se reporta aquí si está atrasado, sin importar si el tutor ya fue notificado.
-            controles_atrasados = Control.objects.filter(
-                fecha_realizacion_control__isnull=True,
-                deshabilitado=False,
-                fecha_control_programada__lt=date.today() - timedelta(days=7) # Atrasados por más de 7 días
-            ).select_related('nino').order_by('nino__ap_paterno', 'nino__nombre')
-
+            # El reporte (a PROFESIONALES) es independiente de las notificaciones a tutores
+            # (campo 'notificacion_enviada'): incluye los controles atrasados por más de 7 días,
+            # sin importar si el tutor ya fue notificado. Se genera en el pool acotado de
+            # control/reportes.py, que además evita duplicar un reporte que ya está en curso.
             destinatarios = [enc.email for enc in encargados_actuales]
+            historial, creado = solicitar_reporte_atrasados(destinatarios, usuario=request.user)
 
-            # EJECUCIÓN EN SEGUNDO PLANO DE ENVIO DE CORREO SOBRE REPORTES ATRASADOS
-            thread = threading.Thread(
-                target=_enviar_reporte_atrasados_async,
-                args=(destinatarios, controles_atrasados)
-            )
-            thread.start()
-            
-            # --- GUARDAR EN EL HISTORIAL ---
-            HistorialEnvioReporte.objects.create(
-                enviado_por=request.user,
-                destinatarios=", ".join(destinatarios),
-                controles_reportados_count=len(controles_atrasados)
-            )
-            # --------------------------------
-
-            messages.info(
-                request, 
-                f'El envío del reporte a {len(destinatarios)} encargado(s) ha comenzado en segundo plano. Recibirán el correo en breve.'
-            )
+            if creado:
+                messages.info(
+                    request, 
+                    f'El envío del reporte a {len(destinatarios)} encargado(s) ha comenzado en segundo plano. Recibirán el correo en breve.'
+                )
+            else:
+                messages.warning(
+                    request,
+                    'Ya hay un reporte de hoy en preparación para estos mismos encargados. Puedes revisar su estado en el historial.'
+                )
             
             return redirect('control:reportes')
 
@@ -1071,7 +1099,12 @@ def reportes(request):
 @login_required
 @rol_requerido(['Administrador'])
 def historial_envio_reportes(request):
-    historial = HistorialEnvioReporte.objects.select_related('enviado_por').all().order_by('-fecha_envio')
+    # Del correo solo se muestra su estado: no se traen el HTML ni los adjuntos.
+    historial = (
+        HistorialEnvioReporte.objects.select_related('enviado_por', 'correo')
+        .defer('correo__cuerpo', 'correo__cuerpo_html', 'correo__adjuntos')
+        .order_by('-fecha_envio')
+    )
     contexto = {
         'historial': historial
     }
@@ -1080,5 +1113,119 @@ def historial_envio_reportes(request):
 @login_required
 @rol_requerido(['Administrador', 'Profesional']) 
 def dashboard_bi(request):
+    # Solo se entregan las opciones de los filtros; los gráficos piden sus datos a los endpoints JSON.
+    hoy = date.today()
+    anios = sorted(
+        {fecha.year for fecha in Control.objects.filter(fecha_control_programada__lte=hoy).dates('fecha_control_programada', 'year')}
+        | {hoy.year},
+        reverse=True,
+    )
+    sectores = list(
+        Nino.objects.exclude(sector__isnull=True).exclude(sector='')
+        .order_by('sector').values_list('sector', flat=True).distinct()
+    )
+    contexto = {
+        'anios': anios,
+        'anio_actual': hoy.year,
+        'sectores': sectores,
+        'sin_sector': bi.SIN_SECTOR,
+        'grupos_etarios': [(clave, datos[0]) for clave, datos in bi.GRUPOS_ETARIOS.items()],
+        'vacunas': Vacuna.objects.order_by('nom_vacuna'),
+    }
+    return render(request, 'control/dashboard_bi.html', contexto)
+
+
+class _FiltroBIInvalido(Exception):
+    pass
+
+
+def _parametro_entero(request, nombre, por_defecto=None, minimo=2000, maximo=2100):
+    valor = request.GET.get(nombre)
+    if valor in (None, ''):
+        return por_defecto
+    try:
+        valor = int(valor)
+    except ValueError:
+        raise _FiltroBIInvalido(f"El parámetro '{nombre}' debe ser un número entero.")
+    if not minimo <= valor <= maximo:
+        raise _FiltroBIInvalido(f"El parámetro '{nombre}' está fuera de rango.")
+    return valor
+
+
+def _parametro_sector(request):
+    sector = request.GET.get('sector') or None
+    if sector and sector != bi.SIN_SECTOR and len(sector) > Nino._meta.get_field('sector').max_length:
+        raise _FiltroBIInvalido("El parámetro 'sector' no es válido.")
+    return sector
+
 
-    return render(request, 'control/dashboard_bi.html')
\ No newline at end of file
+def _endpoint_bi(vista):
+    # Traduce los filtros inválidos en una respuesta 400 con el mensaje en JSON.
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        try:
+            return vista(request, *args, **kwargs)
+        except _FiltroBIInvalido as e:
+            return JsonResponse({'error': str(e)}, status=400)
+    return envoltura
+
+
+@login_required
+@rol_requerido(['Administrador', 'Profesional'])
+@_endpoint_bi
+def dashboard_bi_adherencia(request):
+    anio = _parametro_entero(request, 'anio', date.today().year)
+    anio_comparacion = _parametro_entero(request, 'anio_comparacion', anio - 1)
+    sector = _parametro_sector(request)
+
+    series = bi.adherencia_mensual(sorted({anio, anio_comparacion}), sector=sector)
+    return JsonResponse({
+        'meses': bi.MESES,
+        'anio': anio,
+        'anio_comparacion': anio_comparacion,
+        'actual': series[anio],
+        'comparacion': series[anio_comparacion],
+        'resumen': bi.resumen_adherencia(series, anio, anio_comparacion),
+    })
+
+
+@login_required
+@rol_requerido(['Administrador', 'Profesional'])
+@_endpoint_bi
+def dashboard_bi_nutricional(request):
+    anio = _parametro_entero(request, 'anio', date.today().year)
+    grupo_etario = request.GET.get('grupo_etario') or None
+    if grupo_etario and grupo_etario not in bi.GRUPOS_ETARIOS:
+        raise _FiltroBIInvalido("El parámetro 'grupo_etario' no es válido.")
+    sector = _parametro_sector(request)
+
+    anios = [anio - 2, anio - 1, anio]
+    categorias, series, totales = bi.distribucion_nutricional(anios, grupo_etario=grupo_etario, sector=sector)
+    return JsonResponse({
+        'anios': anios,
+        'categorias': categorias,
+        'series': [
+            {'categoria': categoria, 'valores': [series[a][i] for a in anios]}
+            for i, categoria in enumerate(categorias)
+        ],
+        'totales': [totales[a] for a in anios],
+        'resumen': bi.resumen_nutricional(categorias, series, totales),
+    })
+
+
+@login_required
+@rol_requerido(['Administrador', 'Profesional'])
+@_endpoint_bi
+def dashboard_bi_vacunacion(request):
+    anio = _parametro_entero(request, 'anio', date.today().year)
+    vacuna_id = _parametro_entero(request, 'vacuna', minimo=1, maximo=2**31 - 1)
+    if vacuna_id and not Vacuna.objects.filter(pk=vacuna_id).exists():
+        raise _FiltroBIInvalido("La vacuna indicada no existe.")
+
+    sectores = bi.cobertura_vacunacion_por_sector(anio, vacuna_id=vacuna_id)
+    return JsonResponse({
+        'anio': anio,
+        'meta': bi.META_COBERTURA,
+        'sectores': sectores,
+        'resumen': bi.resumen_vacunacion(sectores),
+    })
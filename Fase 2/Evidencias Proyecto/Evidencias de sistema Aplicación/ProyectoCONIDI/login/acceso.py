@@ -0,0 +1,31 @@
+# login/acceso.py
+
+
+class AccesoConidi:
+    """
+    Rol y alcance del usuario de la petición (request.conidi_access).
+
+    El rol viene del usuario ya cargado por UsuarioBackend, sin consultas extra. Qué
+    registros puede ver se resuelve en la misma consulta que los trae, con
+    Modelo.objects.visible_to(request.conidi_access) (control/models.py).
+    """
+
+    def __init__(self, user):
+        self.user = user
+        rol = getattr(user, 'rol', None) if user.is_authenticated else None
+        self.rol = rol.nombre_rol.lower() if rol else None
+
+    @property
+    def es_administrador(self):
+        return self.rol == 'administrador'
+
+    @property
+    def es_profesional(self):
+        return self.rol == 'profesional'
+
+    @property
+    def es_tutor(self):
+        return self.rol == 'tutor'
+
+    def tiene_rol(self, roles):
+        return self.rol is not None and self.rol in [r.lower() for r in roles]
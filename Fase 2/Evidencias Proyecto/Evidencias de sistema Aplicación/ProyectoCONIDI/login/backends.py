@@ -0,0 +1,20 @@
+# login/backends.py
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+class UsuarioBackend(ModelBackend):
+    """
+    Igual que ModelBackend, pero al recuperar el usuario de la sesión trae en la misma
+    consulta su rol y sus perfiles de profesional y tutor, que usan casi todas las vistas.
+    """
+
+    def get_user(self, user_id):
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related(
+                'rol', 'perfil_profesional', 'perfil_tutor'
+            ).get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
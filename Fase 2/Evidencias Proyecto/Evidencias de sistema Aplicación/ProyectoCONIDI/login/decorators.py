@@ -2,6 +2,8 @@
 from django.shortcuts import redirect, render
 from functools import wraps
 
+from .acceso import AccesoConidi
+
 def rol_requerido(roles_permitidos=[]):
     def decorator(view_func):
         @wraps(view_func)
@@ -9,14 +11,9 @@ def rol_requerido(roles_permitidos=[]):
             if not request.user.is_authenticated:
                 return redirect('login')
 
-            # --- LA LÍNEA CLAVE QUE CAMBIÓ ---
-            # Ahora accedemos a través del nuevo campo 'rol' y su atributo 'nombre_rol'
-            user_role = request.user.rol.nombre_rol if hasattr(request.user, 'rol') else None
-            
-            # Convertimos a minúsculas para una comparación sin errores
-            roles_permitidos_lower = [r.lower() for r in roles_permitidos]
-
-            if not user_role or user_role.lower() not in roles_permitidos_lower:
+            # El rol sale de request.conidi_access (AccesoConidiMiddleware), sin consultas extra
+            acceso = getattr(request, 'conidi_access', None) or AccesoConidi(request.user)
+            if not acceso.tiene_rol(roles_permitidos):
                 return render(request, '403.html', status=403)
 
             return view_func(request, *args, **kwargs)
@@ -0,0 +1,15 @@
+# login/middleware.py
+from django.utils.functional import SimpleLazyObject
+
+from .acceso import AccesoConidi
+
+
+class AccesoConidiMiddleware:
+    """Agrega request.conidi_access. Debe ir después de AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.conidi_access = SimpleLazyObject(lambda: AccesoConidi(request.user))
+        return self.get_response(request)
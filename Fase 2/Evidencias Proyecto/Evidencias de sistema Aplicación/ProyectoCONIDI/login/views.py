@@ -42,7 +42,7 @@ def login_user(request):
 @clave_no_temporal
 @rol_requerido(['Administrador', 'Profesional'])
 def crear_usuario(request):
-    current_user_rol = request.user.rol.nombre_rol.lower()
+    current_user_rol = request.conidi_access.rol
     
     contexto = {
         'roles_para_crear': Rol.objects.none(),
@@ -227,7 +227,7 @@ def cambiar_clave_temporal(request):
 #@rol_requerido(['Administrador']) 
 def listar_usuarios(request):
     user = request.user
-    rol_usuario_actual = user.rol.nombre_rol.lower()
+    rol_usuario_actual = request.conidi_access.rol
 
     # --- NUEVO: Capturamos los datos del formulario de filtros ---
     nombre_query = request.GET.get('nombre', '')
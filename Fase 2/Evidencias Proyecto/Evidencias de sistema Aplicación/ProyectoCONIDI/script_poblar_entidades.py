@@ -9,7 +9,11 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'conidi.settings')
 django.setup()
 
 # --- IMPORTACIONES ---
+from django.db import transaction
+from simple_history.utils import bulk_create_with_history
 from control.models import Region, Ciudad, Comuna, Nino
+from control.calendario import generar_calendarios
+from control.busqueda import motor_busqueda
 from login.models import Tutor, NinoTutor
 
 # --- Inicializar Faker (en español chileno) ---
@@ -69,12 +73,18 @@ print(f"-> {len(tutores_creados)} perfiles de tutores asegurados.")
 
 # --- 3. Crear 100 Niños de ejemplo (0 a 12 años) ---
 print("\nGenerando 100 perfiles de Niños...")
-ninos_creados = []
 parentescos_posibles = [choice[0] for choice in NinoTutor.PARENTESCO_CHOICES]
 sectores_disponibles = ['Sector Azul', 'Sector Verde', 'Sector Rojo', 'Sector Amarillo']
 
+ruts_existentes = set(Nino.objects.values_list('rut_nino', flat=True))
+ninos_a_crear = []
+relaciones_a_crear = []
+
 for i in range(100):
     rut_nino = generar_rut_fake()
+    if rut_nino in ruts_existentes:
+        continue
+    ruts_existentes.add(rut_nino)
     # Rango de edad de 0 a 12 años (144 meses)
     fecha_nacimiento_nino = date.today() - timedelta(days=random.randint(10, 365 * 12))
     sexo_nino = random.choice(['Masculino', 'Femenino'])
@@ -84,31 +94,40 @@ for i in range(100):
     else:
         nombre_nino = fake.first_name_female()
     
-    nino_data = {
-        'nombre': nombre_nino,
-        'ap_paterno': fake.last_name(),
-        'ap_materno': fake.last_name(),
-        'fecha_nacimiento': fecha_nacimiento_nino,
-        'sexo': sexo_nino,
-        'direccion': fake.address(),
-        'comuna': comuna_obj,
-        'sector': random.choice(sectores_disponibles), # Asigna un sector aleatorio
-        'estado_seguimiento': 'ACTIVO' # Por defecto activos
-    }
-    
-    nino_obj, created = Nino.objects.get_or_create(rut_nino=rut_nino, defaults=nino_data)
-    
-    if created:
-        ninos_creados.append(nino_obj)
-        # --- 4. Relacionar al Niño con un Tutor aleatorio ---
-        tutor_aleatorio = random.choice(tutores_creados)
-        parentesco_aleatorio = random.choice(parentescos_posibles)
-        
-        relacion, created_rel = NinoTutor.objects.get_or_create(
+    nino_obj = Nino(
+        rut_nino=rut_nino,
+        nombre=nombre_nino,
+        ap_paterno=fake.last_name(),
+        ap_materno=fake.last_name(),
+        fecha_nacimiento=fecha_nacimiento_nino,
+        sexo=sexo_nino,
+        direccion=fake.address(),
+        comuna=comuna_obj,
+        sector=random.choice(sectores_disponibles), # Asigna un sector aleatorio
+        estado_seguimiento='ACTIVO' # Por defecto activos
+    )
+    # bulk_create no llama a save(), así que normalizamos a mano
+    nino_obj.normalizar_campos()
+    ninos_a_crear.append(nino_obj)
+
+    # --- 4. Relacionar al Niño con un Tutor aleatorio ---
+    relaciones_a_crear.append(
+        NinoTutor(
             nino=nino_obj,
-            tutor=tutor_aleatorio,
-            defaults={'parentesco': parentesco_aleatorio}
+            tutor=random.choice(tutores_creados),
+            parentesco=random.choice(parentescos_posibles)
         )
+    )
+
+# Insertamos todo en bloque: las señales post_save no se disparan con bulk_create,
+# así que los calendarios se generan de una vez con el servicio de calendario
+# y los niños se agregan a mano al índice de búsqueda por nombre.
+with transaction.atomic():
+    ninos_creados = bulk_create_with_history(ninos_a_crear, Nino)
+    NinoTutor.objects.bulk_create(relaciones_a_crear)
+    controles_creados, vacunas_creadas = generar_calendarios(ninos_creados)
+    motor_busqueda().indexar(ninos_creados)
 
+print(f"-> Calendarios generados: {controles_creados} controles y {vacunas_creadas} vacunas.")
 print(f"-> {len(ninos_creados)} niños nuevos creados y relacionados.")
 print("\n¡Población de entidades de ejemplo completada!")
\ No newline at end of file